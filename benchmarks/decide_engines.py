@@ -0,0 +1,79 @@
+# Times PhotoMachine.decide() with the per-destination loop against vectordecide.  Whether they agree is down to
+# tests/test_decide_engines.py
+# Usage: python -m benchmarks.decide_engines [count] [seed]
+import random
+import sys
+import tempfile
+import time
+from photo_organiser import imagefile
+from photo_organiser import statemachine
+from photo_organiser import vectordecide
+
+
+class PresetHashImageFile(imagefile.ImageFile):
+    # hashes come out of a dict instead of off a disk
+    preset_hashes = {}
+
+    def get_hash(self, cache=None, algorithm=None) -> str:
+        self.file_hash = PresetHashImageFile.preset_hashes[self.source_fullpath]
+        return self.file_hash
+
+
+def make_images(destination_root: str, count: int, seed: int) -> list:
+    # about four files per name spread over lots of folders, so most destinations have several contenders.  Sizes,
+    # dates and hashes are picked from small sets so plenty of comparisons get all the way down to the hash
+    rng = random.Random(seed)
+    names = max(1, count // 4)
+    images = []
+    for i in range(count):
+        name = f"IMG_{rng.randrange(names):06d}.JPG"
+        if rng.random() < 0.1:
+            source_fullpath = f"{destination_root}/2019/05/{name}"
+        else:
+            source_fullpath = f"e:/photos/camera {i % 20}/batch {i}/{name}"
+        metadata = {
+            "SourceFile": source_fullpath,
+            "File:MIMEType": "image/jpeg",
+            "File:FileSize": rng.choice([1_000_000, 1_000_000, 2_000_000]),
+            "File:FileModifyDate": "2019:05:30 10:11:12+10:00",
+            "EXIF:DateTimeOriginal": f"2019:05:{rng.randint(1, 3):02d} 09:08:07",
+        }
+        PresetHashImageFile.preset_hashes[source_fullpath] = f"hash{rng.randrange(3)}"
+        images.append(PresetHashImageFile(source_fullpath, destination_root, metadata))
+    return images
+
+
+def run(engine: str, count: int, seed: int) -> tuple:
+    # returns (seconds, destinations)
+    with tempfile.TemporaryDirectory() as destination_root:
+        # nothing here runs exiftool, so the machine doesn't need a real pool
+        machine = statemachine.PhotoMachine(
+            destination_root, decide_engine=engine, exif_pool=object()
+        )
+        for the_image in make_images(destination_root, count, seed):
+            machine.candidates.add(the_image)
+
+        start = time.perf_counter()
+        machine.decide()
+        seconds = time.perf_counter() - start
+    return seconds, len(machine.candidates.destination_paths)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    if not vectordecide.available():
+        print("numpy isn't installed - nothing to compare the loop against")
+        sys.exit(1)
+
+    loop_seconds, destinations = run("loop", count, seed)
+    vector_seconds, destinations = run("vector", count, seed)
+
+    print(f"{count} files, {destinations} destinations")
+    print(f"{'loop':10}{loop_seconds:>10.3f}s")
+    print(f"{'vector':10}{vector_seconds:>10.3f}s")
+
+
+if __name__ == "__main__":
+    main()
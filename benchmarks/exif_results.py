@@ -0,0 +1,106 @@
+# Times getting ImageFiles from --exif process consumers back to the parent - one pickled ImageFile per queue put (the
+# old way) against a shared memory imagebatch.SharedBatch per batch - and fails if the parent ends up with different
+# ImageFiles.  What's timed is the parent's side, since that's the one loop everything else waits on
+# Usage: python -m benchmarks.exif_results [count] [consumers] [batch size]
+import multiprocessing
+import sys
+import time
+from photo_organiser import imagebatch
+from photo_organiser import imagefile
+from benchmarks.imagefile_memory import make_metadata
+
+DESTINATION_ROOT = "f:/archive"
+
+
+def produce(output_queue, metadata: list, batch_size: int, batched: bool) -> None:
+    # a stand-in ExifConsumer - the exiftool part is already done
+    for start in range(0, len(metadata), batch_size):
+        images = [
+            imagefile.ImageFile(d["SourceFile"], DESTINATION_ROOT, d)
+            for d in metadata[start : start + batch_size]
+        ]
+        if batched:
+            output_queue.put(imagebatch.SharedBatch(images))
+        else:
+            for the_image in images:
+                output_queue.put(the_image)
+    output_queue.put(None)
+
+
+def consume(metadata: list, consumers: int, batch_size: int, batched: bool) -> tuple:
+    # returns (seconds, every ImageFile the parent got, in the order they came off the queue)
+    output_queue = multiprocessing.JoinableQueue()
+    if batched:
+        imagebatch.prepare()
+    share = (len(metadata) + consumers - 1) // consumers
+    processes = [
+        multiprocessing.Process(
+            target=produce,
+            args=(
+                output_queue,
+                metadata[i * share : (i + 1) * share],
+                batch_size,
+                batched,
+            ),
+        )
+        for i in range(consumers)
+    ]
+
+    start = time.perf_counter()
+    for p in processes:
+        p.start()
+
+    images = []
+    finished = 0
+    while finished < consumers:
+        result = output_queue.get()
+        output_queue.task_done()
+        if result == None:
+            finished += 1
+        elif batched:
+            images.extend(result.take(DESTINATION_ROOT))
+        else:
+            images.append(result)
+    seconds = time.perf_counter() - start
+
+    for p in processes:
+        p.join()
+    return seconds, images
+
+
+def fields(the_image: imagefile.ImageFile) -> tuple:
+    return tuple(getattr(the_image, slot) for slot in the_image._pickled_slots)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    consumers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    batch_size = int(sys.argv[3]) if len(sys.argv) > 3 else 400
+
+    metadata = make_metadata(count)
+
+    one_seconds, one_images = consume(metadata, consumers, batch_size, False)
+    batch_seconds, batch_images = consume(metadata, consumers, batch_size, True)
+
+    print(
+        f"{count} files from {consumers} consumers in batches of {batch_size} - "
+        f"{imagebatch.RECORD.size} byte records plus the strings"
+    )
+    print(f"{'per file':12}{one_seconds:>10.3f}s{count / one_seconds:>12,.0f} files/s")
+    print(
+        f"{'batched':12}{batch_seconds:>10.3f}s{count / batch_seconds:>12,.0f} files/s"
+    )
+
+    # consumers finish in whatever order they finish, so compare by path
+    one_fields = sorted(fields(the_image) for the_image in one_images)
+    batch_fields = sorted(fields(the_image) for the_image in batch_images)
+    if one_fields != batch_fields:
+        print(
+            f"MISMATCH: {len(one_fields)} ImageFiles sent one at a time, {len(batch_fields)} batched"
+        )
+        sys.exit(1)
+    print("ImageFiles match")
+
+
+if __name__ == "__main__":
+    main()
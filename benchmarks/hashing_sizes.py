@@ -0,0 +1,107 @@
+# Times hashing.hash_file against the old 64KB read loop, hashlib.file_digest and mmap, for every algorithm --hash can
+# pick, over files from 64KB up to 256MB, and fails if any of them come up with a different hash
+# Usage: python -m benchmarks.hashing_sizes [folder] [largest MB]
+import hashlib
+import mmap
+import os
+import sys
+import tempfile
+import time
+from photo_organiser import hashing
+
+# what every hash went through before hash_file() - read() into a new bytes object 64KB at a time
+OLD_BLOCK_SIZE = 65536
+SIZES = [65536, 1048576, 16 * 1048576, 256 * 1048576]
+
+
+def old_loop(file_fullpath: str, algorithm: str) -> str:
+    file_hash = hashing.new_hash(algorithm)
+    with open(file_fullpath, "rb") as f:
+        block = f.read(OLD_BLOCK_SIZE)
+        while len(block) > 0:
+            file_hash.update(block)
+            block = f.read(OLD_BLOCK_SIZE)
+    return hashing.tagged(algorithm, file_hash.hexdigest())
+
+
+def file_digest(file_fullpath: str, algorithm: str) -> str:
+    # python 3.11+ - reads with its own 256KB buffer
+    with open(file_fullpath, "rb") as f:
+        file_hash = hashlib.file_digest(f, hashing.ALGORITHMS[algorithm])
+    return hashing.tagged(algorithm, file_hash.hexdigest())
+
+
+def mapped(file_fullpath: str, algorithm: str) -> str:
+    # no read() at all - the hash walks the page cache directly, a READ_SIZE slice at a time
+    file_hash = hashing.new_hash(algorithm)
+    with open(file_fullpath, "rb") as f:
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                view = memoryview(m)
+                for offset in range(0, len(m), hashing.READ_SIZE):
+                    file_hash.update(view[offset : offset + hashing.READ_SIZE])
+                view.release()
+    return hashing.tagged(algorithm, file_hash.hexdigest())
+
+
+METHODS = {
+    "64KB loop": old_loop,
+    "hash_file": hashing.hash_file,
+    "mmap": mapped,
+}
+if hasattr(hashlib, "file_digest"):
+    METHODS["file_digest"] = file_digest
+
+
+def time_method(method, file_fullpath: str, algorithm: str, total: int) -> tuple:
+    # hashes the file over and over until about total bytes have gone through, so small files get a fair timing.  The
+    # file is in the page cache after the first pass, so this is the CPU and copying cost, not the disk
+    size = os.path.getsize(file_fullpath)
+    rounds = max(1, total // max(size, 1))
+    method(file_fullpath, algorithm)
+    start = time.perf_counter()
+    for i in range(rounds):
+        result = method(file_fullpath, algorithm)
+    seconds = time.perf_counter() - start
+    return result, size * rounds / seconds / 1024 / 1024
+
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else None
+    largest = int(sys.argv[2]) * 1048576 if len(sys.argv) > 2 else SIZES[-1]
+    sizes = [size for size in SIZES if size <= largest]
+
+    with tempfile.TemporaryDirectory(dir=folder) as root:
+        print(
+            f"{'size':>8}  {'algorithm':10}"
+            + "".join(f"{method:>14}" for method in METHODS)
+        )
+        mismatches = 0
+        for size in sizes:
+            file_fullpath = os.path.join(root, f"{size}.bin")
+            with open(file_fullpath, "wb") as f:
+                f.write(os.urandom(size))
+
+            for algorithm in hashing.ALGORITHMS:
+                results = {}
+                line = f"{size // 1024:>6}KB  {algorithm:10}"
+                for name, method in METHODS.items():
+                    results[name], rate = time_method(
+                        method, file_fullpath, algorithm, max(size, 256 * 1048576)
+                    )
+                    line += f"{rate:>10.0f}MB/s"
+                print(line)
+
+                if len(set(results.values())) != 1:
+                    print(f"MISMATCH on {size} bytes with {algorithm}: {results}")
+                    mismatches += 1
+
+            os.remove(file_fullpath)
+
+    if mismatches > 0:
+        sys.exit(1)
+    print("hashes match")
+
+
+if __name__ == "__main__":
+    main()
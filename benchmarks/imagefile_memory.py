@@ -0,0 +1,127 @@
+# Memory per object, pickle size and construct/unpickle time for ImageFile, against the old dict-based version
+# Usage: python -m benchmarks.imagefile_memory [count]
+import datetime
+import pickle
+import sys
+import time
+import tracemalloc
+from photo_organiser import imagefile
+
+
+class LegacyImageFile:
+    # the pre-__slots__ ImageFile, trimmed down to what the constructor did - kept here purely as the "before" number
+    def __init__(self, source_fullpath, destination_root, metadata):
+        self.source_fullpath = source_fullpath
+        self.destination_root = destination_root
+        folder_separator = source_fullpath.rfind("/")
+        self.source_file_name = source_fullpath[(folder_separator + 1) :]
+        self.source_folder = source_fullpath[:folder_separator]
+        self.valid_media = True
+        if "File:FileCreateDate" in metadata.keys():
+            self.file_create = datetime.datetime.strptime(
+                metadata["File:FileCreateDate"], "%Y:%m:%d %H:%M:%S%z"
+            ).replace(tzinfo=None)
+        else:
+            self.file_create = datetime.datetime.strptime(
+                metadata["File:FileModifyDate"], "%Y:%m:%d %H:%M:%S%z"
+            ).replace(tzinfo=None)
+        self.file_modify = datetime.datetime.strptime(
+            metadata["File:FileModifyDate"], "%Y:%m:%d %H:%M:%S%z"
+        ).replace(tzinfo=None)
+        self.file_size = metadata["File:FileSize"]
+        self.tag_date = None
+        self.tagging_present = False
+        for tag in imagefile.DATE_TAGS:
+            if tag in metadata.keys():
+                self.tag_date = datetime.datetime.strptime(
+                    metadata[tag], "%Y:%m:%d %H:%M:%S"
+                )
+                self.tagging_present = True
+                break
+        if self.tag_date == None:
+            self.tag_date = self.file_modify
+        self.destination_date = self.tag_date
+        self.destination_year = self.destination_date.strftime("%Y")
+        self.destination_month = self.destination_date.strftime("%m")
+        self.destination_folder = (
+            self.destination_root
+            + "/"
+            + self.destination_year
+            + "/"
+            + self.destination_month
+        )
+        self.destination_fullpath = (
+            self.destination_folder + "/" + self.source_file_name
+        )
+        self.file_hash = None
+        self.winner = None
+        self.reason = None
+
+
+def make_metadata(count: int) -> list:
+    metadata = []
+    for i in range(count):
+        d = {
+            "SourceFile": f"e:/photos/2019 holiday/camera {i % 50}/IMG_{i:06d}.JPG",
+            "File:MIMEType": "image/jpeg",
+            "File:FileSize": 2_000_000 + i,
+            "File:FileModifyDate": f"2019:{i % 12 + 1:02d}:{i % 28 + 1:02d} 10:11:12+10:00",
+        }
+        if i % 4 != 0:
+            d["EXIF:DateTimeOriginal"] = (
+                f"2018:{i % 12 + 1:02d}:{i % 28 + 1:02d} 09:08:07"
+            )
+        metadata.append(d)
+    return metadata
+
+
+def measure(cls, metadata: list) -> dict:
+    # timed without tracemalloc running, since it slows allocation down a lot
+    start = time.perf_counter()
+    objects = [cls(d["SourceFile"], "d:/sorted", d) for d in metadata]
+    construct_seconds = time.perf_counter() - start
+    del objects
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [cls(d["SourceFile"], "d:/sorted", d) for d in metadata]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # what goes down the queue - one pickle per object
+    pickles = [pickle.dumps(o, pickle.HIGHEST_PROTOCOL) for o in objects]
+    start = time.perf_counter()
+    for p in pickles:
+        pickle.loads(p)
+    unpickle_seconds = time.perf_counter() - start
+
+    return {
+        "bytes_per_object": (after - before) / len(objects),
+        "pickle_bytes_per_object": sum(len(p) for p in pickles) / len(pickles),
+        "construct_us_per_object": construct_seconds / len(objects) * 1e6,
+        "unpickle_us_per_object": unpickle_seconds / len(objects) * 1e6,
+    }
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    metadata = make_metadata(count)
+
+    results = {
+        "before (dict)": measure(LegacyImageFile, metadata),
+        "after (__slots__)": measure(imagefile.ImageFile, metadata),
+    }
+
+    print(f"{count} objects")
+    print(
+        f"{'':20}{'bytes/object':>15}{'pickle bytes':>15}{'construct us':>15}{'unpickle us':>15}"
+    )
+    for name, r in results.items():
+        print(
+            f"{name:20}{r['bytes_per_object']:>15.0f}{r['pickle_bytes_per_object']:>15.0f}"
+            f"{r['construct_us_per_object']:>15.2f}{r['unpickle_us_per_object']:>15.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
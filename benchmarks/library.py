@@ -0,0 +1,179 @@
+# Writes a synthetic photo library - tiny but valid JPEGs and PNGs carrying EXIF dates, spread over a deep tree, with
+# duplicates, name collisions and files already sitting in the destination planted through it.  The other benchmarks
+# build their libraries with this, or run it on its own to get a library to point import.py/find_duplicates.py at
+# Usage: python -m benchmarks.library folder [count] [seed]
+import os
+import random
+import struct
+import sys
+import zlib
+from tests.fixtures import tiff_with_dates
+
+# what gets planted, as a share of count
+# duplicates are the same bytes under a different name - only find_duplicates.py and --dedupe catch these
+DUPLICATE_RATE = 0.1
+# collisions have the same name and month as an earlier file, so they fight over a destination
+COLLISION_RATE = 0.2
+# something already at the destination an earlier file is headed for
+EXISTING_RATE = 0.05
+PNG_RATE = 0.2
+MAX_DEPTH = 8
+# random bytes in a comment, so files aren't all the same size
+MAX_PADDING = 4096
+
+
+def jpeg_segment(marker: int, content: bytes) -> bytes:
+    return struct.pack(">BBH", 0xFF, marker, len(content) + 2) + content
+
+
+def make_jpeg(date: str, padding: bytes = b"") -> bytes:
+    # a 1x1 grey baseline JPEG - one quantisation table, a Huffman table each for DC and AC with a single one bit code,
+    # and one block that's "no change from 128, end of block"
+    huffman_counts = bytes([1] + [0] * 15)
+    jpeg = b"\xff\xd8"
+    jpeg += jpeg_segment(0xE1, b"Exif\0\0" + tiff_with_dates(date, date))
+    if len(padding) > 0:
+        jpeg += jpeg_segment(0xFE, padding)
+    jpeg += jpeg_segment(0xDB, b"\x00" + bytes([1] * 64))
+    jpeg += jpeg_segment(0xC0, struct.pack(">BHHBBBB", 8, 1, 1, 1, 1, 0x11, 0))
+    jpeg += jpeg_segment(0xC4, b"\x00" + huffman_counts + b"\x00")
+    jpeg += jpeg_segment(0xC4, b"\x10" + huffman_counts + b"\x00")
+    jpeg += jpeg_segment(0xDA, struct.pack(">BBBBBB", 1, 1, 0x00, 0, 63, 0))
+    return jpeg + b"\x3f" + b"\xff\xd9"
+
+
+def png_chunk(chunk_type: bytes, content: bytes) -> bytes:
+    return (
+        struct.pack(">I", len(content))
+        + chunk_type
+        + content
+        + struct.pack(">I", zlib.crc32(chunk_type + content))
+    )
+
+
+def make_png(date: str, padding: bytes = b"") -> bytes:
+    # a 1x1 grey PNG with the EXIF in an eXIf chunk, which is where exiftool looks for it
+    png = b"\x89PNG\r\n\x1a\n"
+    png += png_chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+    png += png_chunk(b"eXIf", tiff_with_dates(date, date))
+    if len(padding) > 0:
+        png += png_chunk(b"zTXt", b"padding\0\0" + zlib.compress(padding, 0))
+    png += png_chunk(b"IDAT", zlib.compress(b"\x00\x80"))
+    return png + png_chunk(b"IEND", b"")
+
+
+def random_folder(rng: random.Random, folders: list) -> str:
+    # mostly somewhere that's already got files in it, sometimes somewhere new and deeper
+    if len(folders) > 0 and rng.random() < 0.8:
+        return rng.choice(folders)
+
+    folder = f"camera {rng.randrange(10)}"
+    for level in range(rng.randrange(MAX_DEPTH)):
+        folder += f"/{rng.choice(['trip', 'backup', 'phone', 'export', 'misc'])} {rng.randrange(20)}"
+    folders.append(folder)
+    return folder
+
+
+def write_file(file_fullpath: str, content: bytes) -> None:
+    os.makedirs(os.path.dirname(file_fullpath), exist_ok=True)
+    with open(file_fullpath, "wb") as f:
+        f.write(content)
+
+
+def make_library(root: str, count: int, seed: int = 1) -> dict:
+    # writes count files under root/in and the planted existing files under root/out - returns what went where
+    rng = random.Random(seed)
+    folders = []
+    # (name, date, content) for everything so far, to plant duplicates and collisions from
+    written = []
+    summary = {
+        "files": 0,
+        "bytes": 0,
+        "jpeg": 0,
+        "png": 0,
+        "duplicates": 0,
+        "collisions": 0,
+        "existing": 0,
+    }
+
+    for i in range(count):
+        folder = random_folder(rng, folders)
+        roll = rng.random()
+        if len(written) > 0 and roll < DUPLICATE_RATE:
+            # same bytes, new name
+            name, date, content = rng.choice(written)
+            name = f"copy of {i} {name}"
+            summary["duplicates"] += 1
+        elif len(written) > 0 and roll < DUPLICATE_RATE + COLLISION_RATE:
+            # same name and date - half the time it's the same file again, otherwise a different size or edit
+            name, date, content = rng.choice(written)
+            if rng.random() < 0.5:
+                padding = rng.randbytes(rng.randrange(MAX_PADDING))
+                if name.endswith(".PNG"):
+                    content = make_png(date, padding)
+                else:
+                    content = make_jpeg(date, padding)
+            summary["collisions"] += 1
+        else:
+            date = f"{rng.randint(2005, 2023)}:{rng.randint(1, 12):02d}:{rng.randint(1, 28):02d} {rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+            padding = rng.randbytes(rng.randrange(MAX_PADDING))
+            if rng.random() < PNG_RATE:
+                name = f"IMG_{i:06d}.PNG"
+                content = make_png(date, padding)
+            else:
+                name = f"IMG_{i:06d}.JPG"
+                content = make_jpeg(date, padding)
+            written.append((name, date, content))
+
+        if name.endswith(".PNG"):
+            summary["png"] += 1
+        else:
+            summary["jpeg"] += 1
+
+        # a folder only gets a name once
+        file_fullpath = f"{root}/in/{folder}/{name}"
+        while os.path.exists(file_fullpath):
+            folder = random_folder(rng, folders)
+            file_fullpath = f"{root}/in/{folder}/{name}"
+        write_file(file_fullpath, content)
+        summary["files"] += 1
+        summary["bytes"] += len(content)
+
+        if rng.random() < EXISTING_RATE:
+            # something's already there - a smaller, older copy of the same date
+            existing_fullpath = f"{root}/out/{date[0:4]}/{date[5:7]}/{name}"
+            if not os.path.exists(existing_fullpath):
+                if name.endswith(".PNG"):
+                    write_file(existing_fullpath, make_png(date))
+                else:
+                    write_file(existing_fullpath, make_jpeg(date))
+                summary["existing"] += 1
+
+    os.makedirs(f"{root}/out", exist_ok=True)
+    summary["folders"] = len(folders)
+    summary["deepest"] = max(folder.count("/") for folder in folders) + 1
+    return summary
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python -m benchmarks.library folder [count] [seed]")
+        sys.exit(1)
+    root = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    if os.path.exists(f"{root}/in") or os.path.exists(f"{root}/out"):
+        print(f"{root} already has a library in it - pick an empty folder")
+        sys.exit(1)
+
+    summary = make_library(root, count, seed)
+    print(
+        f"Wrote {summary['files']} files ({summary['jpeg']} JPEG, {summary['png']} PNG, {round(summary['bytes'] / 1024 / 1024, 1)} MB) "
+        f"in {summary['folders']} folders up to {summary['deepest']} deep - {summary['duplicates']} duplicates, "
+        f"{summary['collisions']} name collisions, {summary['existing']} already in {root}/out"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Reads a synthetic corpus of JPEG/HEIC/MP4/MOV files with nativemeta and with exiftool, timing both and checking
+# they agree on every date and MIME type nativemeta answers for
+# Usage: python -m benchmarks.nativemeta_vs_exiftool [count]
+import sys
+import tempfile
+import time
+from photo_organiser import imagefile
+from photo_organiser import nativemeta
+from tests.fixtures import make_heic, make_jpeg, make_quicktime
+
+
+def make_corpus(folder: str, count: int) -> dict:
+    # returns {path: the date that should come back, or None if it should be left for exiftool}
+    expected = {}
+    for i in range(count):
+        date = f"20{10 + i % 12}:{i % 12 + 1:02d}:{i % 28 + 1:02d} 1{i % 10}:2{i % 10}:3{i % 10}"
+        kind = i % 5
+        if kind == 0 or kind == 1:
+            file_fullpath = f"{folder}/IMG_{i:06d}.JPG"
+            content = make_jpeg(date)
+        elif kind == 2:
+            file_fullpath = f"{folder}/IMG_{i:06d}.HEIC"
+            content = make_heic(date)
+        elif kind == 3:
+            file_fullpath = f"{folder}/MVI_{i:06d}.MP4"
+            content = make_quicktime(b"isom", date)
+        elif i % 10 == 4:
+            file_fullpath = f"{folder}/IMG_{i:06d}.MOV"
+            content = make_quicktime(b"qt  ", date)
+        else:
+            # no date in the header - nativemeta should hand these to exiftool
+            file_fullpath = f"{folder}/IMG_{i:06d}.MOV"
+            content = make_quicktime(b"qt  ", None)
+            date = None
+
+        with open(file_fullpath, "wb") as f:
+            f.write(content)
+        expected[file_fullpath] = date
+    return expected
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with tempfile.TemporaryDirectory() as folder:
+        expected = make_corpus(folder, count)
+        files = list(expected.keys())
+
+        start = time.perf_counter()
+        native_metadata, remaining = nativemeta.split_native(files)
+        native_seconds = time.perf_counter() - start
+
+        mismatches = 0
+        for d in native_metadata:
+            found = imagefile.ImageFile(d["SourceFile"], "/sorted", d).tag_date_raw
+            if found != expected[d["SourceFile"]]:
+                mismatches += 1
+                print(
+                    f"{d['SourceFile']}: read {found}, expected {expected[d['SourceFile']]}"
+                )
+        for file_fullpath in remaining:
+            if expected[file_fullpath] != None:
+                mismatches += 1
+                print(
+                    f"{file_fullpath}: left for exiftool, expected {expected[file_fullpath]}"
+                )
+
+        print(
+            f"{count} files, {len(native_metadata)} read natively, {len(remaining)} left for exiftool"
+        )
+        print(
+            f"{'native':10}{native_seconds:>10.3f}s{native_seconds / count * 1e6:>10.1f}us/file"
+        )
+
+        try:
+            import exiftool
+
+            start = time.perf_counter()
+            with exiftool.ExifToolHelper() as et:
+                exiftool_metadata = imagefile.extract_metadata(et, files)
+            exiftool_seconds = time.perf_counter() - start
+        except Exception as e:
+            print(
+                f"exiftool not available ({str(e)}) - only checked against the corpus"
+            )
+            exiftool_metadata = None
+
+        if exiftool_metadata != None:
+            print(
+                f"{'exiftool':10}{exiftool_seconds:>10.3f}s{exiftool_seconds / count * 1e6:>10.1f}us/file"
+            )
+            by_file = {d["SourceFile"]: d for d in exiftool_metadata}
+            for d in native_metadata:
+                theirs = by_file.get(d["SourceFile"], {})
+                for tag in ["File:MIMEType", "File:FileSize"] + imagefile.DATE_TAGS:
+                    if tag in d and d[tag] != theirs.get(tag):
+                        mismatches += 1
+                        print(
+                            f"{d['SourceFile']}: {tag} native {d[tag]}, exiftool {theirs.get(tag)}"
+                        )
+
+    if mismatches > 0:
+        print(f"MISMATCH: {mismatches} differences")
+        sys.exit(1)
+    print("all dates match")
+
+
+if __name__ == "__main__":
+    main()
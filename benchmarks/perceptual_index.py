@@ -0,0 +1,86 @@
+# Times perceptual.near_duplicate_groups (multi-index hashing) against comparing every hash with every other one, on
+# random dhashes with near-duplicates planted a few bits away, and fails if they don't find the same groups
+# Usage: python -m benchmarks.perceptual_index [count] [distance] [seed]
+import random
+import sys
+import time
+from photo_organiser import perceptual
+
+HASH_BITS = perceptual.HASH_SIZE * perceptual.HASH_SIZE
+
+
+def make_fingerprints(count: int, distance: int, seed: int) -> dict:
+    # about one in five files is a recompressed/resized copy of an earlier one - somewhere up to distance bits away
+    rng = random.Random(seed)
+    fingerprints = {}
+    originals = []
+    for i in range(count):
+        if len(originals) > 0 and rng.random() < 0.2:
+            value = rng.choice(originals)
+            for bit in rng.sample(range(HASH_BITS), rng.randint(0, distance)):
+                value ^= 1 << bit
+        else:
+            value = rng.getrandbits(HASH_BITS)
+            originals.append(value)
+        fingerprints[f"IMG_{i:07d}.JPG"] = value
+    return fingerprints
+
+
+def brute_force_groups(fingerprints: dict, max_distance: int) -> list:
+    # every pair, same grouping rules - what the index is saving us from
+    files = list(fingerprints.keys())
+    parent = list(range(len(files)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(files)):
+        for j in range(i + 1, len(files)):
+            if (
+                perceptual.hamming(fingerprints[files[i]], fingerprints[files[j]])
+                <= max_distance
+            ):
+                a = find(i)
+                b = find(j)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+
+    members = {}
+    for i in range(len(files)):
+        members.setdefault(find(i), []).append(files[i])
+    return sorted(sorted(group) for group in members.values() if len(group) > 1)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    distance = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    fingerprints = make_fingerprints(count, distance, seed)
+
+    start = time.perf_counter()
+    groups = perceptual.near_duplicate_groups(fingerprints, distance)
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    expected = brute_force_groups(fingerprints, distance)
+    brute_seconds = time.perf_counter() - start
+
+    found = sorted(sorted(f for f, d in group) for group in groups)
+    print(
+        f"{count} hashes, distance {distance}, {len(groups)} groups covering {sum(len(g) for g in groups)} files"
+    )
+    print(f"{'index':10}{index_seconds:>10.3f}s")
+    print(f"{'brute':10}{brute_seconds:>10.3f}s")
+
+    if found != expected:
+        print(f"MISMATCH: index found {len(found)} groups, brute force {len(expected)}")
+        sys.exit(1)
+    print("groups match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Runs import.py over the same synthetic library twice, with and without --pipeline, and times how long each takes to
+# delete or move its first file and to finish, along with how much memory it peaked at.  Fails if the two runs leave
+# the destination (or the input) looking any different - both runs use one walker, so files are always found in the
+# same order and ties go the same way
+# Needs exiftool, same as import.py does
+# Usage: python -m benchmarks.pipeline [count] [seed]
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from benchmarks import library
+
+IMPORT_SCRIPT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "import.py"
+)
+
+# runs import.py in a child of its own, so each run's peak memory is just its own.  Prints how long it took, when the
+# first delete or move started (-1 if nothing did) and the peak in KB
+RUNNER = """
+import resource, runpy, sys, time
+from photo_organiser import executor, mover
+first_action = []
+def timed(func):
+    def wrapper(*args):
+        if len(first_action) == 0:
+            first_action.append(time.perf_counter())
+        return func(*args)
+    return wrapper
+executor.delete_file = timed(executor.delete_file)
+mover.move_file = timed(mover.move_file)
+start = time.perf_counter()
+try:
+    runpy.run_path(sys.argv[1], run_name="__main__")
+except SystemExit:
+    pass
+print("RESULT", time.perf_counter() - start, first_action[0] - start if first_action else -1, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def tree_digest(root: str) -> str:
+    # every file under root, by where it is relative to root and what's in it
+    digest = hashlib.sha256()
+    for folder, subfolders, files in sorted(os.walk(root)):
+        subfolders.sort()
+        for name in sorted(files):
+            file_fullpath = os.path.join(folder, name)
+            digest.update(os.path.relpath(file_fullpath, root).encode())
+            with open(file_fullpath, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def run_import(root: str, pipeline: bool) -> dict:
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            RUNNER,
+            IMPORT_SCRIPT,
+            "--input",
+            f"{root}/in",
+            "--output",
+            f"{root}/out",
+            "--cache",
+            "none",
+            "--walkers",
+            "1",
+            "--pipeline",
+            str(pipeline).lower(),
+        ],
+        capture_output=True,
+        text=True,
+        cwd=root,
+    )
+    for line in result.stdout.splitlines():
+        if line.startswith("RESULT "):
+            seconds, first_action, peak_kb = line.split()[1:]
+            return {
+                "seconds": float(seconds),
+                "first_action": float(first_action),
+                "peak_mb": int(peak_kb) / 1024,
+                "digest": tree_digest(f"{root}/in") + tree_digest(f"{root}/out"),
+            }
+
+    print(result.stdout[-2000:])
+    print(result.stderr[-2000:])
+    raise RuntimeError(f"import.py didn't finish with --pipeline {pipeline}")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        # one library, copied with its modified times, so both runs start from exactly the same files
+        summary = library.make_library(f"{root}/library", count, seed)
+        for pipeline in [False, True]:
+            run_root = f"{root}/{pipeline}"
+            shutil.copytree(f"{root}/library", run_root)
+            results[pipeline] = run_import(run_root, pipeline)
+
+    print(
+        f"{summary['files']} files, {summary['collisions']} name collisions, {summary['existing']} already in the destination"
+    )
+    print(f"{'':12}{'total':>10}{'first action':>14}{'peak':>10}")
+    for pipeline, name in [(False, "in order"), (True, "--pipeline")]:
+        result = results[pipeline]
+        first_action = (
+            f"{result['first_action']:>13.2f}s"
+            if result["first_action"] >= 0
+            else f"{'-':>14}"
+        )
+        print(
+            f"{name:12}{result['seconds']:>9.2f}s{first_action}{result['peak_mb']:>8.1f}MB"
+        )
+
+    if results[False]["digest"] != results[True]["digest"]:
+        print("MISMATCH: the two runs left different files behind")
+        sys.exit(1)
+    print("results match")
+
+
+if __name__ == "__main__":
+    main()
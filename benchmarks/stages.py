@@ -0,0 +1,261 @@
+# Generates a synthetic library (see benchmarks/library.py) and times each stage of an import over it on its own - the
+# walk, exif, ImageFile construction, add_image, decide, find_duplicates' hashing and the execute phase.  Results go to
+# a JSON file, and handing it an earlier one prints how each stage moved, so two versions can be compared on the same
+# library
+# Usage: python -m benchmarks.stages [count] [results.json] [baseline.json]
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import find_duplicates
+from benchmarks import library
+from photo_organiser import executor
+from photo_organiser import exifpool
+from photo_organiser import hashengine
+from photo_organiser import imagefile
+from photo_organiser import metrics
+from photo_organiser import nativemeta
+from photo_organiser import statemachine
+from photo_organiser import vectordecide
+from photo_organiser import walker
+
+
+class StageTimer:
+    # collects {stage: {seconds, files, files_per_second, ...}} in the order the stages ran
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, stage: str, seconds: float, files: int, bytes: int = None) -> None:
+        result = {
+            "seconds": round(seconds, 4),
+            "files": files,
+            "files_per_second": round(files / seconds, 1) if seconds > 0 else None,
+        }
+        if bytes != None:
+            result["bytes"] = bytes
+            result["mb_per_second"] = (
+                round(bytes / 1024 / 1024 / seconds, 1) if seconds > 0 else None
+            )
+        self.stages[stage] = result
+        print(f"{stage:12}{seconds:>10.3f}s{files:>10} files")
+
+
+def git_commit() -> str:
+    # so a results file says which version it came from
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except OSError:
+        return None
+
+
+def time_walk(timer: StageTimer, root: str) -> list:
+    found = []
+    start = time.perf_counter()
+    tree_walker = walker.TreeWalker(walker.EXTENSIONS, walker.DEFAULT_WALKERS)
+    tree_walker.walk(root + "/in", found.extend)
+    timer.record("walk", time.perf_counter() - start, len(found))
+    # the walker threads finish in any order - sort so every run hands the later stages the same list
+    return sorted(found)
+
+
+def time_exif(timer: StageTimer, pool: exifpool.ExifToolPool, files: list) -> list:
+    start = time.perf_counter()
+    batch_size = pool.batch_size
+    jobs = ((i, files[i : i + batch_size]) for i in range(0, len(files), batch_size))
+    metadata = []
+    for i, batch_metadata in pool.imap(jobs):
+        metadata.extend(batch_metadata)
+    timer.record("exif", time.perf_counter() - start, len(files))
+
+    # the same files through --native-meta, for comparison - PNGs aren't something it reads, so they're left over
+    start = time.perf_counter()
+    native_metadata, remaining = nativemeta.split_native(files)
+    timer.record("native_meta", time.perf_counter() - start, len(native_metadata))
+    return metadata
+
+
+def time_imagefiles(timer: StageTimer, destination_root: str, metadata: list) -> list:
+    images = []
+    start = time.perf_counter()
+    for d in metadata:
+        try:
+            images.append(
+                imagefile.ImageFile(
+                    source_fullpath=d["SourceFile"],
+                    destination_root=destination_root,
+                    metadata=d,
+                )
+            )
+        except imagefile.ImageNotValidError:
+            pass
+    timer.record("imagefile", time.perf_counter() - start, len(images))
+    return images
+
+
+def time_machine(
+    timer: StageTimer, machine: statemachine.PhotoMachine, images: list
+) -> None:
+    start = time.perf_counter()
+    for the_image in images:
+        machine.add_image(the_image)
+    timer.record("add_image", time.perf_counter() - start, len(images))
+
+    start = time.perf_counter()
+    machine.process_exif()
+    timer.record("existing", time.perf_counter() - start, len(machine.existing_images))
+
+    hash_engine = hashengine.HashEngine()
+    start = time.perf_counter()
+    machine.decide(hash_engine)
+    timer.record("decide", time.perf_counter() - start, len(machine.candidates))
+    hash_engine.close()
+
+
+def time_duplicates(timer: StageTimer, root: str, files: list) -> None:
+    # find_duplicates.py's three stages - size, then the ends of anything sharing a size, then a full hash of whatever
+    # still collides.  No cache, so every run reads the same amount
+    progress = metrics.MetricsClient()
+    start = time.perf_counter()
+    sizes, stat_keys, devices, by_size = find_duplicates.group_by_size(files)
+    size_candidates, size_avoided = find_duplicates.shared_sizes(by_size)
+
+    engine = hashengine.HashEngine()
+    partial_sort, partial_read = find_duplicates.partial_hash_stage(
+        engine, size_candidates, sizes, stat_keys, devices, progress
+    )
+    report = find_duplicates.DuplicateReport(root + "/duplicates.log")
+    full_read, cache_avoided, partial_avoided = find_duplicates.full_hash_stage(
+        engine, partial_sort, sizes, stat_keys, report, progress
+    )
+    engine.close()
+    report.close()
+    partial_sort.close()
+    timer.record(
+        "duplicates",
+        time.perf_counter() - start,
+        len(size_candidates),
+        partial_read + full_read,
+    )
+
+
+def time_execute(timer: StageTimer, machine: statemachine.PhotoMachine) -> None:
+    # the deletes and moves import.py would make, for real - it's a throwaway library
+    candidates = machine.candidates
+    action_executor = executor.ActionExecutor()
+    start = time.perf_counter()
+
+    losers = [the_image.source_fullpath for the_image in candidates.loser_images()]
+    for source_fullpath, error in action_executor.delete_files(losers):
+        if error != None:
+            print(f"Failed to delete {source_fullpath} due to {str(error)}")
+
+    winners = []
+    for this_winner in candidates.winner_images():
+        if this_winner.source_fullpath == this_winner.destination_fullpath:
+            continue
+        os.makedirs(os.path.dirname(this_winner.destination_fullpath), exist_ok=True)
+        winners.append(
+            (
+                this_winner.source_fullpath,
+                this_winner.destination_fullpath,
+                this_winner.file_size,
+                this_winner.file_hash,
+            )
+        )
+    for (
+        source_fullpath,
+        destination_fullpath,
+        copied_hash,
+        error,
+    ) in action_executor.move_files(winners):
+        if error != None:
+            print(f"Failed to move {source_fullpath} due to {str(error)}")
+
+    action_executor.close()
+    timer.record(
+        "execute",
+        time.perf_counter() - start,
+        len(losers) + len(winners),
+        action_executor.bytes_moved,
+    )
+
+
+def compare(results: dict, baseline: dict) -> None:
+    print(
+        f"\nAgainst {baseline.get('commit')} ({baseline['library']['files']} files, this run {results['library']['files']}):"
+    )
+    for stage, result in results["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before == None:
+            print(f"{stage:12}{'new':>10}")
+            continue
+        if before["seconds"] <= 0:
+            print(f"{stage:12}{before['seconds']:>10.3f}s{result['seconds']:>10.3f}s")
+            continue
+        change = (result["seconds"] - before["seconds"]) / before["seconds"] * 100
+        print(
+            f"{stage:12}{before['seconds']:>10.3f}s{result['seconds']:>10.3f}s{change:>+9.1f}%"
+        )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    results_path = sys.argv[2] if len(sys.argv) > 2 else None
+    baseline_path = sys.argv[3] if len(sys.argv) > 3 else None
+
+    timer = StageTimer()
+    decide_engine = "vector" if vectordecide.available() else "loop"
+    with tempfile.TemporaryDirectory() as root:
+        start = time.perf_counter()
+        summary = library.make_library(root, count)
+        print(
+            f"Generated {summary['files']} files in {time.perf_counter() - start:.1f}s - {summary['duplicates']} duplicates, "
+            f"{summary['collisions']} name collisions, {summary['existing']} already in the destination"
+        )
+
+        # same input, same order, every stage - the execute phase goes last since it moves everything
+        destination_root = root + "/out"
+        pool = exifpool.ExifToolPool()
+        try:
+            files = time_walk(timer, root)
+            metadata = time_exif(timer, pool, files)
+            images = time_imagefiles(timer, destination_root, metadata)
+            machine = statemachine.PhotoMachine(
+                destination_root, None, False, False, decide_engine, pool
+            )
+            time_machine(timer, machine, images)
+            time_duplicates(timer, root, files)
+            time_execute(timer, machine)
+        finally:
+            pool.close()
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "decide_engine": decide_engine,
+        "library": summary,
+        "stages": timer.stages,
+    }
+
+    if results_path != None:
+        with open(results_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {results_path}")
+
+    if baseline_path != None:
+        with open(baseline_path, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,315 @@
 from photo_organiser import argumentparser
-import logging, sys, os, hashlib, csv
+from photo_organiser import cache
+from photo_organiser import externalsort
+from photo_organiser import hashengine
+from photo_organiser import hashing
+from photo_organiser import metrics
+from photo_organiser import perceptual
+from photo_organiser import photoprocesses
+from photo_organiser import walker
+import logging, sys, os, csv
+import itertools
+import collections
+import multiprocessing
 
 logger = logging.getLogger(__file__)
 
 
-def get_hash(file):
-    BLOCK_SIZE = 65536  # The size of each read from the file
+def group_by_size(files):  # files: list
+    # stage 1: bucket files by byte size - a file with a unique size can't have a duplicate
+    # the full stat key is kept too, so the hash cache doesn't need to stat everything a second time
+    # and the device, so the hash engine knows which disk each read lands on
+    sizes = {}
+    stat_keys = {}
+    devices = {}
+    by_size = {}
+    for this_file in files:
+        try:
+            stat_result = os.stat(this_file)
+        except OSError as e:
+            print(f"Failed to stat {this_file} due to {str(e)}")
+            continue
 
-    file_hash = (
-        hashlib.sha256()
-    )  # Create the hash object, can use something other than `.sha256()` if you wish
-    with open(file, "rb") as f:  # Open the file to read it's bytes
-        fb = f.read(BLOCK_SIZE)  # Read from the file. Take in the amount declared above
-        while len(fb) > 0:  # While there is still data being read from the file
-            file_hash.update(fb)  # Update the hash
-            fb = f.read(BLOCK_SIZE)  # Read the next block from the file
+        stat_keys[this_file] = cache.stat_key(this_file, stat_result)
+        devices[this_file] = stat_result.st_dev
 
-    return file_hash.hexdigest()  # Get the hexadecimal digest of the hash
+        file_size = stat_keys[this_file][0]
+        sizes[this_file] = file_size
+        if file_size not in by_size:
+            by_size[file_size] = [this_file]
+        else:
+            by_size[file_size].append(this_file)
+
+    return sizes, stat_keys, devices, by_size
+
+
+def shared_sizes(by_size):  # by_size: dict
+    # the files that share a size with another file, and the bytes the rest didn't need reading
+    size_candidates = []
+    avoided = 0
+    for file_size in by_size:
+        if len(by_size[file_size]) > 1:
+            size_candidates.extend(by_size[file_size])
+        else:
+            avoided += file_size
+
+    return size_candidates, avoided
+
+
+def partial_hash_stage(
+    engine,
+    files,
+    sizes,
+    stat_keys,
+    devices,
+    progress,
+    run_size=externalsort.DEFAULT_RUN_SIZE,
+):  # files: list
+    # stage 2: hash the ends of anything that shares a size.  Results go straight into an external sort rather than a
+    # dict, so the files sharing a size and partial hash come back out next to each other without all of them having
+    # to be in memory at once.  Returns the sort and how much got read
+    partial_sort = externalsort.ExternalSort(run_size)
+    bytes_read = 0
+    progress.set_total("partial hashed", len(files))
+    for this_file, partial_hash in engine.hash_files_ends(
+        (this_file, sizes[this_file], devices[this_file]) for this_file in files
+    ):
+        key = stat_keys[this_file]
+        partial_sort.add(
+            (
+                sizes[this_file],
+                partial_hash,
+                this_file,
+                devices[this_file],
+                key[1],
+                key[2],
+            )
+        )
+        bytes_read += hashengine.partial_read_size(sizes[this_file])
+        progress.add(
+            "partial hashed", bytes=hashengine.partial_read_size(sizes[this_file])
+        )
+
+    return partial_sort, bytes_read
+
+
+def full_hash_stage(
+    engine,
+    partial_sort,
+    sizes,
+    stat_keys,
+    report,
+    progress,
+    file_cache=None,
+    algorithm=hashing.DEFAULT_ALGORITHM,
+):
+    # stage 3: full hash of anything that still collides, with the duplicates going to report.  Small files were
+    # already hashed in full by stage 2 and anything hashed on a previous run comes straight out of the cache
+    # returns the bytes read, and the bytes the cache and the partial hashes saved reading
+    avoided = {"cache": 0, "partial": 0}
 
+    def hash_jobs():
+        # walks the partial groups in sorted order - anything we can answer without reading the file gets answered
+        # here, the rest goes to the engine.  The engine only reads a little way ahead of what it's finished, so only a
+        # handful of groups are ever waiting on hashes
+        for partial_key, records in itertools.groupby(
+            partial_sort.sorted(), key=lambda record: record[0:2]
+        ):
+            file_size, partial_hash = partial_key
+            records = list(records)
+            if len(records) == 1:
+                avoided["partial"] += file_size - hashengine.partial_read_size(
+                    file_size
+                )
+                continue
 
-def run_fast_scandir(dir, ext):  # dir: str, ext: list
-    subfolders, files, ignored = [], [], []
+            hashed = []
+            to_hash = []
+            for file_size, partial_hash, this_file, device, mtime_ns, inode in records:
+                cached_hash = None
+                if file_cache != None:
+                    cached_hash = file_cache.get_hash(
+                        this_file, (file_size, mtime_ns, inode), algorithm
+                    )
+
+                if file_size <= hashengine.PARTIAL_BLOCK_SIZE * 2:
+                    hashed.append((partial_hash, this_file))
+                elif cached_hash != None:
+                    hashed.append((cached_hash, this_file))
+                    avoided["cache"] += file_size
+                else:
+                    to_hash.append((this_file, device))
+
+            report.start_group(hashed, [this_file for this_file, device in to_hash])
+            yield from to_hash
+
+    bytes_read = 0
+    for this_file, file_hash in engine.hash_files(hash_jobs(), failures=True):
+        report.add_hash(this_file, file_hash)
+        if file_hash == None:
+            continue
+        bytes_read += sizes[this_file]
+        if file_cache != None:
+            file_cache.set_hash(this_file, file_hash, stat_keys[this_file])
+
+        progress.add("hashed", bytes=sizes[this_file])
+
+    return bytes_read, avoided["cache"], avoided["partial"]
+
+
+def find_near_duplicates(
+    paths, files, stat_keys, devices, file_cache, progress
+):  # files: list
+    # perceptual hash of every image, then everything within --near bits of something else gets grouped together
+    # dhashes are cached against the file's hash, so anything whose hash is already in the cache (the exact stage
+    # just put any it worked out there) and has been fingerprinted before - under any name - doesn't get opened at all
+    fingerprints = {}
+    waiting = {}  # file hash -> files with that content still waiting on a fingerprint
+    # file being fingerprinted -> the cached hash of the copies waiting on it
+    representing = {}
+    to_fingerprint = []
+    for this_file in sorted(files):
+        if this_file not in stat_keys or not perceptual.is_image(this_file):
+            continue
+
+        file_hash = None
+        if file_cache != None:
+            file_hash = file_cache.get_hash(
+                this_file, stat_keys[this_file], paths.hash_algorithm
+            )
+
+        if file_hash != None and file_cache != None:
+            cached_dhash = file_cache.get_perceptual(file_hash)
+            if cached_dhash != None:
+                fingerprints[this_file] = cached_dhash
+                continue
+
+        if file_hash != None:
+            # byte-for-byte copies only need decoding once
+            if file_hash in waiting:
+                waiting[file_hash].append(this_file)
+                continue
+            waiting[file_hash] = []
+            representing[this_file] = file_hash
+        to_fingerprint.append(this_file)
+
+    cached = len(fingerprints)
+    engine = perceptual.PerceptualEngine(
+        paths.workers, paths.io_concurrency, True, paths.hash_algorithm
+    )
+    total = len(to_fingerprint)
+    while len(to_fingerprint) > 0:
+        progress.set_total("fingerprinted", total)
+        for this_file, result in engine.fingerprint_files(
+            (this_file, devices[this_file]) for this_file in to_fingerprint
+        ):
+            file_hash, dhash = result
+            fingerprints[this_file] = dhash
+            if representing.get(this_file) == file_hash:
+                # still the same content the cache said the waiting copies have
+                for duplicate in waiting.pop(file_hash):
+                    fingerprints[duplicate] = dhash
+            if file_cache != None:
+                file_cache.set_hash(this_file, file_hash, stat_keys[this_file])
+                file_cache.set_perceptual(file_hash, dhash)
+            progress.add("fingerprinted", bytes=stat_keys[this_file][0])
 
-    for f in os.scandir(dir):
-        if f.is_dir():
-            subfolders.append(f.path)
-        if f.is_file():
-            if os.path.splitext(f.name)[1].lower() in ext:
-                files.append(f.path)
-            else:
-                logger.debug(f"{f} ignored due to filetype")
-                ignored.append(f.path)
+        # a copy that couldn't be fingerprinted (or had changed since it was hashed) hands over to the next one
+        to_fingerprint = []
+        for this_file, file_hash in list(representing.items()):
+            del representing[this_file]
+            if file_hash in waiting and len(waiting[file_hash]) > 0:
+                next_file = waiting[file_hash].pop(0)
+                representing[next_file] = file_hash
+                to_fingerprint.append(next_file)
+        if len(to_fingerprint) > 0:
+            logger.warning(
+                f"Trying {len(to_fingerprint)} other copies of files that couldn't be fingerprinted"
+            )
+            total += len(to_fingerprint)
+    engine.close()
 
-    for dir in list(subfolders):
-        sf, f, ign = run_fast_scandir(dir, ext)
-        subfolders.extend(sf)
-        files.extend(f)
-        ignored.extend(ign)
+    # back in sorted order, so the groups come out the same every run
+    fingerprints = {
+        this_file: fingerprints[this_file]
+        for this_file in sorted(files)
+        if this_file in fingerprints
+    }
+    return perceptual.near_duplicate_groups(fingerprints, paths.near_distance), cached
 
-    print(f"Filesystem walk: Walk in progress (finished {dir})", end="\r")
 
-    return subfolders, files, ignored
+class DuplicateReport:
+    # writes duplicates.log a partial group at a time.  Files can only have the same hash if they have the same size and
+    # partial hash, so once everything in a partial group has a full hash its duplicates are final.  Groups are started
+    # in sorted order but the engine finishes them in whatever order it likes, so a finished group waits for every group
+    # started before it - only the ones between the oldest unfinished group and the newest started one are kept
+    duplicates: int
+    groups: int
+
+    def __init__(self, log_path: str):
+        self.file = open(log_path, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file, delimiter=",", quotechar='"')
+        self.duplicates = 0
+        self.groups = 0
+        self._pending = {}  # group number -> [files still being hashed, [(hash, path)]]
+        # group numbers in the order they were started
+        self._order = collections.deque()
+        self._group_of = {}  # path -> group number, only while it's being hashed
+        self._next_group = 0
+
+    def start_group(self, hashed: list, to_hash: list) -> None:
+        # hashed is [(hash, path)] for the files already answered, to_hash the paths the engine's about to do
+        self._pending[self._next_group] = [len(to_hash), hashed]
+        self._order.append(self._next_group)
+        for this_file in to_hash:
+            self._group_of[this_file] = self._next_group
+        self._next_group += 1
+        self._write_finished()
+
+    def add_hash(self, this_file: str, file_hash: str) -> None:
+        # file_hash is None for a file that couldn't be hashed - it's finished, it just isn't a duplicate of anything
+        group = self._group_of.pop(this_file)
+        pending = self._pending[group]
+        pending[0] -= 1
+        if file_hash != None:
+            pending[1].append((file_hash, this_file))
+        self._write_finished()
+
+    def _write_finished(self) -> None:
+        while len(self._order) > 0 and self._pending[self._order[0]][0] == 0:
+            self._write(self._pending.pop(self._order.popleft())[1])
+
+    def _write(self, hashed: list) -> None:
+        hashed.sort()
+        wrote = False
+        for file_hash, members in itertools.groupby(hashed, key=lambda h: h[0]):
+            members = [this_file for file_hash, this_file in members]
+            if len(members) < 2:
+                continue
+            for duplicate in members:
+                self.writer.writerow([file_hash, duplicate])
+            self.duplicates += len(members)
+            self.groups += 1
+            wrote = True
+        if wrote:
+            # so duplicates.log is worth looking at while the rest is still hashing
+            self.file.flush()
+
+    def close(self) -> None:
+        for group in self._order:
+            self._write(self._pending[group][1])
+        self._pending = {}
+        self._order = collections.deque()
+        self._group_of = {}
+        self.file.close()
+
+
+def format_bytes(num_bytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if num_bytes < 1024:
+            return f"{round(num_bytes, 1)} {unit}"
+        num_bytes /= 1024
+    return f"{round(num_bytes, 1)} TB"
 
 
 def main():
@@ -51,67 +320,106 @@ def main():
         exit()
     else:
         logger.debug("Paths is good")
-    print(
-        f"Filesystem walk: Initiated walk of {paths.incoming_path}",
-        end="\r",
-    )
 
-    ext = [".mov", ".jpg", ".heic", ".mp4", ".png", ".jpeg", ".3gp", ".avi", ".jpe"]
+    # one status line for the whole run instead of a print per file
+    status_queue = multiprocessing.JoinableQueue()
+    status_consumer = photoprocesses.StatusConsumer(status_queue, paths.metrics_path)
+    status_consumer.start()
+    progress = metrics.MetricsClient(status_queue)
 
-    sf, f, ignored = run_fast_scandir(paths.incoming_path, ext)
+    f = []
 
-    print(
-        f"Filesystem walk: Complete (found {len(f)} files)                             ",
-    )
+    def found_batch(batch):
+        f.extend(batch)
+        progress.add("walked", files=len(batch))
+
+    tree_walker = walker.TreeWalker(walker.EXTENSIONS, paths.walkers)
+    tree_walker.walk(paths.incoming_path, found_batch)
+    # the walker threads finish in any order - sort so every run goes through the files the same way
+    f.sort()
 
-    print(
-        f"File hashing: Initiated hashing of {len(f)} files",
-        end="\r",
-    )
-    file_hashes = {}
     total_files = len(f)
-    counter = 0
 
-    for this_file in f:
-        file_hashes[this_file] = get_hash(this_file)
-        counter += 1
-        print(
-            f"File hashing: In progress ({round(counter/total_files*100,1)}% completed)        ",
-            end="\r",
-        )
+    # stage 1: group by size
+    sizes, stat_keys, devices, by_size = group_by_size(f)
+    size_candidates, stage_size_avoided = shared_sizes(by_size)
+
+    engine = hashengine.HashEngine(
+        paths.workers, paths.io_concurrency, paths.use_processes, paths.hash_algorithm
+    )
+    partial_sort, stage_partial_read = partial_hash_stage(
+        engine,
+        size_candidates,
+        sizes,
+        stat_keys,
+        devices,
+        progress,
+        paths.sort_run_size,
+    )
+
+    file_cache = None
+    if paths.cache_path != None:
+        file_cache = cache.FileCache(paths.cache_path)
 
-    print(f"File hashing: Complete                                  ")
+    report = DuplicateReport("duplicates.log")
+    stage_full_read, stage_cache_avoided, stage_partial_avoided = full_hash_stage(
+        engine,
+        partial_sort,
+        sizes,
+        stat_keys,
+        report,
+        progress,
+        file_cache,
+        paths.hash_algorithm,
+    )
 
-    flipped = {}
+    engine.close()
+    report.close()
+    partial_sort.close()
+    duplicates = report.duplicates
 
-    for key, value in file_hashes.items():
-        if value not in flipped:
-            flipped[value] = [key]
+    near_groups = None
+    if paths.near_distance != None:
+        if perceptual.available():
+            near_groups, near_cached = find_near_duplicates(
+                paths, f, stat_keys, devices, file_cache, progress
+            )
+            near_file = open("near_duplicates.log", "w", newline="", encoding="utf-8")
+            near_writer = csv.writer(near_file, delimiter=",", quotechar='"')
+            for group_number, group in enumerate(near_groups):
+                for near_duplicate, distance in group:
+                    near_writer.writerow([group_number + 1, distance, near_duplicate])
+            near_file.close()
+            progress.note("near_duplicate_groups", len(near_groups))
         else:
-            flipped[value].append(key)
+            logger.warning(
+                f"--near needs numpy and Pillow installed - skipping near-duplicates"
+            )
+
+    if file_cache != None:
+        file_cache.close()
 
-    duplicate_file = open("duplicates.log", "w", newline="", encoding="utf-8")
-    duplicate_writer = csv.writer(duplicate_file, delimiter=",", quotechar='"')
+    progress.note("size_candidates", len(size_candidates))
+    progress.note("duplicates", duplicates)
+    progress.flush()
+    status_queue.put(None)
+    status_consumer.join()
+    status_queue.close()
 
-    counter = 0
     print(
-        f"File comparison: In progress ({round(counter/total_files*100,1)}% completed)        ",
-        end="\r",
+        f"{len(size_candidates)} of {total_files} files share a size with another file, {duplicates} are duplicates"
     )
-    for hash in flipped:
-        if len(flipped[hash]) > 1:
-            for duplicate in flipped[hash]:
-                duplicate_writer.writerow([hash, duplicate])
-        counter += 1
+    print(f"Finished writing to duplicates.log")
+    if near_groups != None:
         print(
-            f"File comparison: In progress ({round(counter/total_files*100,1)}% completed)        ",
-            end="\r",
+            f"{len(near_groups)} groups of near-duplicates ({sum(len(group) for group in near_groups)} files, "
+            f"{near_cached} fingerprints from the cache) - finished writing to near_duplicates.log"
         )
-    duplicate_file.close()
-
     print(
-        f"File comparison: Complete                          \nFinished writing to duplicates.log\nProcess complete",
+        f"Bytes avoided: size grouping {format_bytes(stage_size_avoided)}, partial hashing {format_bytes(stage_partial_avoided)} "
+        f"(read {format_bytes(stage_partial_read)}), hash cache {format_bytes(stage_cache_avoided)}, full hashing read {format_bytes(stage_full_read)}"
     )
+    print(f"Process complete")
 
 
 if __name__ == "__main__":
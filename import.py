@@ -1,12 +1,23 @@
 import multiprocessing
 import logging, sys
 import os
-import shutil
 import datetime
+import queue
+import collections
 from photo_organiser import argumentparser
+from photo_organiser import cache
 from photo_organiser import statemachine
 from photo_organiser import photoprocesses
+from photo_organiser import exifbatch
+from photo_organiser import exifpool
+from photo_organiser import imagebatch
+from photo_organiser import executor
+from photo_organiser import hashengine
+from photo_organiser import watcher
+from photo_organiser import metrics
+from photo_organiser import pipeline
 import csv
+from typing import Iterator
 
 imageLogger = logging.getLogger("imagefile")
 logger = logging.getLogger("photo_organiser")
@@ -65,7 +76,8 @@ def write_log(
 
 # Flow:
 # 1. SearchConsumer (1 process) starts searching for files, makes batch of 100 at a time and pushes them to exifqueue
-# 2. ExifConsumer (4 processes) picks them up and instantiates ImageFile and pushes them to execution queue
+# 2. the exiftool pool (threads in this process, each driving its own exiftool) turns them into ImageFiles
+#    or with --exif process, ExifConsumer (4 processes) picks them up and instantiates ImageFile and pushes them to execution queue
 def main():
     paths = argumentparser.ArgumentParser(sys.argv)
 
@@ -75,40 +87,107 @@ def main():
     else:
         logger.debug("Paths is good")
 
-    state_machine = statemachine.PhotoMachine(paths.output_path)
+    # one lot of exiftools for the whole run - watch mode keeps using them pass after pass
+    exif_pool = exifpool.ExifToolPool(exif_workers(paths), paths.native_metadata)
 
-    ### SEARCHER PROCESS ###
-    # establish communication queues
-    search_tasks = (
-        multiprocessing.JoinableQueue()
-    )  # overkill given I'm only allowing one input path - could just pass the string
-    search_results = multiprocessing.JoinableQueue()
+    run_import(paths, exif_pool)
 
-    # start searchers
-    search_consumer = photoprocesses.SearchConsumer(search_tasks, search_results)
-    search_consumer.start()
+    if paths.watch:
+        # every pass after the first is incremental, so it only walks the directories something landed in
+        input_watcher = watcher.make_watcher(paths.incoming_path)
+        try:
+            while True:
+                print(
+                    f"\nWatching {paths.incoming_path} for new files (ctrl-c to stop)"
+                )
+                input_watcher.wait_for_changes()
+                run_import(paths, exif_pool)
+        except KeyboardInterrupt:
+            print(f"\nStopped watching {paths.incoming_path}")
+        input_watcher.close()
 
-    # push the incoming search path into the search process
-    search_tasks.put(paths.incoming_path)
+    exif_pool.close()
 
-    # poison pill to close search process
-    search_tasks.put(None)
+    # close the log so that we can exit cleanly
+    log_file.close()
+
+    for child in multiprocessing.active_children():
+        print(f"Active child: {child}")
 
-    ### EXIF PROCESS ###
+    logger.debug("\nSuccessfully exiting!")
+
+    exit()
+
+
+def exif_workers(paths: argumentparser.ArgumentParser) -> int:
+    if paths.debug:
+        return 1
+    return multiprocessing.cpu_count() * 2
+
+
+def queued_batches(search_results) -> Iterator[list]:
+    # the searcher's batches as a generator, up to its poison pill
+    while True:
+        batch = search_results.get()
+        search_results.task_done()
+        if batch == None:
+            return
+        yield batch
+
+
+def read_ahead(search_results, tracker: pipeline.CompletionTracker) -> Iterator[list]:
+    # the searcher's batches as a generator, like queued_batches(), but every time it's asked for the next one it reads
+    # everything the searcher has sent so far.  The exiftool pool only asks for a batch when it's got room for one, and
+    # --pipeline can't hand anything out until it knows the walk's finished - which is normally long before exif is
+    buffered = collections.deque()
+    walk_finished = False
+    while not walk_finished or len(buffered) > 0:
+        while not walk_finished:
+            try:
+                batch = search_results.get(block=len(buffered) == 0)
+            except queue.Empty:
+                break
+            search_results.task_done()
+            if batch == None:
+                walk_finished = True
+                tracker.walk_done()
+            else:
+                tracker.walked(batch)
+                buffered.append(batch)
+
+        if len(buffered) > 0:
+            yield buffered.popleft()
+
+
+def run_exif_consumers(
+    paths: argumentparser.ArgumentParser,
+    state_machine: statemachine.PhotoMachine,
+    search_results,
+    status_queue,
+    exif_stats: exifbatch.BatchStats,
+) -> list:
+    # --exif process - a python process per exiftool, each sending batches of ImageFiles back through shared memory
+    # returns the consumers so run_import() can tear them down once everything's been executed
     exif_results = multiprocessing.JoinableQueue()
 
     # Start exif consumers
-    if paths.debug:
-        num_consumers = 1
-    else:
-        num_consumers = multiprocessing.cpu_count() * 2
+    num_consumers = exif_workers(paths)
 
     logging.debug(f"exif_results: Creating {num_consumers} consumers")
     exif_consumers = [
-        photoprocesses.ExifConsumer(search_results, exif_results, paths.output_path)
+        photoprocesses.ExifConsumer(
+            search_results,
+            exif_results,
+            paths.output_path,
+            paths.cache_path,
+            paths.native_metadata,
+            status_queue,
+        )
         for i in range(num_consumers)
     ]
 
+    # the consumers have to share this process's resource tracker, or their batches get cleaned up when they exit
+    imagebatch.prepare()
     for w in exif_consumers:
         w.start()
 
@@ -117,151 +196,148 @@ def main():
     while True:
         thisExifResult = exif_results.get()
         exif_results.task_done()
-        if thisExifResult != None:
-            # processed a new image, add it to the state machine
-            state_machine.add_image(thisExifResult)
+        if isinstance(thisExifResult, exifbatch.BatchStats):
+            # a consumer is about to finish and has sent back its batching numbers
+            exif_stats.merge(thisExifResult)
+        elif isinstance(thisExifResult, imagebatch.SharedBatch):
+            # processed a batch of new images, add them to the state machine
+            state_machine.add_images(thisExifResult.take(paths.output_path))
         else:
             # poison pill, we're done here
             exhausted_consumers += 1
-            print(f"Finished {exhausted_consumers} consumers")
+            logger.debug(f"Finished {exhausted_consumers} consumers")
 
         if exhausted_consumers == num_consumers:
             logger.debug(f"All queues exhausted - finished multiprocessing")
             break
 
-    print(f"Processing exif for existing files", end="\r")
-    state_machine.process_exif()
+    return exif_consumers
 
-    print(f"\nProcessing decisions", end="\r")
-    state_machine.decide()
 
-    print(f"Writing decision log", end="\r")
-    # first pass for logging
-    counter_written = 0
-    for destination_image in state_machine.ImageObjects_by_destination:
-        for source_image in state_machine.ImageObjects_by_destination[
-            destination_image
-        ]:
-            # for source in destination_image:
-            write_log(
-                destination_image=destination_image,
-                source_image=source_image,
-                winner=str(state_machine.ImageObjects_by_source[source_image].winner),
-                reason=state_machine.ImageObjects_by_source[source_image].reason,
-                source_size=state_machine.ImageObjects_by_source[
-                    source_image
-                ].file_size,
-                source_hash=state_machine.ImageObjects_by_source[
-                    source_image
-                ].file_hash,
-                source_date=state_machine.ImageObjects_by_source[
-                    source_image
-                ].destination_year
-                + "-"
-                + state_machine.ImageObjects_by_source[source_image].destination_month,
-            )
-            counter_written += 1
-            print(
-                f"\rWriting decisions for {len(state_machine.ImageObjects_by_source)} input files ({round(counter_written/len(state_machine.ImageObjects_by_source)*100,1)}% decisions out of {len(state_machine.ImageObjects_by_source)} input files)        ",
-                end="\r",
-            )
+def run_import(
+    paths: argumentparser.ArgumentParser, exif_pool: exifpool.ExifToolPool
+) -> None:
+    # one complete pass - walk, exif, decide, execute.  Watch mode calls this again every time something lands
+
+    ### STATUS PROCESS ###
+    # everything that makes progress counts it with a metrics client, and this draws the lot a couple of times a second
+    status_queue = multiprocessing.JoinableQueue()
+    status_consumer = photoprocesses.StatusConsumer(status_queue, paths.metrics_path)
+    status_consumer.start()
+    progress = metrics.MetricsClient(status_queue)
+
+    state_machine = statemachine.PhotoMachine(
+        paths.output_path,
+        paths.cache_path,
+        paths.content_dedupe,
+        paths.incremental,
+        paths.decide_engine,
+        exif_pool,
+        progress,
+        paths.hash_algorithm,
+    )
 
-    print(f"\nExecuting decisions", end="\r")
-    # second pass for losers (deletes)
-    counter_deleted = 0
-    for source_image in state_machine.ImageObjects_by_source:
-        if state_machine.ImageObjects_by_source[source_image].winner == False:
-            logger.debug(f"{source_image}: Deleting loser")
+    ### SEARCHER PROCESS ###
+    # establish communication queues
+    search_tasks = (
+        multiprocessing.JoinableQueue()
+    )  # overkill given I'm only allowing one input path - could just pass the string
+    search_results = multiprocessing.JoinableQueue()
 
-            if paths.dryrun == False:
-                try:
-                    os.remove(
-                        state_machine.ImageObjects_by_source[
-                            source_image
-                        ].source_fullpath
-                    )
-                except Exception as e:
-                    print(
-                        f"Failed to delete {state_machine.ImageObjects_by_source[source_image].source_fullpath} due to {str(e)}"
-                    )
-
-            counter_deleted += 1
-            print(
-                f"\rExecuting actions for {len(state_machine.ImageObjects_by_source)} input files. Deleted: {counter_deleted}, Moved: 0, Remaining: {len(state_machine.ImageObjects_by_source)-counter_deleted} ({round(counter_deleted / len(state_machine.ImageObjects_by_source)*100,1)}%)        ",
-                end="\r",
-            )
+    # start searchers
+    search_consumer = photoprocesses.SearchConsumer(
+        search_tasks,
+        search_results,
+        paths.walkers,
+        paths.cache_path,
+        paths.incremental,
+        status_queue,
+    )
+    search_consumer.start()
 
-    # get a list of the destination folders and make sure they all exist
-    # todo: rework the ImageObjects_by_destination structure so that it has a pointer to the winner
-    years = {}
+    # push the incoming search path into the search process
+    search_tasks.put(paths.incoming_path)
 
-    for source_image in state_machine.ImageObjects_by_source:
-        if state_machine.ImageObjects_by_source[source_image].winner == True:
-            this_winner = state_machine.ImageObjects_by_source[source_image]
-            if this_winner.destination_year not in years.keys():
-                years[this_winner.destination_year] = set()
+    # poison pill to close search process
+    search_tasks.put(None)
 
-            years[this_winner.destination_year].add(this_winner.destination_month)
+    ### EXIF ###
+    exif_stats = exifbatch.BatchStats()
+    exif_consumers = []
 
-    for year in years.keys():
-        this_year_folder = (
-            state_machine.ImageObjects_by_source[source_image].destination_root
-            + "/"
-            + year
+    # tie-break hashes get read across the same kind of device-aware pool the executor uses
+    hash_engine = hashengine.HashEngine(
+        paths.workers, paths.io_concurrency, paths.use_processes, paths.hash_algorithm
+    )
+    action_executor = executor.ActionExecutor(
+        paths.workers,
+        paths.src_concurrency,
+        paths.dst_concurrency,
+        paths.use_processes,
+        paths.verify,
+        paths.hash_algorithm,
+    )
+    totals = {"deleted": 0, "moved": 0}
+
+    if paths.pipeline:
+        # destinations get decided and executed as soon as nothing else can turn up for them, while exif carries on
+        run_pipeline(
+            paths,
+            state_machine,
+            search_results,
+            hash_engine,
+            action_executor,
+            progress,
+            totals,
         )
+    else:
+        if not paths.exif_processes:
+            # the searcher's batches go straight across the exiftool pool from here and come back as candidates
+            files_media, files_skipped = state_machine.add_files(
+                queued_batches(search_results)
+            )
+            logger.debug(
+                f"Finished exif analysis. {files_media} valid, {files_skipped} ignored"
+            )
+        else:
+            exif_consumers = run_exif_consumers(
+                paths, state_machine, search_results, status_queue, exif_stats
+            )
 
-        if not os.path.isdir(this_year_folder):
-            # it doesn't exist so make it
-            os.mkdir(this_year_folder)
+        state_machine.process_exif()
+        state_machine.decide(hash_engine)
 
-        for month in years[year]:
-            this_month_folder = this_year_folder + "/" + month
-            if not os.path.isdir(this_month_folder):
-                # it doesn't exist so make it
-                os.mkdir(this_month_folder)
+        # first pass for logging
+        log_decisions(state_machine)
 
-    counter_moved = 0
-
-    # third pass for winners.  Do pass two and three separately so that we don't move something and then delete it later - ordering is important
-    for source_image in state_machine.ImageObjects_by_source:
-        if state_machine.ImageObjects_by_source[source_image].winner == True:
-            if (
-                state_machine.ImageObjects_by_source[source_image].source_fullpath
-                == state_machine.ImageObjects_by_source[
-                    source_image
-                ].destination_fullpath
-            ):
-                # don't need to do anything - the file in situ is the right one
-                logger.debug(f"{source_image}: Winner already in place, skipping")
-            else:
-                logger.debug(
-                    f"{source_image}: Moving winner to {state_machine.ImageObjects_by_source[source_image].destination_fullpath}"
-                )
-                if paths.dryrun == False:
-                    try:
-                        shutil.move(
-                            state_machine.ImageObjects_by_source[
-                                source_image
-                            ].source_fullpath,
-                            state_machine.ImageObjects_by_source[
-                                source_image
-                            ].destination_fullpath,
-                        )
-                    except Exception as e:
-                        print(
-                            f"Failed to move {state_machine.ImageObjects_by_source[source_image].source_fullpath} to {state_machine.ImageObjects_by_source[source_image].destination_fullpath} due to {str(e)}"
-                        )
-
-            counter_moved += 1
+        losers, winners = plan_actions(paths, state_machine, progress, totals)
+        for result in pipeline.run_actions(
+            action_executor, losers, winners, paths.dryrun
+        ):
+            record_result(paths, state_machine, progress, result)
 
-        print(
-            f"\rExecuting decisions for {len(state_machine.ImageObjects_by_source)} input files. Deleted: {counter_deleted}, Moved: {counter_moved}, Remaining: {len(state_machine.ImageObjects_by_source)-counter_deleted-counter_moved} ({round((counter_deleted+counter_moved) / len(state_machine.ImageObjects_by_source)*100,1)}% complete)             ",
-            end="\r",
-        )
+    hash_engine.close()
+    exif_stats.merge(exif_pool.take_stats())
+    action_executor.close()
+
+    # the status line's done - the summaries go in the metrics file too
+    move_summary = f"Moved {round(action_executor.bytes_moved / 1024 / 1024, 1)} MB in {round(action_executor.move_seconds, 1)} seconds ({round(action_executor.throughput(), 1)} MB/s) - {action_executor.summary()}"
+    progress.note("moves", move_summary)
+    progress.note("exif_batching", exif_stats.summary())
+    progress.flush()
+    status_queue.put(None)
+    status_consumer.join()
+    status_queue.close()
+
+    print(move_summary)
+    print(f"Exif batching: {exif_stats.summary()}")
 
     logger.debug("\nFinished executing state machine actions, cleaning up")
 
     for w in exif_consumers:
+        # the consumer's last puts only reach the pipe once its feeder thread flushes on exit - draining before then
+        # can see an empty queue and leave join() waiting on a poison pill that arrives afterwards
+        w.join(timeout=10)
         while not w.input_queue.empty():
             w.input_queue.get()
             w.input_queue.task_done()
@@ -269,36 +345,267 @@ def main():
         w.input_queue.close()
 
         while not w.output_queue.empty():
-            w.output_queue.get()
+            leftover = w.output_queue.get()
+            if isinstance(leftover, imagebatch.SharedBatch):
+                leftover.discard()
             w.output_queue.task_done()
         w.output_queue.join()
         w.output_queue.close()
 
-        w.et.terminate()
-
         w.terminate()
         w.join()
         w.close()
 
+    # the searcher writes its directory listings back to the cache after its poison pill, so give it a chance to
+    search_consumer.join(timeout=60)
     search_consumer.terminate()
-    state_machine.et.terminate()
+    if state_machine.file_cache != None:
+        state_machine.file_cache.close()
 
-    # close the queues so that we can exit cleanly
-    log_file.close()
+    # close the queues so that the next pass (or exit) is clean
     search_tasks.close()
     search_results.close()
-    exif_results.close()
 
     # for w in exif_consumers:
     #    print(w.input_queue.empty())
     #    print(w.output_queue.empty())
 
-    for child in multiprocessing.active_children():
-        print(f"Active child: {child}")
+    log_file.flush()
 
-    logger.debug("\nSuccessfully exiting!")
 
-    exit()
+def log_decisions(
+    state_machine: statemachine.PhotoMachine, destination_ids: list = None
+) -> None:
+    # every contender for every destination (or just the ones in destination_ids), winners and losers both
+    candidates = state_machine.candidates
+    if destination_ids == None:
+        destination_ids = range(len(candidates.destination_paths))
+
+    for destination_id in destination_ids:
+        destination_image = candidates.destination_paths[destination_id]
+        for image_id in candidates.contenders[destination_id]:
+            the_image = candidates.images[image_id]
+            write_log(
+                destination_image=destination_image,
+                source_image=the_image.source_fullpath,
+                winner=str(the_image.winner),
+                reason=the_image.reason,
+                source_size=the_image.file_size,
+                source_hash=the_image.file_hash,
+                source_date=the_image.destination_year
+                + "-"
+                + the_image.destination_month,
+            )
+
+
+def plan_actions(
+    paths: argumentparser.ArgumentParser,
+    state_machine: statemachine.PhotoMachine,
+    progress: metrics.MetricsClient,
+    totals: dict,
+    destination_ids: list = None,
+) -> tuple:
+    # returns (losers to delete, winners to move) for every destination, or just the ones in destination_ids, and
+    # makes sure the folders the winners are going into exist.  pipeline.run_actions() does all the deletes before any
+    # of the moves, so we don't move something and then delete it later - ordering is important
+    candidates = state_machine.candidates
+
+    # second pass for losers (deletes)
+    losers = []
+    for the_image in candidates.loser_images(destination_ids):
+        logger.debug(f"{the_image.source_fullpath}: Deleting loser")
+        losers.append(the_image.source_fullpath)
+
+    # one pass over each destination's winner gets both the folders that need to exist and the moves to make
+    years = {}
+    winners = []
+    for this_winner in candidates.winner_images(destination_ids):
+        if this_winner.source_fullpath == this_winner.destination_fullpath:
+            # don't need to do anything - the file in situ is the right one
+            logger.debug(
+                f"{this_winner.source_fullpath}: Winner already in place, skipping"
+            )
+            if paths.dryrun == False:
+                # still here next time, so keep its stat key - an incremental run won't look at it again
+                record_decision(state_machine, this_winner.source_fullpath, True)
+            continue
+
+        if this_winner.destination_year not in years.keys():
+            years[this_winner.destination_year] = set()
+        years[this_winner.destination_year].add(this_winner.destination_month)
+
+        logger.debug(
+            f"{this_winner.source_fullpath}: Moving winner to {this_winner.destination_fullpath}"
+        )
+        # only tie-breaks get hashed during decide(), so for everything else see if an earlier run hashed it - a copy
+        # across devices can only be verified against a hash it's given
+        file_hash = this_winner.file_hash
+        if file_hash == None and paths.verify and state_machine.file_cache != None:
+            file_hash = state_machine.file_cache.get_hash(
+                this_winner.source_fullpath, algorithm=state_machine.hash_algorithm
+            )
+        winners.append(
+            (
+                this_winner.source_fullpath,
+                this_winner.destination_fullpath,
+                this_winner.file_size,
+                file_hash,
+            )
+        )
+
+    # make sure the destination folders all exist
+    for year in years.keys():
+        this_year_folder = state_machine.destination_root + "/" + year
+
+        if not os.path.isdir(this_year_folder):
+            # it doesn't exist so make it
+            os.mkdir(this_year_folder)
+
+        for month in years[year]:
+            this_month_folder = this_year_folder + "/" + month
+            if not os.path.isdir(this_month_folder):
+                # it doesn't exist so make it
+                os.mkdir(this_month_folder)
+
+    # totals keeps a running count, since --pipeline plans a lot at a time
+    totals["deleted"] += len(losers)
+    totals["moved"] += len(winners)
+    progress.set_total("deleted", totals["deleted"])
+    progress.set_total("moved", totals["moved"])
+    return losers, winners
+
+
+def record_result(
+    paths: argumentparser.ArgumentParser,
+    state_machine: statemachine.PhotoMachine,
+    progress: metrics.MetricsClient,
+    result: tuple,
+) -> None:
+    # one ("deleted", ...) or ("moved", ...) from pipeline.run_actions() - always called from the main thread, since
+    # it's the one that owns the state machine and the cache
+    if result[0] == "deleted":
+        action, source_fullpath, error = result
+        if error != None:
+            print(f"\nFailed to delete {source_fullpath} due to {str(error)}")
+            progress.add("deleted", files=0, errors=1)
+            return
+        elif paths.dryrun == False:
+            state_machine.record_delete(source_fullpath)
+            record_decision(state_machine, source_fullpath)
+
+        progress.add("deleted")
+        return
+
+    action, source_fullpath, destination_fullpath, copied_hash, error = result
+    if error != None:
+        print(
+            f"\nFailed to move {source_fullpath} to {destination_fullpath} due to {str(error)}"
+        )
+        progress.add("moved", files=0, errors=1)
+        return
+    elif paths.dryrun == False:
+        state_machine.record_move(source_fullpath, destination_fullpath)
+        record_decision(state_machine, source_fullpath)
+        if copied_hash != None and state_machine.file_cache != None:
+            # a copy across devices hashed the file on the way through - next run gets it for free
+            state_machine.file_cache.set_hash(destination_fullpath, copied_hash)
+
+    progress.add("moved", bytes=state_machine.candidates.get(source_fullpath).file_size)
+
+
+def run_pipeline(
+    paths: argumentparser.ArgumentParser,
+    state_machine: statemachine.PhotoMachine,
+    search_results,
+    hash_engine: hashengine.HashEngine,
+    action_executor: executor.ActionExecutor,
+    progress: metrics.MetricsClient,
+    totals: dict,
+) -> None:
+    # --pipeline - decide, log and execute each destination as soon as every file that could want it has been
+    # through exif, rather than waiting for the last file of the whole run.  The deletes and moves run on their own
+    # thread so exif keeps going, and each lot's ImageFiles get let go of once they've been recorded
+    candidates = state_machine.candidates
+    tracker = pipeline.CompletionTracker(
+        state_machine.destination_root, state_machine._index_key
+    )
+    action_thread = pipeline.ActionThread(action_executor, paths.dryrun)
+    action_thread.start()
+    registered = [0]
+
+    def drain(wait: bool = False) -> None:
+        for result in action_thread.completed(wait):
+            if result[0] == "done":
+                candidates.release(result[1])
+            else:
+                record_result(paths, state_machine, progress, result)
+
+    def run_destinations(destination_ids: list) -> None:
+        # existing files, hashes, decisions and the log happen here - the deletes and moves go to the action thread
+        if len(destination_ids) == 0:
+            return
+        state_machine.process_exif(destination_ids)
+        state_machine.decide(hash_engine, destination_ids)
+        log_decisions(state_machine, destination_ids)
+        losers, winners = plan_actions(
+            paths, state_machine, progress, totals, destination_ids
+        )
+        action_thread.submit(losers, winners, destination_ids)
+
+    def after_batch(files: list) -> None:
+        # new destinations first, so a name that's just finished doesn't leave one behind
+        for destination_id in range(registered[0], len(candidates.destination_paths)):
+            tracker.add_destination(
+                candidates.destination_paths[destination_id], destination_id
+            )
+        registered[0] = len(candidates.destination_paths)
+
+        tracker.exifed(files)
+        if tracker.ready_count() >= pipeline.DEFAULT_CHUNK_SIZE:
+            run_destinations(tracker.take_ready(candidates))
+        drain()
+
+    files_media, files_skipped = state_machine.add_files(
+        read_ahead(search_results, tracker), after_batch
+    )
+    logger.debug(
+        f"Finished exif analysis. {files_media} valid, {files_skipped} ignored"
+    )
+
+    # the last few that finished, then the ones that had to wait for an input file to move out of their way - the
+    # action thread does each lot in the order it got them, so those input files have gone by the time it gets there
+    run_destinations(tracker.take_ready(candidates))
+    run_destinations(tracker.take_rest())
+    action_thread.finish()
+    drain(wait=True)
+    action_thread.join()
+    drain()
+
+
+def record_decision(
+    state_machine: statemachine.PhotoMachine,
+    source_fullpath: str,
+    keep_key: bool = False,
+) -> None:
+    # remember what happened to the file once it actually has - nothing gets recorded for a dry run or a failure
+    if state_machine.file_cache == None:
+        return
+
+    the_image = state_machine.candidates.get(source_fullpath)
+    key = None
+    if keep_key:
+        try:
+            key = cache.stat_key(source_fullpath)
+        except OSError:
+            return
+
+    state_machine.file_cache.set_decision(
+        source_fullpath,
+        the_image.destination_fullpath,
+        the_image.winner,
+        the_image.reason,
+        key,
+    )
 
 
 if __name__ == "__main__":
@@ -1,5 +1,12 @@
 import logging
 from os import path
+from photo_organiser import cache
+from photo_organiser import executor
+from photo_organiser import externalsort
+from photo_organiser import hashing
+from photo_organiser import workpool
+from photo_organiser import walker
+from photo_organiser import vectordecide
 
 
 class ArgumentParserInputPathNotValid(Exception):
@@ -20,6 +27,25 @@ class ArgumentParser:
     output_path: str = None
     debug: bool = False
     dryrun: bool = False
+    cache_path: str = cache.DEFAULT_CACHE_PATH
+    workers: int = None
+    io_concurrency: int = workpool.DEFAULT_IO_CONCURRENCY
+    src_concurrency: int = executor.DEFAULT_SRC_CONCURRENCY
+    dst_concurrency: int = executor.DEFAULT_DST_CONCURRENCY
+    use_processes: bool = False
+    exif_processes: bool = False
+    native_metadata: bool = False
+    metrics_path: str = None
+    near_distance: int = None
+    sort_run_size: int = externalsort.DEFAULT_RUN_SIZE
+    walkers: int = walker.DEFAULT_WALKERS
+    content_dedupe: bool = False
+    verify: bool = True
+    incremental: bool = False
+    watch: bool = False
+    pipeline: bool = False
+    decide_engine: str = "loop"
+    hash_algorithm: str = hashing.DEFAULT_ALGORITHM
     valid_arguments: bool = True
 
     def __init__(self, arguments):
@@ -29,6 +55,25 @@ class ArgumentParser:
         output_path = self.get_argument(arguments, ["--output", "-o"])
         debug_enabled = self.get_argument(arguments, ["--debug", "-d"])
         dryrun_enabled = self.get_argument(arguments, ["--dryrun"])
+        cache_path = self.get_argument(arguments, ["--cache"])
+        workers = self.get_argument(arguments, ["--workers"])
+        io_concurrency = self.get_argument(arguments, ["--io-concurrency"])
+        src_concurrency = self.get_argument(arguments, ["--src-concurrency"])
+        dst_concurrency = self.get_argument(arguments, ["--dst-concurrency"])
+        pool_type = self.get_argument(arguments, ["--pool"])
+        exif_type = self.get_argument(arguments, ["--exif"])
+        native_metadata = self.get_argument(arguments, ["--native-meta"])
+        metrics_path = self.get_argument(arguments, ["--metrics"])
+        near_distance = self.get_argument(arguments, ["--near"])
+        sort_run_size = self.get_argument(arguments, ["--sort-run"])
+        walkers = self.get_argument(arguments, ["--walkers"])
+        content_dedupe = self.get_argument(arguments, ["--dedupe"])
+        verify = self.get_argument(arguments, ["--verify"])
+        incremental = self.get_argument(arguments, ["--incremental"])
+        watch = self.get_argument(arguments, ["--watch"])
+        pipeline = self.get_argument(arguments, ["--pipeline"])
+        decide_engine = self.get_argument(arguments, ["--decide"])
+        hash_algorithm = self.get_argument(arguments, ["--hash"])
 
         if incoming_path == False or output_path == False:
             self.valid_arguments = False
@@ -87,8 +132,175 @@ class ArgumentParser:
         else:
             self.dryrun = False
 
+        # "--cache none" turns the cache off entirely
+        if cache_path != False:
+            if cache_path.lower() == "none":
+                self.cache_path = None
+            else:
+                self.cache_path = cache_path.replace("\\", "/")
+        else:
+            self.cache_path = cache.DEFAULT_CACHE_PATH
+
+        # per-stage counts, throughput and timings for the run get written here as JSON
+        if metrics_path != False:
+            self.metrics_path = metrics_path.replace("\\", "/")
+        else:
+            self.metrics_path = None
+
+        # None means one worker per CPU
+        self.workers = self.get_int_argument(workers, "--workers", None)
+        self.io_concurrency = self.get_int_argument(
+            io_concurrency, "--io-concurrency", workpool.DEFAULT_IO_CONCURRENCY
+        )
+        # how many deletes/moves import.py lets hit each source device and each destination device at once
+        self.src_concurrency = self.get_int_argument(
+            src_concurrency, "--src-concurrency", executor.DEFAULT_SRC_CONCURRENCY
+        )
+        self.dst_concurrency = self.get_int_argument(
+            dst_concurrency, "--dst-concurrency", executor.DEFAULT_DST_CONCURRENCY
+        )
+        self.walkers = self.get_int_argument(
+            walkers, "--walkers", walker.DEFAULT_WALKERS
+        )
+        # find_duplicates.py also groups images whose perceptual hashes are within this many bits - None means it doesn't
+        self.near_distance = self.get_int_argument(near_distance, "--near", None)
+        # how many partial hashes find_duplicates.py holds in memory before sorting them out to disk
+        self.sort_run_size = self.get_int_argument(
+            sort_run_size, "--sort-run", externalsort.DEFAULT_RUN_SIZE
+        )
+
+        self.content_dedupe = self.get_bool_argument(content_dedupe, "--dedupe", False)
+
+        # moves across devices hash what they copy and check it against the hash from decide().  Turning it off lets
+        # the kernel do the copy without the bytes coming through python
+        self.verify = self.get_bool_argument(verify, "--verify", True)
+
+        # only walk directories that have changed since the last run, and skip files that have already been decided
+        # watch mode keeps going after the first pass, and every pass after that is incremental anyway
+        self.watch = self.get_bool_argument(watch, "--watch", False)
+        self.incremental = self.get_bool_argument(incremental, "--incremental", False)
+        if self.watch:
+            self.incremental = True
+        if self.incremental and self.cache_path == None:
+            # the last run's state lives in the cache, so there's nothing to compare against
+            logging.error(
+                f"--incremental and --watch need the cache - running a full import"
+            )
+            self.incremental = False
+
+        if pool_type != False:
+            if pool_type.lower() == "process":
+                self.use_processes = True
+            elif pool_type.lower() == "thread":
+                self.use_processes = False
+            else:
+                logging.error(f"Correct usage:")
+                logging.error(
+                    f'{__file__} --input "c:\\some directory" --output c:\\myphotos --pool thread|process'
+                )
+                self.use_processes = False
+        else:
+            self.use_processes = False
+
+        # thread drives each exiftool from a thread in import.py, process gives each one its own python process
+        if exif_type != False:
+            if exif_type.lower() == "process":
+                self.exif_processes = True
+            elif exif_type.lower() == "thread":
+                self.exif_processes = False
+            else:
+                logging.error(f"Correct usage:")
+                logging.error(
+                    f'{__file__} --input "c:\\some directory" --output c:\\myphotos --exif thread|process'
+                )
+                self.exif_processes = False
+        else:
+            self.exif_processes = False
+
+        # decide and execute each destination as soon as nothing else can turn up for it, rather than after all the exif
+        # --dedupe needs every winner at once, and the --exif process consumers don't tell import.py which files they've
+        # finished with, so either of those means doing it all in one go at the end
+        self.pipeline = self.get_bool_argument(pipeline, "--pipeline", False)
+        if self.pipeline and self.content_dedupe:
+            logging.error(
+                f"--pipeline can't be used with --dedupe - deciding at the end"
+            )
+            self.pipeline = False
+        if self.pipeline and self.exif_processes:
+            logging.error(
+                f"--pipeline can't be used with --exif process - deciding at the end"
+            )
+            self.pipeline = False
+
+        # read JPEG/HEIC EXIF dates and MP4/MOV movie header dates in python, only sending exiftool what that can't do
+        self.native_metadata = self.get_bool_argument(
+            native_metadata, "--native-meta", False
+        )
+
+        # vector settles every destination at once with numpy, so it's the default whenever numpy is there
+        if vectordecide.available():
+            self.decide_engine = "vector"
+        else:
+            self.decide_engine = "loop"
+        if decide_engine != False:
+            if decide_engine.lower() in ["loop", "vector"]:
+                self.decide_engine = decide_engine.lower()
+            else:
+                logging.error(f"Correct usage:")
+                logging.error(
+                    f'{__file__} --input "c:\\some directory" --output c:\\myphotos --decide loop|vector'
+                )
+
+        # sha256 for archiving, blake2b or xxh128 (if xxhash is installed) when it's just about finding duplicates fast
+        self.hash_algorithm = hashing.DEFAULT_ALGORITHM
+        if hash_algorithm != False:
+            if hash_algorithm.lower() in hashing.ALGORITHMS:
+                self.hash_algorithm = hash_algorithm.lower()
+            else:
+                logging.error(f"Correct usage:")
+                logging.error(
+                    f'{__file__} --input "c:\\some directory" --output c:\\myphotos --hash {"|".join(hashing.ALGORITHMS)}'
+                )
+
         self.valid_arguments = True
 
+    def get_bool_argument(self, value, argument_name: str, default: bool) -> bool:
+        # value is whatever get_argument() found - False if the argument wasn't passed
+        if value == False:
+            return default
+
+        if value.lower() == "true":
+            return True
+        elif value.lower() == "false":
+            return False
+
+        logging.error(f"Correct usage:")
+        logging.error(
+            f'{__file__} --input "c:\\some directory" --output c:\\myphotos {argument_name} true'
+        )
+        # its not enough of an issue that it should stop execution
+        return default
+
+    def get_int_argument(self, value, argument_name: str, default: int) -> int:
+        # value is whatever get_argument() found - False if the argument wasn't passed
+        if value == False:
+            return default
+
+        try:
+            int_value = int(value)
+        except ValueError:
+            int_value = 0
+
+        if int_value < 1:
+            logging.error(f"Correct usage:")
+            logging.error(
+                f'{__file__} --input "c:\\some directory" --output c:\\myphotos {argument_name} 4'
+            )
+            # its not enough of an issue that it should stop execution
+            return default
+
+        return int_value
+
     def get_argument(self, arguments: list, search_argument: list) -> bool:
         found = False
         for s in search_argument:
@@ -0,0 +1,249 @@
+import logging
+import os
+import sqlite3
+import json
+from typing import Tuple
+from photo_organiser import hashing
+from photo_organiser import imagefile
+
+logger = logging.getLogger("cache")
+logger.setLevel(logging.WARN)
+
+DEFAULT_CACHE_PATH = "photo_organiser.cache"
+
+
+def normalise_path(file_fullpath: str) -> str:
+    # exiftool hands back forward slashes on Windows, so store everything that way or nothing would ever hit
+    return file_fullpath.replace(os.sep, "/")
+
+
+def stat_key(file_fullpath: str, stat_result: os.stat_result = None) -> Tuple:
+    # the identity of a file as far as the cache is concerned - if any of these change, the cached entry is stale
+    if stat_result == None:
+        stat_result = os.stat(file_fullpath)
+    return (stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino)
+
+
+class FileCache:
+    # persistent store of hashes and exif metadata, so reruns over an unchanged tree don't redo the expensive work
+    # each process needs its own FileCache - sqlite connections can't be shared across a fork
+    path: str
+    connection: sqlite3.Connection
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        self.path = path
+        # lots of ExifConsumers write at once, so wait for the lock rather than failing
+        self.connection = sqlite3.connect(path, timeout=120)
+        # WAL lets readers carry on while one process is writing
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                file_hash TEXT,
+                metadata TEXT
+            )""")
+        # what each directory looked like last time it was walked - if its mtime hasn't moved, nothing's been added
+        # to or removed from it, so an incremental walk can use this instead of listing it again
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS directories (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                subdirs TEXT NOT NULL,
+                files TEXT NOT NULL
+            )""")
+        # what happened to each file that got acted on.  Files left where they are keep their stat key, so an
+        # incremental run can tell they've already been dealt with
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS decisions (
+                source TEXT PRIMARY KEY,
+                destination TEXT NOT NULL,
+                winner INTEGER NOT NULL,
+                reason TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER
+            )""")
+        # perceptual hashes for find_duplicates.py --near, keyed on the content hash of the file rather than its path - a
+        # copy that's been moved or renamed doesn't need decoding again, and neither do byte-for-byte duplicates.  Hashes
+        # other than sha256 carry their algorithm, so the same file hashed two ways gets two rows rather than a mix-up
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS perceptual (
+                file_hash TEXT PRIMARY KEY,
+                dhash TEXT NOT NULL
+            )""")
+        self.connection.commit()
+
+    def _lookup(self, file_fullpath: str, column: str, key: Tuple):
+        file_fullpath = normalise_path(file_fullpath)
+        row = self.connection.execute(
+            f"SELECT size, mtime_ns, inode, {column} FROM files WHERE path = ?",
+            (file_fullpath,),
+        ).fetchone()
+
+        if row == None or tuple(row[:3]) != key:
+            # never seen it, or it has changed since it was cached
+            return None
+
+        return row[3]
+
+    def _store(self, file_fullpath: str, column: str, value, key: Tuple) -> None:
+        # if the file has changed, anything else cached against the old version gets thrown away
+        file_fullpath = normalise_path(file_fullpath)
+        other_column = "metadata" if column == "file_hash" else "file_hash"
+        self.connection.execute(
+            f"""INSERT INTO files (path, size, mtime_ns, inode, {column}) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET
+                    {other_column} = CASE WHEN size = excluded.size AND mtime_ns = excluded.mtime_ns AND inode = excluded.inode
+                        THEN {other_column} ELSE NULL END,
+                    {column} = excluded.{column},
+                    size = excluded.size,
+                    mtime_ns = excluded.mtime_ns,
+                    inode = excluded.inode""",
+            (file_fullpath, key[0], key[1], key[2], value),
+        )
+
+    def get_hash(
+        self,
+        file_fullpath: str,
+        key: Tuple = None,
+        algorithm: str = hashing.DEFAULT_ALGORITHM,
+    ) -> str:
+        try:
+            if key == None:
+                key = stat_key(file_fullpath)
+        except OSError:
+            return None
+        file_hash = self._lookup(file_fullpath, "file_hash", key)
+
+        # a hash made some other way is as good as a miss - it gets redone and replaced
+        if file_hash != None and hashing.algorithm_of(file_hash) != algorithm:
+            return None
+        return file_hash
+
+    def set_hash(self, file_fullpath: str, file_hash: str, key: Tuple = None) -> None:
+        try:
+            if key == None:
+                key = stat_key(file_fullpath)
+        except OSError:
+            return
+        self._store(file_fullpath, "file_hash", file_hash, key)
+
+    def get_metadata(self, file_fullpath: str, key: Tuple = None) -> dict:
+        try:
+            if key == None:
+                key = stat_key(file_fullpath)
+        except OSError:
+            return None
+
+        metadata = self._lookup(file_fullpath, "metadata", key)
+        if metadata == None:
+            return None
+
+        metadata = json.loads(metadata)
+        metadata["SourceFile"] = normalise_path(file_fullpath)
+        return metadata
+
+    def set_metadata(
+        self, file_fullpath: str, metadata: dict, key: Tuple = None
+    ) -> None:
+        try:
+            if key == None:
+                key = stat_key(file_fullpath)
+        except OSError:
+            return
+
+        # only keep the tags ImageFile actually reads - the rest is just bulk
+        trimmed = {
+            tag: metadata[tag] for tag in imagefile.METADATA_TAGS if tag in metadata
+        }
+        self._store(file_fullpath, "metadata", json.dumps(trimmed), key)
+
+    def split_metadata(self, files: list) -> Tuple[list, list]:
+        # returns the metadata dicts we already have, and the list of files that still need exiftool
+        hits = []
+        misses = []
+        for file_fullpath in files:
+            metadata = self.get_metadata(file_fullpath)
+            if metadata == None:
+                misses.append(file_fullpath)
+            else:
+                hits.append(metadata)
+
+        return hits, misses
+
+    def get_perceptual(self, file_hash: str) -> int:
+        row = self.connection.execute(
+            "SELECT dhash FROM perceptual WHERE file_hash = ?", (file_hash,)
+        ).fetchone()
+        if row == None:
+            return None
+        # stored as hex - a 64 bit dhash doesn't fit in a signed sqlite integer
+        return int(row[0], 16)
+
+    def set_perceptual(self, file_hash: str, dhash: int) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO perceptual (file_hash, dhash) VALUES (?, ?)",
+            (file_hash, format(dhash, "x")),
+        )
+
+    def get_directories(self) -> dict:
+        # path -> (mtime_ns, subdirectory names, file names) for every directory walked before
+        directories = {}
+        for path, mtime_ns, subdirs, files in self.connection.execute(
+            "SELECT path, mtime_ns, subdirs, files FROM directories"
+        ):
+            directories[path] = (mtime_ns, json.loads(subdirs), json.loads(files))
+        return directories
+
+    def set_directory(
+        self, dir_fullpath: str, mtime_ns: int, subdirs: list, files: list
+    ) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO directories (path, mtime_ns, subdirs, files) VALUES (?, ?, ?, ?)",
+            (
+                normalise_path(dir_fullpath),
+                mtime_ns,
+                json.dumps(subdirs),
+                json.dumps(files),
+            ),
+        )
+
+    def get_decided(self) -> dict:
+        # path -> stat key for every file that was decided on and then left where it was
+        decided = {}
+        for source, size, mtime_ns, inode in self.connection.execute(
+            "SELECT source, size, mtime_ns, inode FROM decisions WHERE mtime_ns IS NOT NULL"
+        ):
+            decided[source] = (size, mtime_ns, inode)
+        return decided
+
+    def set_decision(
+        self,
+        source_fullpath: str,
+        destination_fullpath: str,
+        winner: bool,
+        reason: str,
+        key: Tuple = None,
+    ) -> None:
+        # key is only worth passing for files that are still at source_fullpath afterwards
+        if key == None:
+            key = (None, None, None)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO decisions (source, destination, winner, reason, size, mtime_ns, inode) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                normalise_path(source_fullpath),
+                normalise_path(destination_fullpath),
+                winner,
+                reason,
+                key[0],
+                key[1],
+                key[2],
+            ),
+        )
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
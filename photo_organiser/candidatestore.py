@@ -0,0 +1,215 @@
+import logging
+import array
+from typing import Iterator, Tuple
+from photo_organiser import hashing
+from photo_organiser import imagefile
+
+logger = logging.getLogger("candidatestore")
+logger.setLevel(logging.WARN)
+
+NO_WINNER = -1
+NO_DATE = -1
+
+
+def date_key(timestamp_raw: str) -> int:
+    # "YYYY:MM:DD HH:MM:SS" as the integer YYYYMMDDHHMMSS - sorts the same as the datetime would, without building one
+    if timestamp_raw == None:
+        return NO_DATE
+    return int(
+        timestamp_raw[0:4]
+        + timestamp_raw[5:7]
+        + timestamp_raw[8:10]
+        + timestamp_raw[11:13]
+        + timestamp_raw[14:16]
+        + timestamp_raw[17:19]
+    )
+
+
+class CandidateStore:
+    # every candidate for every destination, each one known by an integer id in the order it was added
+    # the things decide() compares on (size, date, hash, whether it's already in the destination) are kept in flat
+    # arrays indexed by id, so the hot loop never has to go through a path string or an ImageFile to get at them
+    # each path string is held once - source_ids and destination_ids map them to ids, everything else uses the ids
+    images: list
+    sizes: array.array
+    dates: array.array
+    hashes: list
+    in_destination: array.array
+    destination_of: array.array
+    source_ids: dict
+
+    destination_paths: list
+    destination_ids: dict
+    contenders: list
+    winners: array.array
+
+    def __init__(self, destination_root: str):
+        self.destination_root = destination_root
+
+        self.images = []
+        self.sizes = array.array("q")
+        self.dates = array.array("q")
+        self.hashes = []
+        self.in_destination = array.array("b")
+        self.destination_of = array.array("q")
+        self.source_ids = {}
+
+        self.destination_paths = []
+        self.destination_ids = {}
+        self.contenders = []
+        self.winners = array.array("q")
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def add(self, the_image: imagefile.ImageFile) -> Tuple[int, bool]:
+        # returns (destination id, whether this is the first candidate for that destination)
+        destination_id, new_destination, added = self._place(
+            the_image, len(self.images)
+        )
+        if added:
+            self._extend([the_image], [destination_id])
+        return destination_id, new_destination
+
+    def add_batch(self, images: list) -> list:
+        # add() for a whole batch, in order - each array gets extended once per batch instead of once per file
+        # returns the ids of the destinations this batch was the first to want
+        new_destinations = []
+        added = []
+        added_destinations = []
+        for the_image in images:
+            destination_id, new_destination, was_added = self._place(
+                the_image, len(self.images) + len(added)
+            )
+            if new_destination:
+                new_destinations.append(destination_id)
+            if was_added:
+                added.append(the_image)
+                added_destinations.append(destination_id)
+
+        self._extend(added, added_destinations)
+        return new_destinations
+
+    def _place(
+        self, the_image: imagefile.ImageFile, image_id: int
+    ) -> Tuple[int, bool, bool]:
+        # gives the image image_id and works out its destination id - returns (destination id, whether it's a new
+        # destination, whether the image is new).  Everything kept per candidate gets filled in by _extend()
+        if the_image.source_fullpath in self.source_ids:
+            logger.debug(f"{the_image.source_fullpath}: Already a candidate, skipping")
+            return (
+                self.destination_of[self.source_ids[the_image.source_fullpath]],
+                False,
+                False,
+            )
+
+        new_destination = False
+        destination_id = self.destination_ids.get(the_image.destination_fullpath)
+        if destination_id == None:
+            destination_id = len(self.destination_paths)
+            self.destination_ids[the_image.destination_fullpath] = destination_id
+            self.destination_paths.append(the_image.destination_fullpath)
+            self.contenders.append([])
+            self.winners.append(NO_WINNER)
+            new_destination = True
+
+        self.source_ids[the_image.source_fullpath] = image_id
+        self.contenders[destination_id].append(image_id)
+        return destination_id, new_destination, True
+
+    def _extend(self, images: list, destination_ids: list) -> None:
+        # the per candidate arrays, for images _place() has just given the next ids to
+        self.images.extend(images)
+        self.sizes.extend([the_image.file_size for the_image in images])
+        self.dates.extend([date_key(the_image.tag_date_raw) for the_image in images])
+        self.hashes.extend([the_image.file_hash for the_image in images])
+        self.in_destination.extend(
+            [
+                the_image.destination_root in the_image.source_fullpath
+                for the_image in images
+            ]
+        )
+        self.destination_of.extend(destination_ids)
+
+    def id_of(self, source_fullpath: str) -> int:
+        return self.source_ids[source_fullpath]
+
+    def get(self, source_fullpath: str) -> imagefile.ImageFile:
+        return self.images[self.source_ids[source_fullpath]]
+
+    def refresh(self, image_id: int) -> None:
+        # the ImageFile got its metadata after it was added (a stat-only candidate) - pick up the date
+        self.dates[image_id] = date_key(self.images[image_id].tag_date_raw)
+
+    def get_hash(
+        self,
+        image_id: int,
+        file_cache=None,
+        algorithm: str = hashing.DEFAULT_ALGORITHM,
+    ) -> str:
+        if self.hashes[image_id] == None:
+            self.hashes[image_id] = self.images[image_id].get_hash(
+                file_cache, algorithm
+            )
+        return self.hashes[image_id]
+
+    def set_winner(self, image_id: int, reason: str) -> None:
+        self.images[image_id].set_winner(True, reason)
+        self.winners[self.destination_of[image_id]] = image_id
+
+    def set_loser(self, image_id: int, reason: str) -> None:
+        self.images[image_id].set_winner(False, reason)
+        destination_id = self.destination_of[image_id]
+        if self.winners[destination_id] == image_id:
+            self.winners[destination_id] = NO_WINNER
+
+    def set_winners(self, winner_ids: list, destination_ids: list = None) -> None:
+        # one winner id per destination, for when something has settled every contest at once - or just the
+        # destinations in destination_ids, in the same order
+        if destination_ids == None:
+            self.winners = array.array("q", winner_ids)
+            return
+
+        for destination_id, image_id in zip(destination_ids, winner_ids):
+            self.winners[destination_id] = image_id
+
+    def winner_images(
+        self, destination_ids: list = None
+    ) -> Iterator[imagefile.ImageFile]:
+        # straight from each destination's winner - no need to look at the losers at all
+        if destination_ids == None:
+            winners = self.winners
+        else:
+            winners = [
+                self.winners[destination_id] for destination_id in destination_ids
+            ]
+
+        for image_id in winners:
+            if image_id != NO_WINNER and self.images[image_id] != None:
+                yield self.images[image_id]
+
+    def loser_images(
+        self, destination_ids: list = None
+    ) -> Iterator[imagefile.ImageFile]:
+        if destination_ids == None:
+            images = self.images
+        else:
+            images = (
+                self.images[image_id]
+                for destination_id in destination_ids
+                for image_id in self.contenders[destination_id]
+            )
+
+        for the_image in images:
+            if the_image != None and the_image.winner == False:
+                yield the_image
+
+    def release(self, destination_ids: list) -> None:
+        # import.py --pipeline is done with these destinations - logged, moved and recorded - so let go of their
+        # ImageFiles.  The ids stay put (so nothing else moves) and so do the source paths, so a file turning up twice
+        # still gets spotted
+        for destination_id in destination_ids:
+            for image_id in self.contenders[destination_id]:
+                self.images[image_id] = None
+                self.hashes[image_id] = None
+            self.winners[destination_id] = NO_WINNER
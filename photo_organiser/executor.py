@@ -0,0 +1,159 @@
+import logging
+import os
+import collections
+import time
+from typing import Iterable, Iterator, Tuple
+from photo_organiser import hashing
+from photo_organiser import mover
+from photo_organiser import workpool
+
+logger = logging.getLogger("executor")
+logger.setLevel(logging.WARN)
+
+DEFAULT_SRC_CONCURRENCY = workpool.DEFAULT_IO_CONCURRENCY
+DEFAULT_DST_CONCURRENCY = workpool.DEFAULT_IO_CONCURRENCY
+
+
+# these need to live at module level so they can be pickled across to a process pool
+def delete_file(source_fullpath: str) -> None:
+    os.remove(source_fullpath)
+
+
+class ActionExecutor:
+    # runs the deletes and moves decide() came up with on a pool, with separate caps on how many operations hit each
+    # source device and each destination device at once.  A move across volumes is a full copy, so a slow USB drive
+    # at one end shouldn't stop other drives from getting on with it
+    pool: workpool.DevicePool
+    verify: bool
+    algorithm: str
+    bytes_moved: int
+    move_seconds: float
+    outcomes: collections.Counter
+
+    def __init__(
+        self,
+        workers: int = None,
+        src_concurrency: int = DEFAULT_SRC_CONCURRENCY,
+        dst_concurrency: int = DEFAULT_DST_CONCURRENCY,
+        use_processes: bool = False,
+        verify: bool = True,
+        algorithm: str = hashing.DEFAULT_ALGORITHM,
+    ):
+        self.pool = workpool.DevicePool(
+            workers, {"src": src_concurrency, "dst": dst_concurrency}, use_processes
+        )
+        self.verify = verify
+        # verified copies get hashed the same way decide() hashed the source, or they'd never match
+        self.algorithm = algorithm
+        self.bytes_moved = 0
+        self.outcomes = collections.Counter()
+        self.move_seconds = 0.0
+
+        # every file in a folder is on the same device, so only stat each folder once
+        self._folder_devices = {}
+
+    def device_of(self, file_fullpath: str) -> int:
+        folder = os.path.dirname(file_fullpath)
+        if folder not in self._folder_devices:
+            try:
+                self._folder_devices[folder] = os.stat(folder).st_dev
+            except OSError:
+                self._folder_devices[folder] = None
+        return self._folder_devices[folder]
+
+    def delete_files(self, files: Iterable[str]) -> Iterator[Tuple[str, Exception]]:
+        # yields (path, error) as each delete finishes - error is None if it worked
+        # doesn't return until every delete is done, so anything run after it can't race a delete
+        jobs = (
+            (
+                source_fullpath,
+                (("src", self.device_of(source_fullpath)),),
+                (source_fullpath,),
+            )
+            for source_fullpath in files
+        )
+        for source_fullpath, result, error in self.pool.imap_unordered(
+            delete_file, jobs
+        ):
+            yield source_fullpath, error
+
+    def move_files(
+        self, moves: Iterable[Tuple[str, str, int, str]]
+    ) -> Iterator[Tuple[str, str, str, Exception]]:
+        # moves are (source, destination, size, hash if we already know it)
+        # yields (source, destination, hash of the copy if one was made, error) as each move finishes
+        moves = list(moves)
+        start = time.perf_counter()
+
+        # a file that's already in the library can be moved somewhere else while another file moves into where it
+        # was.  Run in waves so nothing lands on a path until whatever was sitting there has moved out of the way
+        while len(moves) > 0:
+            pending_sources = set(this_move[0] for this_move in moves)
+            this_wave = []
+            next_wave = []
+            for this_move in moves:
+                if this_move[1] in pending_sources and this_move[1] != this_move[0]:
+                    next_wave.append(this_move)
+                else:
+                    this_wave.append(this_move)
+
+            if len(this_wave) == 0:
+                # a cycle - nothing can safely go first, so fall back to doing them one at a time in order
+                logger.warning(
+                    f"{len(next_wave)} moves depend on each other, running them one at a time"
+                )
+                this_wave = next_wave[:1]
+                next_wave = next_wave[1:]
+
+            yield from self._run_moves(this_wave)
+            moves = next_wave
+
+        self.move_seconds += time.perf_counter() - start
+
+    def _run_moves(self, moves: list) -> Iterator[Tuple[str, str, str, Exception]]:
+        sizes = {}
+        jobs = []
+        for source_fullpath, destination_fullpath, file_size, file_hash in moves:
+            sizes[source_fullpath] = file_size
+            jobs.append(
+                (
+                    (source_fullpath, destination_fullpath),
+                    (
+                        ("src", self.device_of(source_fullpath)),
+                        ("dst", self.device_of(destination_fullpath)),
+                    ),
+                    (
+                        source_fullpath,
+                        destination_fullpath,
+                        file_hash,
+                        self.verify,
+                        self.algorithm,
+                    ),
+                )
+            )
+
+        for tag, result, error in self.pool.imap_unordered(mover.move_file, jobs):
+            source_fullpath, destination_fullpath = tag
+            copied_hash = None
+            if error == None:
+                outcome, copied_hash = result
+                self.outcomes[outcome] += 1
+                self.bytes_moved += sizes[source_fullpath]
+            yield source_fullpath, destination_fullpath, copied_hash, error
+
+    def summary(self) -> str:
+        return (
+            f"{self.outcomes[mover.RENAMED]} renamed on the same device, "
+            f"{self.outcomes[mover.COPIED_VERIFIED]} copied across devices and verified, "
+            f"{self.outcomes[mover.COPIED]} copied across devices without verifying, "
+            f"{self.outcomes[mover.SOURCE_KEPT]} copied across devices but the original couldn't be removed"
+        )
+
+    def throughput(self) -> float:
+        # MB/s across the whole move stage
+        if self.move_seconds == 0:
+            return 0.0
+        return self.bytes_moved / 1024 / 1024 / self.move_seconds
+
+    def close(self) -> None:
+        self.pool.close()
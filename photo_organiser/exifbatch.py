@@ -0,0 +1,166 @@
+import logging
+import time
+from photo_organiser import imagefile
+from photo_organiser import nativemeta
+
+logger = logging.getLogger("exifbatch")
+logger.setLevel(logging.WARN)
+
+# how long we'd like each exiftool call to take - long enough to amortise the call overhead, short enough that one
+# slow batch doesn't leave the other consumers idle at the end of the run
+DEFAULT_TARGET_SECONDS = 2.0
+DEFAULT_INITIAL_SIZE = 100
+MIN_BATCH_SIZE = 1
+MAX_BATCH_SIZE = 400
+
+# how much weight the newest batch gets in the running averages
+SMOOTHING = 0.3
+
+
+class BatchStats:
+    # counters for one or more batchers - small enough to put on a queue at the end of a run
+    def __init__(self):
+        self.batches = 0
+        self.files = 0
+        self.exiftool_calls = 0
+        self.retry_calls = 0
+        self.failed_files = 0
+        self.native_files = 0
+        self.smallest_batch = None
+        self.largest_batch = 0
+        self.final_batch_sizes = []
+
+    def record_batch(self, batch_size: int) -> None:
+        self.batches += 1
+        self.files += batch_size
+        self.largest_batch = max(self.largest_batch, batch_size)
+        if self.smallest_batch == None or batch_size < self.smallest_batch:
+            self.smallest_batch = batch_size
+
+    def merge(self, other: "BatchStats") -> None:
+        self.batches += other.batches
+        self.files += other.files
+        self.exiftool_calls += other.exiftool_calls
+        self.retry_calls += other.retry_calls
+        self.failed_files += other.failed_files
+        self.native_files += other.native_files
+        self.largest_batch = max(self.largest_batch, other.largest_batch)
+        if other.smallest_batch != None and (
+            self.smallest_batch == None or other.smallest_batch < self.smallest_batch
+        ):
+            self.smallest_batch = other.smallest_batch
+        self.final_batch_sizes.extend(other.final_batch_sizes)
+
+    def summary(self) -> str:
+        if self.batches == 0:
+            return f"no exif batches run, {self.native_files} files read natively"
+
+        return (
+            f"{self.files} files in {self.batches} batches "
+            f"(size {self.smallest_batch}-{self.largest_batch}, mean {round(self.files / self.batches, 1)}, "
+            f"final {self.final_batch_sizes}), "
+            f"{self.exiftool_calls} exiftool calls of which {self.retry_calls} were retries, "
+            f"{self.failed_files} files failed, {self.native_files} files read natively"
+        )
+
+
+class AdaptiveBatcher:
+    # works out how many files to hand exiftool at once, based on how long files have been taking and how often they fail
+    # when a batch fails it gets split in half until the bad file is found, rather than re-running every file one by one
+    batch_size: int
+    target_seconds: float
+    seconds_per_file: float = None
+    error_rate: float = 0.0
+    stats: BatchStats
+
+    # try nativemeta before exiftool - anything it isn't sure about still goes to exiftool
+    native: bool = False
+
+    def __init__(
+        self,
+        target_seconds: float = DEFAULT_TARGET_SECONDS,
+        initial_size: int = DEFAULT_INITIAL_SIZE,
+        min_size: int = MIN_BATCH_SIZE,
+        max_size: int = MAX_BATCH_SIZE,
+        native: bool = False,
+    ):
+        self.target_seconds = target_seconds
+        self.batch_size = initial_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.stats = BatchStats()
+        self.native = native
+
+    def extract(self, et, files: list) -> list:
+        # returns the metadata for every file exiftool could read, in whatever sized chunks currently make sense
+        # files read natively never count towards the batch timings - they'd make exiftool look a lot quicker than it is
+        metadata = []
+        if self.native:
+            metadata, files = nativemeta.split_native(files)
+            self.stats.native_files += len(metadata)
+
+        position = 0
+        while position < len(files):
+            this_batch = files[position : position + self.batch_size]
+            position += len(this_batch)
+
+            start = time.perf_counter()
+            failures_before = self.stats.failed_files
+            metadata.extend(self._extract_bisect(et, this_batch))
+            self._record(
+                len(this_batch),
+                time.perf_counter() - start,
+                self.stats.failed_files - failures_before,
+            )
+
+        return metadata
+
+    def _extract_bisect(self, et, files: list) -> list:
+        self.stats.exiftool_calls += 1
+        try:
+            return imagefile.extract_metadata(et, files)
+        except Exception as e:
+            pass
+
+        if len(files) == 1:
+            self.stats.failed_files += 1
+            print(
+                f"Error on {files[0]} - usually this is caused by bad characters in the filesystem path"
+            )
+            return []
+
+        # one bad file fails the whole call, so split it and try each half - log2(n) extra calls instead of n
+        self.stats.retry_calls += 2
+        middle = len(files) // 2
+        return self._extract_bisect(et, files[:middle]) + self._extract_bisect(
+            et, files[middle:]
+        )
+
+    def _record(self, files: int, seconds: float, failures: int) -> None:
+        self.stats.record_batch(files)
+
+        this_rate = seconds / files
+        if self.seconds_per_file == None:
+            self.seconds_per_file = this_rate
+        else:
+            self.seconds_per_file = (
+                SMOOTHING * this_rate + (1 - SMOOTHING) * self.seconds_per_file
+            )
+        self.error_rate = SMOOTHING * (failures / files) + (1 - SMOOTHING) * (
+            self.error_rate
+        )
+
+        # as many files as fit in the target time...
+        new_size = self.target_seconds / max(self.seconds_per_file, 1e-6)
+
+        # ...but if files keep failing, keep batches small enough that most of them don't contain a bad one
+        if self.error_rate > 0:
+            new_size = min(new_size, 1 / self.error_rate)
+
+        # don't swing too far on one measurement
+        new_size = min(new_size, self.batch_size * 2)
+        self.batch_size = int(max(self.min_size, min(self.max_size, new_size)))
+
+    def final_stats(self) -> BatchStats:
+        self.stats.final_batch_sizes = [self.batch_size]
+        return self.stats
@@ -0,0 +1,98 @@
+import logging
+import os
+import queue
+import collections
+from concurrent import futures
+from typing import Iterable, Iterator, Tuple
+from photo_organiser import exifbatch
+
+logger = logging.getLogger("exifpool")
+logger.setLevel(logging.WARN)
+
+
+def default_size() -> int:
+    # same as the old one-consumer-process-per-exiftool default
+    return (os.cpu_count() or 4) * 2
+
+
+class ExifToolPool:
+    # size exiftool processes that stay running for as long as the pool does (ExifToolHelper keeps exiftool going
+    # with -stay_open), each one driven by a thread in this process.  exiftool does all the actual reading in its own
+    # process, so a thread sat waiting on it costs nothing - no python processes to fork and no ImageFiles to pickle
+    # every exiftool gets its own batcher, since how long a batch takes is down to which exiftool ran it
+    size: int
+    executor: futures.ThreadPoolExecutor
+
+    def __init__(self, size: int = None, native: bool = False):
+        # imported here rather than at the top, so statemachine (and anything that only decides) doesn't need
+        # pyexiftool installed until a pool actually gets made
+        import exiftool
+
+        if size == None:
+            size = default_size()
+        self.size = size
+
+        self._tools = []
+        self._idle = queue.Queue()
+        for i in range(size):
+            tool = (exiftool.ExifToolHelper(), exifbatch.AdaptiveBatcher(native=native))
+            self._tools.append(tool)
+            self._idle.put(tool)
+
+        self.executor = futures.ThreadPoolExecutor(
+            max_workers=size, thread_name_prefix="exiftool"
+        )
+
+    @property
+    def batch_size(self) -> int:
+        # a rough size for callers cutting up their own work - each batcher re-cuts whatever it's handed anyway
+        return max(
+            exifbatch.MIN_BATCH_SIZE,
+            sum(batcher.batch_size for et, batcher in self._tools) // self.size,
+        )
+
+    def extract(self, files: list) -> list:
+        # borrows whichever exiftool is free - safe to call from any number of threads at once
+        if len(files) == 0:
+            return []
+
+        et, batcher = self._idle.get()
+        try:
+            return batcher.extract(et, files)
+        finally:
+            self._idle.put((et, batcher))
+
+    def imap(self, jobs: Iterable[Tuple]) -> Iterator[Tuple]:
+        # jobs are (tag, files) - yields (tag, metadata) in the same order the jobs came in, so the same input always
+        # gets added in the same order however the batches happen to finish
+        # jobs only get read a little ahead of what's finished, so the caller can hand in a generator that's still
+        # being fed (eg. by the walker)
+        max_in_flight = self.size * 2
+        in_flight = collections.deque()
+
+        for tag, files in jobs:
+            in_flight.append((tag, self.executor.submit(self.extract, files)))
+            while len(in_flight) >= max_in_flight:
+                tag, future = in_flight.popleft()
+                yield tag, future.result()
+
+        while len(in_flight) > 0:
+            tag, future = in_flight.popleft()
+            yield tag, future.result()
+
+    def take_stats(self) -> exifbatch.BatchStats:
+        # everything the batchers have done since the last call - watch mode keeps the pool between passes, and each
+        # pass reports its own numbers
+        stats = exifbatch.BatchStats()
+        for et, batcher in self._tools:
+            stats.merge(batcher.final_stats())
+            batcher.stats = exifbatch.BatchStats()
+        return stats
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        for et, batcher in self._tools:
+            try:
+                et.terminate()
+            except Exception as e:
+                logger.debug(f"Failed to stop exiftool due to {str(e)}")
@@ -0,0 +1,74 @@
+import logging
+import os
+import json
+import heapq
+import tempfile
+from typing import Iterator
+
+logger = logging.getLogger("externalsort")
+logger.setLevel(logging.WARN)
+
+# how many records get held in memory before they're sorted and written out as a run
+DEFAULT_RUN_SIZE = 200000
+
+
+class ExternalSort:
+    # sorts more records than it's sensible to hold at once - every run_size records get sorted and spilled to a file,
+    # and sorted() merges the runs back together a line at a time.  Memory stays at run_size records however big the
+    # input is, and a small input never touches the disk at all
+    # records are flat tuples of strs and ints, written a json line each so paths with tabs or newlines in them survive
+    run_size: int
+    runs: list
+
+    def __init__(self, run_size: int = DEFAULT_RUN_SIZE, temp_dir: str = None):
+        self.run_size = run_size
+        self.runs = []
+        self._buffer = []
+        self._temp_dir = None
+        self._parent_dir = temp_dir
+
+    def add(self, record: tuple) -> None:
+        self._buffer.append(record)
+        if len(self._buffer) >= self.run_size:
+            self._spill()
+
+    def _spill(self) -> None:
+        if self._temp_dir == None:
+            self._temp_dir = tempfile.TemporaryDirectory(
+                prefix="photo_organiser_sort_", dir=self._parent_dir
+            )
+
+        self._buffer.sort()
+        run_path = os.path.join(self._temp_dir.name, f"run{len(self.runs)}.jsonl")
+        with open(run_path, "w", encoding="utf-8") as f:
+            for record in self._buffer:
+                f.write(json.dumps(record))
+                f.write("\n")
+        self.runs.append(run_path)
+        logger.debug(f"Spilled {len(self._buffer)} records to {run_path}")
+        self._buffer = []
+
+    def _read_run(self, run_path: str) -> Iterator[tuple]:
+        with open(run_path, encoding="utf-8") as f:
+            for line in f:
+                yield tuple(json.loads(line))
+
+    def sorted(self) -> Iterator[tuple]:
+        # everything added so far, in order
+        if len(self.runs) == 0:
+            self._buffer.sort()
+            buffer = self._buffer
+            self._buffer = []
+            yield from buffer
+            return
+
+        if len(self._buffer) > 0:
+            self._spill()
+        yield from heapq.merge(*[self._read_run(run_path) for run_path in self.runs])
+
+    def close(self) -> None:
+        if self._temp_dir != None:
+            self._temp_dir.cleanup()
+            self._temp_dir = None
+        self.runs = []
+        self._buffer = []
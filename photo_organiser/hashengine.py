@@ -0,0 +1,103 @@
+import logging
+import os
+from typing import Iterable, Iterator, Tuple
+from photo_organiser import hashing
+from photo_organiser import workpool
+
+logger = logging.getLogger("hashengine")
+logger.setLevel(logging.WARN)
+
+# how much to read from each end of a file for the partial hash
+PARTIAL_BLOCK_SIZE = 4096
+
+# full hashes come from hashing.hash_file() - big reusable buffer, sequential read-ahead, whichever algorithm --hash says
+hash_file = hashing.hash_file
+
+
+# this needs to live at module level so it can be pickled across to a process pool
+def hash_file_ends(
+    file_fullpath: str, file_size: int, algorithm: str = hashing.DEFAULT_ALGORITHM
+) -> str:
+    # hash the first and last few KB of the file - cheap way of ruling out files that share a size but not content
+    # files small enough to be fully covered by the two blocks just get hashed in full, so the partial hash IS the full hash
+    if file_size <= PARTIAL_BLOCK_SIZE * 2:
+        return hash_file(file_fullpath, algorithm)
+
+    file_hash = hashing.new_hash(algorithm)
+    with open(file_fullpath, "rb") as f:
+        file_hash.update(f.read(PARTIAL_BLOCK_SIZE))
+        f.seek(-PARTIAL_BLOCK_SIZE, os.SEEK_END)
+        file_hash.update(f.read(PARTIAL_BLOCK_SIZE))
+
+    return hashing.tagged(algorithm, file_hash.hexdigest())
+
+
+def partial_read_size(file_size: int) -> int:
+    # how many bytes hash_file_ends actually reads for a file of this size
+    return min(file_size, PARTIAL_BLOCK_SIZE * 2)
+
+
+def device_of(file_fullpath: str) -> int:
+    try:
+        return os.stat(file_fullpath).st_dev
+    except OSError:
+        return None
+
+
+class HashEngine:
+    # spreads hashing across a pool, with a cap on how many reads hit each device at once
+    # hashlib drops the GIL on big buffers so threads are normally enough - processes are there if they're not
+    pool: workpool.DevicePool
+    algorithm: str
+
+    def __init__(
+        self,
+        workers: int = None,
+        io_concurrency: int = workpool.DEFAULT_IO_CONCURRENCY,
+        use_processes: bool = False,
+        algorithm: str = hashing.DEFAULT_ALGORITHM,
+    ):
+        self.pool = workpool.DevicePool(workers, io_concurrency, use_processes)
+        self.algorithm = algorithm
+
+    def _run(self, func, jobs, failures: bool = False) -> Iterator[Tuple[str, str]]:
+        # with failures, a file that couldn't be hashed still comes back, as (path, None)
+        for file_fullpath, result, error in self.pool.imap_unordered(func, jobs):
+            if error != None:
+                print(f"Failed to hash {file_fullpath} due to {str(error)}")
+                if failures:
+                    yield file_fullpath, None
+                continue
+            yield file_fullpath, result
+
+    def hash_files(
+        self, files: Iterable[Tuple[str, int]], failures: bool = False
+    ) -> Iterator[Tuple[str, str]]:
+        # files are (path, st_dev) - yields (path, hash) as each one finishes, or (path, None) with failures
+        return self._run(
+            hash_file,
+            (
+                (file_fullpath, (("read", device),), (file_fullpath, self.algorithm))
+                for file_fullpath, device in files
+            ),
+            failures,
+        )
+
+    def hash_files_ends(
+        self, files: Iterable[Tuple[str, int, int]]
+    ) -> Iterator[Tuple[str, str]]:
+        # files are (path, size, st_dev) - yields (path, partial hash) as each one finishes
+        return self._run(
+            hash_file_ends,
+            (
+                (
+                    file_fullpath,
+                    (("read", device),),
+                    (file_fullpath, file_size, self.algorithm),
+                )
+                for file_fullpath, file_size, device in files
+            ),
+        )
+
+    def close(self) -> None:
+        self.pool.close()
@@ -0,0 +1,85 @@
+import logging
+import os
+import hashlib
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+logger = logging.getLogger("hashing")
+logger.setLevel(logging.WARN)
+
+# how much goes to the hash in one update() - big enough that a 4GB video is a few thousand calls rather than 65,000
+READ_SIZE = 1048576
+
+# what --hash can pick from.  sha256 is for archiving - it's what every cache and log written before there was a
+# choice holds.  blake2b and xxh128 are for quick dedupe runs - blake2b beats sha256 on CPUs without SHA extensions,
+# xxh128 (if the xxhash package is installed) beats both by a long way but is no good for proving a copy wasn't tampered with
+ALGORITHMS = {
+    "sha256": hashlib.sha256,
+    "blake2b": hashlib.blake2b,
+}
+if xxhash != None:
+    ALGORITHMS["xxh128"] = xxhash.xxh3_128
+
+DEFAULT_ALGORITHM = "sha256"
+
+# sha256 hashes are stored bare, the way they always have been.  Anything else gets its algorithm in front
+# ("blake2b:...") so a hash can never match one made a different way, and the cache can tell what it's holding
+UNTAGGED_ALGORITHM = "sha256"
+
+
+def new_hash(algorithm: str = DEFAULT_ALGORITHM):
+    return ALGORITHMS[algorithm]()
+
+
+def tagged(algorithm: str, hexdigest: str) -> str:
+    if algorithm == UNTAGGED_ALGORITHM:
+        return hexdigest
+    return f"{algorithm}:{hexdigest}"
+
+
+def algorithm_of(file_hash: str) -> str:
+    separator = file_hash.find(":")
+    if separator == -1:
+        return UNTAGGED_ALGORITHM
+    return file_hash[:separator]
+
+
+def advise_sequential(f) -> None:
+    # tells the kernel we're reading straight through, so it reads further ahead (and drops pages behind us sooner)
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def update_from(file_hash, f, size: int = READ_SIZE) -> None:
+    # reads f into a buffer that gets reused for every read, and hands the hash a view of it - nothing gets copied
+    # into a new bytes object on the way.  size is how big the file is, if it's known - a 40KB PNG doesn't need a
+    # 1MB buffer zeroed for it (one extra byte so the end of the file still comes in the first read)
+    buffer = bytearray(min(READ_SIZE, size + 1))
+    view = memoryview(buffer)
+    read_size = f.readinto(buffer)
+    while read_size > 0:
+        file_hash.update(view[:read_size])
+        read_size = f.readinto(buffer)
+
+
+# these need to live at module level so they can be pickled across to a process pool
+def hash_file(file_fullpath: str, algorithm: str = DEFAULT_ALGORITHM) -> str:
+    file_hash = new_hash(algorithm)
+    with open(file_fullpath, "rb", buffering=0) as f:
+        advise_sequential(f)
+        update_from(file_hash, f, os.fstat(f.fileno()).st_size)
+
+    return tagged(algorithm, file_hash.hexdigest())
+
+
+def hash_bytes(content: bytes, algorithm: str = DEFAULT_ALGORITHM) -> str:
+    # for callers that already have the whole file in memory
+    file_hash = new_hash(algorithm)
+    file_hash.update(content)
+    return tagged(algorithm, file_hash.hexdigest())
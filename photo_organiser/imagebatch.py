@@ -0,0 +1,130 @@
+import logging
+import os
+import struct
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+from photo_organiser import imagefile
+
+logger = logging.getLogger("imagebatch")
+logger.setLevel(logging.WARN)
+
+# a batch is the record count, then one fixed size record per image, then every record's strings one after the other
+# record is file size, whether it had a usable date tag, and the byte lengths of the path and the three raw timestamps
+# everything else an ImageFile holds is either the same for the whole run (destination root) or gets worked out again
+# from these (year, month, destination path)
+HEADER = struct.Struct("<I")
+RECORD = struct.Struct("<qBIHHH")
+
+# paths that aren't valid utf-8 come out of os.scandir with surrogates in them, and need to go back in the same way
+ENCODING = "utf-8"
+ERRORS = "surrogateescape"
+
+
+def pack(images: list) -> bytes:
+    records = bytearray(HEADER.pack(len(images)))
+    strings = bytearray()
+    for the_image in images:
+        fields = [
+            value.encode(ENCODING, ERRORS)
+            for value in (
+                the_image.source_fullpath,
+                the_image.file_create_raw,
+                the_image.file_modify_raw,
+                the_image.tag_date_raw,
+            )
+        ]
+        records += RECORD.pack(
+            the_image.file_size,
+            the_image.tagging_present,
+            len(fields[0]),
+            len(fields[1]),
+            len(fields[2]),
+            len(fields[3]),
+        )
+        for value in fields:
+            strings += value
+    return bytes(records + strings)
+
+
+def unpack(data: bytes, destination_root: str) -> list:
+    (count,) = HEADER.unpack_from(data)
+    offset = HEADER.size + count * RECORD.size
+    images = []
+    for record in RECORD.iter_unpack(data[HEADER.size : offset]):
+        file_size, tagging_present = record[0:2]
+        fields = []
+        for length in record[2:]:
+            fields.append(data[offset : offset + length].decode(ENCODING, ERRORS))
+            offset += length
+        images.append(
+            imagefile.ImageFile.from_fields(
+                fields[0],
+                destination_root,
+                file_size,
+                bool(tagging_present),
+                fields[1],
+                fields[2],
+                fields[3],
+            )
+        )
+    return images
+
+
+def prepare() -> None:
+    # call before starting anything that makes SharedBatches.  Every segment gets registered with multiprocessing's
+    # resource tracker, and if the parent hasn't started one yet each child starts its own - which unlinks whatever that
+    # child made as soon as it exits, read or not
+    resource_tracker.ensure_running()
+
+
+class SharedBatch:
+    # what an ExifConsumer sends back instead of an ImageFile at a time - the packed records go in a shared memory
+    # segment and only its name goes over the queue, so it's one small pickle and pipe write per batch rather than per
+    # file.  The parent reads it with take(), which also gets rid of the segment
+    # on Windows a segment disappears as soon as the process that made it lets go of it, so there the packed records
+    # go over the queue themselves - still one pickle of one bytes object per batch
+    name: str
+    size: int
+    count: int
+    data: bytes
+
+    def __init__(self, images: list):
+        data = pack(images)
+        self.size = len(data)
+        self.count = len(images)
+
+        if os.name == "nt":
+            self.name = None
+            self.data = data
+            return
+
+        segment = shared_memory.SharedMemory(create=True, size=self.size)
+        segment.buf[: self.size] = data
+        self.name = segment.name
+        self.data = None
+        # just this process's mapping - the segment itself stays until take() unlinks it
+        segment.close()
+
+    def take(self, destination_root: str) -> list:
+        # the ImageFiles, in the order they were packed
+        if self.name == None:
+            return unpack(self.data, destination_root)
+
+        segment = shared_memory.SharedMemory(name=self.name)
+        try:
+            data = bytes(segment.buf[: self.size])
+        finally:
+            segment.close()
+            segment.unlink()
+        return unpack(data, destination_root)
+
+    def discard(self) -> None:
+        # for a batch nobody's going to read - leaving it would leak the segment until the resource tracker noticed
+        if self.name == None:
+            return
+        try:
+            segment = shared_memory.SharedMemory(name=self.name)
+        except FileNotFoundError:
+            return
+        segment.close()
+        segment.unlink()
@@ -1,10 +1,41 @@
 import logging
+import os
 import datetime
-import hashlib
+import sys
+from photo_organiser import hashing
 
 logger = logging.getLogger("imagefile")
 logger.setLevel(logging.WARN)
 
+# the date tags select_date_metadata() looks for, in priority order
+DATE_TAGS = [
+    "EXIF:CreateDate",
+    "EXIF:DateTimeOriginal",
+    "Composite:DateTimeCreated",
+    "QuickTime:CreateDate",
+    "QuickTime:TrackCreateDate",
+    "QuickTime:MediaCreateDate",
+    "RIFF:DateTimeOriginal",
+]
+
+# every tag ImageFile reads out of the exiftool metadata - anything else is dead weight
+METADATA_TAGS = [
+    "File:MIMEType",
+    "File:FileCreateDate",
+    "File:FileModifyDate",
+    "File:FileSize",
+] + DATE_TAGS
+
+# -fast stops exiftool scanning to the end of a JPEG for trailers, which we never read anyway.  Not -fast2 - that also
+# stops at a movie's mdat and a PNG's IDAT, and most cameras write the moov (with QuickTime:CreateDate) after the mdat
+EXIFTOOL_PARAMS = ["-fast"]
+
+
+def extract_metadata(et, files) -> list:
+    # ask exiftool for just the tags ImageFile reads rather than a full get_metadata() dump - hundreds of fields on
+    # HEIC/MOV files that would otherwise get parsed, pickled across queues and thrown away
+    return et.get_tags(files, tags=METADATA_TAGS, params=EXIFTOOL_PARAMS)
+
 
 class ImageNotValidError(Exception):
     # exception thrown when the file exists but is not a valid image
@@ -12,44 +43,93 @@ class ImageNotValidError(Exception):
         super().__init__(self, f"{file_fullpath}: File does not contain a valid image")
 
 
+def parse_timestamp(timestamp: str) -> datetime.datetime:
+    # exiftool dates are "YYYY:MM:DD HH:MM:SS" with maybe a timezone on the end, which we've always dropped
+    # slicing is a lot quicker than strptime, which matters when there's a few hundred thousand of these
+    return datetime.datetime(
+        int(timestamp[0:4]),
+        int(timestamp[5:7]),
+        int(timestamp[8:10]),
+        int(timestamp[11:13]),
+        int(timestamp[14:16]),
+        int(timestamp[17:19]),
+    )
+
+
+def usable_date(timestamp: str) -> bool:
+    # got some malformed tags coming back from exif
+    if timestamp == "0000:00:00 00:00:00" or str(timestamp).count(" ") != 1:
+        return False
+    try:
+        parse_timestamp(timestamp)
+    except ValueError:
+        # looked ok but isn't a real date
+        return False
+    return True
+
+
+def format_timestamp(timestamp: float) -> str:
+    # the other way - a stat time in the same local-time format exiftool uses for File:FileModifyDate
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y:%m:%d %H:%M:%S")
+
+
 class ImageFile:
-    # path stuff
-    source_fullpath: str = None
-    source_file_name: str = None
-    source_folder: str = None
-
-    # where is the root of the destination - will be used with validated_year and validated_month to construct destination folder
-    destination_root: str = None
-    file_create: datetime = None
-    file_modify: datetime = None
-    file_size: int = None
-    valid_media: bool = False
-
-    # must be explicitly called, because its an expensive operation and ultimately it may not be needed
-    file_hash: str = None
-
-    # attributes set by decide()
-    destination_fullpath: str = None
-    destination_folder: str = None
-    destination_date: datetime = None
-    destination_month: str = None
-    destination_year: str = None
-    tag_date: datetime = None
-    tagging_present = False
-
-    # attributes set by set_winner()
-    winner = None
-    reason = None
+    # there's one of these per media file, they get sent from the ExifConsumers back to the parent, and the parent
+    # holds on to all of them - so no per-instance __dict__, and anything that can be worked out from other fields
+    # (folders, file name, parsed dates) gets worked out when it's asked for rather than stored
+    __slots__ = (
+        # path stuff
+        "source_fullpath",
+        # where is the root of the destination - will be used with destination_year and destination_month to construct destination folder
+        "destination_root",
+        "file_size",
+        "valid_media",
+        # must be explicitly called, because its an expensive operation and ultimately it may not be needed
+        "file_hash",
+        # attributes set by generate_destination()
+        "destination_fullpath",
+        "destination_month",
+        "destination_year",
+        "tagging_present",
+        # attributes set by set_winner()
+        "winner",
+        "reason",
+        # raw exiftool timestamps - only turned into datetimes if something asks
+        "file_create_raw",
+        "file_modify_raw",
+        "tag_date_raw",
+        "_file_create",
+        "_file_modify",
+        "_tag_date",
+    )
+
+    # the fields that survive a pickle - the parsed dates are left behind since they're cheap to rebuild
+    _pickled_slots = __slots__[:-3]
+
+    source_fullpath: str
+    destination_root: str
+    file_size: int
+    valid_media: bool
+    file_hash: str
+    destination_fullpath: str
+    destination_month: str
+    destination_year: str
+    tagging_present: bool
+    winner: bool
+    reason: str
 
     def __init__(self, source_fullpath, destination_root, metadata):
 
         self.source_fullpath = source_fullpath
         self.destination_root = destination_root
-
-        # mess around with path string
-        folder_separator = source_fullpath.rfind("/")
-        self.source_file_name = source_fullpath[(folder_separator + 1) :]
-        self.source_folder = source_fullpath[:folder_separator]
+        self.file_hash = None
+        self.tagging_present = False
+        self.winner = None
+        self.reason = None
+        self.tag_date_raw = None
+        self._file_create = None
+        self._file_modify = None
+        self._tag_date = None
 
         # validate file - just trust exiftool
         if "File:MIMEType" in metadata.keys():
@@ -61,18 +141,11 @@ class ImageFile:
             raise ImageNotValidError(self.source_fullpath)
 
         # hold on to stat info from exiftool
+        self.file_modify_raw = metadata["File:FileModifyDate"]
         if "File:FileCreateDate" in metadata.keys():
-            self.file_create = datetime.datetime.strptime(
-                metadata["File:FileCreateDate"], "%Y:%m:%d %H:%M:%S%z"
-            ).replace(tzinfo=None)
+            self.file_create_raw = metadata["File:FileCreateDate"]
         else:
-            self.file_create = datetime.datetime.strptime(
-                metadata["File:FileModifyDate"], "%Y:%m:%d %H:%M:%S%z"
-            ).replace(tzinfo=None)
-
-        self.file_modify = datetime.datetime.strptime(
-            metadata["File:FileModifyDate"], "%Y:%m:%d %H:%M:%S%z"
-        ).replace(tzinfo=None)
+            self.file_create_raw = self.file_modify_raw
 
         self.file_size = metadata["File:FileSize"]
 
@@ -82,7 +155,7 @@ class ImageFile:
         # determine the to-be
         self.generate_destination()
 
-        if self.tag_date == None:
+        if not self.tagging_present:
             logger.info(
                 f"{self.source_fullpath}: Finished analysing file.  Destination {self.destination_fullpath} (file modified date)"
             )
@@ -91,33 +164,143 @@ class ImageFile:
                 f"{self.source_fullpath}: Finished analysing file.  Destination {self.destination_fullpath} (exif date)"
             )
 
+    @classmethod
+    def from_stat(
+        cls, source_fullpath: str, destination_root: str, stat_result: os.stat_result
+    ) -> "ImageFile":
+        # a file that's already sitting in the destination, built from nothing but a stat - it competes for the path
+        # it's at, and is_better() only needs its exif if the file size can't settle things
+        the_image = cls.__new__(cls)
+        the_image.source_fullpath = source_fullpath
+        the_image.destination_root = destination_root
+        the_image.file_size = stat_result.st_size
+        the_image.valid_media = True
+        the_image.file_hash = None
+        the_image.destination_fullpath = source_fullpath
+        the_image.tagging_present = False
+        the_image.winner = None
+        the_image.reason = None
+        the_image.file_modify_raw = format_timestamp(stat_result.st_mtime)
+        the_image.file_create_raw = the_image.file_modify_raw
+        the_image.tag_date_raw = None
+        the_image._file_create = None
+        the_image._file_modify = None
+        the_image._tag_date = None
+
+        # root/YYYY/MM/file - the folders it's in are its year and month
+        folders = source_fullpath[len(destination_root) :].split("/")
+        the_image.destination_year = sys.intern(folders[-3])
+        the_image.destination_month = sys.intern(folders[-2])
+        return the_image
+
+    @classmethod
+    def from_fields(
+        cls,
+        source_fullpath: str,
+        destination_root: str,
+        file_size: int,
+        tagging_present: bool,
+        file_create_raw: str,
+        file_modify_raw: str,
+        tag_date_raw: str,
+    ) -> "ImageFile":
+        # rebuilds one that's already been through __init__ somewhere else, from the handful of fields imagebatch packs
+        # - the metadata's already been checked, so it's straight on to working out where it goes
+        the_image = cls.__new__(cls)
+        the_image.source_fullpath = source_fullpath
+        the_image.destination_root = destination_root
+        the_image.file_size = file_size
+        the_image.valid_media = True
+        the_image.file_hash = None
+        the_image.tagging_present = tagging_present
+        the_image.winner = None
+        the_image.reason = None
+        the_image.file_create_raw = file_create_raw
+        the_image.file_modify_raw = file_modify_raw
+        the_image.tag_date_raw = tag_date_raw
+        the_image._file_create = None
+        the_image._file_modify = None
+        the_image._tag_date = None
+        the_image.generate_destination()
+        return the_image
+
+    @property
+    def needs_metadata(self) -> bool:
+        # only from_stat() candidates are missing a tag date
+        return self.tag_date_raw == None
+
+    def load_metadata(self, metadata: dict) -> None:
+        # fill in a from_stat() candidate once its exif is actually needed.  It stays where it is - only the dates change
+        if metadata != None:
+            self.file_modify_raw = metadata.get(
+                "File:FileModifyDate", self.file_modify_raw
+            )
+            self.file_create_raw = metadata.get(
+                "File:FileCreateDate", self.file_modify_raw
+            )
+            self.select_date_metadata(metadata)
+
+        # same fallback as generate_destination() - no usable tag means the modified date
+        if self.tag_date_raw == None:
+            self.tag_date_raw = self.file_modify_raw
+
+    def __getstate__(self):
+        # a plain tuple pickles a lot smaller than the default dict of slot names
+        return tuple(getattr(self, slot) for slot in self._pickled_slots)
+
+    def __setstate__(self, state) -> None:
+        for slot, value in zip(self._pickled_slots, state):
+            setattr(self, slot, value)
+        self._file_create = None
+        self._file_modify = None
+        self._tag_date = None
+
+    @property
+    def source_file_name(self) -> str:
+        return self.source_fullpath[(self.source_fullpath.rfind("/") + 1) :]
+
+    @property
+    def source_folder(self) -> str:
+        return self.source_fullpath[: self.source_fullpath.rfind("/")]
+
+    @property
+    def destination_folder(self) -> str:
+        return self.destination_fullpath[: self.destination_fullpath.rfind("/")]
+
+    @property
+    def file_create(self) -> datetime.datetime:
+        if self._file_create == None:
+            self._file_create = parse_timestamp(self.file_create_raw)
+        return self._file_create
+
+    @property
+    def file_modify(self) -> datetime.datetime:
+        if self._file_modify == None:
+            self._file_modify = parse_timestamp(self.file_modify_raw)
+        return self._file_modify
+
+    @property
+    def tag_date(self) -> datetime.datetime:
+        if self._tag_date == None and self.tag_date_raw != None:
+            self._tag_date = parse_timestamp(self.tag_date_raw)
+        return self._tag_date
+
+    @property
+    def destination_date(self) -> datetime.datetime:
+        # generate_destination() always fills in tag_date, falling back to the file modified date
+        return self.tag_date
+
     def set_winner(self, bool_winner: bool, reason: str) -> None:
         self.winner = bool_winner
         self.reason = reason
 
     def select_date_metadata(self, metadata: dict) -> bool:
-        search_tags = [
-            "EXIF:CreateDate",
-            "EXIF:DateTimeOriginal",
-            "Composite:DateTimeCreated",
-            "QuickTime:CreateDate",
-            "QuickTime:TrackCreateDate",
-            "QuickTime:MediaCreateDate",
-            "RIFF:DateTimeOriginal",
-        ]
-        metadata_keys = metadata.keys()
-        for tag in search_tags:
-            if tag in metadata.keys():
-                # got some malformed tags coming back from exif
-                if (
-                    metadata[tag] != "0000:00:00 00:00:00"
-                    and str(metadata[tag]).count(" ") == 1
-                ):
-                    self.tag_date = datetime.datetime.strptime(
-                        metadata[tag], "%Y:%m:%d %H:%M:%S"
-                    )
-                    self.tagging_present = True
-                    return True
+        for tag in DATE_TAGS:
+            # anything malformed just means trying the next one
+            if tag in metadata.keys() and usable_date(metadata[tag]):
+                self.tag_date_raw = metadata[tag]
+                self.tagging_present = True
+                return True
 
         return False
 
@@ -128,55 +311,48 @@ class ImageFile:
         # which timestamp are we going to use? In order of priority:
         # tag
         # file date modified (can't use create date since files got moved around)
-        if self.tag_date != None:
-            self.destination_date = self.tag_date
+        if self.tag_date_raw != None:
             logger.debug(
                 f"{self.source_fullpath}: Destination generated using EXIF data"
             )
         else:
-            self.destination_date = self.file_modify
             logger.debug(
                 f"{self.source_fullpath}: Destination generated using file stat data"
             )
             # poor form but fall back to stat date
-            self.tag_date = self.file_modify
+            self.tag_date_raw = self.file_modify_raw
 
-        self.destination_year = self.destination_date.strftime("%Y")
-        self.destination_month = self.destination_date.strftime("%m")
+        # the year and month come straight out of the raw timestamp - interned, since there's only a few hundred
+        # distinct values across the whole library
+        self.destination_year = sys.intern(self.tag_date_raw[0:4])
+        self.destination_month = sys.intern(self.tag_date_raw[5:7])
 
-        self.destination_folder = (
+        self.destination_fullpath = (
             self.destination_root
             + "/"
             + self.destination_year
             + "/"
             + self.destination_month
-        )
-
-        self.destination_fullpath = (
-            self.destination_folder + "/" + self.source_file_name
+            + "/"
+            + self.source_file_name
         )
 
         return
 
-    # shamelessly stolen from https://nitratine.net/blog/post/how-to-hash-files-in-python/
-    def get_hash(self) -> str:
+    def get_hash(self, cache=None, algorithm: str = hashing.DEFAULT_ALGORITHM) -> str:
         # don't do it again if its already done...
         if self.file_hash != None:
             return self.file_hash
 
-        BLOCK_SIZE = 65536  # The size of each read from the file
+        # or if a previous run already did it
+        if cache != None:
+            self.file_hash = cache.get_hash(self.source_fullpath, algorithm=algorithm)
+            if self.file_hash != None:
+                return self.file_hash
 
-        file_hash = (
-            hashlib.sha256()
-        )  # Create the hash object, can use something other than `.sha256()` if you wish
-        with open(self.source_fullpath, "rb") as f:  # Open the file to read it's bytes
-            fb = f.read(
-                BLOCK_SIZE
-            )  # Read from the file. Take in the amount declared above
-            while len(fb) > 0:  # While there is still data being read from the file
-                file_hash.update(fb)  # Update the hash
-                fb = f.read(BLOCK_SIZE)  # Read the next block from the file
+        self.file_hash = hashing.hash_file(self.source_fullpath, algorithm)
 
-        self.file_hash = file_hash.hexdigest()  # Get the hexadecimal digest of the hash
+        if cache != None:
+            cache.set_hash(self.source_fullpath, self.file_hash)
 
         return self.file_hash
@@ -0,0 +1,82 @@
+import logging
+import os
+import time
+from typing import Tuple
+from photo_organiser import cache
+
+logger = logging.getLogger("incremental")
+logger.setLevel(logging.WARN)
+
+# FAT and exFAT only keep mtimes to 2 seconds, so a file added in the same 2 seconds as a listing doesn't move the
+# directory's mtime.  A listing taken that soon after the mtime can't be trusted next time, so it doesn't get kept
+COARSE_MTIME_NS = 2 * 1000000000
+
+
+class IncrementalState:
+    # what the last run saw, so this one only has to look at what's changed since
+    # a directory's mtime moves whenever something is added to it, removed from it or renamed in it - so if it hasn't
+    # moved, last run's listing is still right and the directory doesn't need to be read again.  Subdirectories have
+    # their own mtimes, so they still get checked one by one
+    # everything gets read out of the cache up front and written back in one go at the end, so walker threads only
+    # ever touch plain dicts
+    directories: dict
+    decided: dict
+    changed: dict
+    reused: int
+    rescanned: int
+
+    def __init__(self, file_cache: cache.FileCache):
+        self.directories = file_cache.get_directories()
+        self.decided = file_cache.get_decided()
+        self.changed = {}
+        self.reused = 0
+        self.rescanned = 0
+
+    def lookup(self, dir_fullpath: str) -> Tuple[int, list, list]:
+        # returns (mtime_ns, subdirs, files) - subdirs and files are None if the directory needs listing again
+        # mtime_ns is None if whatever listing gets taken now shouldn't be kept
+        listed_ns = time.time_ns()
+        try:
+            mtime_ns = os.stat(dir_fullpath).st_mtime_ns
+        except OSError:
+            return None, None, None
+
+        if listed_ns - mtime_ns < COARSE_MTIME_NS:
+            # changed too recently to tell whether anything else lands in the same tick - list it, but don't keep it
+            self.rescanned += 1
+            return None, None, None
+
+        previous = self.directories.get(cache.normalise_path(dir_fullpath))
+        if previous == None or previous[0] != mtime_ns:
+            self.rescanned += 1
+            return mtime_ns, None, None
+
+        self.reused += 1
+        return mtime_ns, previous[1], previous[2]
+
+    def record(
+        self, dir_fullpath: str, mtime_ns: int, subdirs: list, files: list
+    ) -> None:
+        if mtime_ns == None:
+            return
+        self.changed[cache.normalise_path(dir_fullpath)] = (mtime_ns, subdirs, files)
+
+    def is_new(self, file_fullpath: str) -> bool:
+        # anything that was decided on last time and hasn't changed since doesn't need deciding again
+        # only files that got left where they were have a key, so this is normally just a dict miss - no stat
+        previous_key = self.decided.get(cache.normalise_path(file_fullpath))
+        if previous_key == None:
+            return True
+
+        try:
+            return cache.stat_key(file_fullpath) != previous_key
+        except OSError:
+            return False
+
+    def save(self, file_cache: cache.FileCache) -> None:
+        for dir_fullpath, (mtime_ns, subdirs, files) in self.changed.items():
+            file_cache.set_directory(dir_fullpath, mtime_ns, subdirs, files)
+        file_cache.commit()
+        logger.debug(
+            f"Reused {self.reused} directory listings, rescanned {self.rescanned}"
+        )
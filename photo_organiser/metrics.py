@@ -0,0 +1,229 @@
+import logging
+import time
+import json
+import datetime
+import threading
+
+logger = logging.getLogger("metrics")
+logger.setLevel(logging.WARN)
+
+# how often the status line gets redrawn - a terminal write per file costs more than you'd think
+DEFAULT_REFRESH_SECONDS = 0.5
+# when stdout is a file rather than a terminal there's no redrawing, so just write a line now and then
+LOG_REFRESH_SECONDS = 10
+# how long a client holds on to its counts before sending them to the reporter
+FLUSH_SECONDS = 0.25
+
+# a stage with no total of its own is working through whatever the stage before it found
+UPSTREAM_TOTALS = {"exif": "walked"}
+
+
+class StageCounters:
+    # everything every client has sent for one stage
+    files: int
+    bytes: int
+    errors: int
+    total: int
+    started: float
+    updated: float
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self.total = None
+        self.started = None
+        self.updated = None
+
+    def merge(self, update: dict) -> None:
+        self.files += update.get("files", 0)
+        self.bytes += update.get("bytes", 0)
+        self.errors += update.get("errors", 0)
+        if update.get("total") != None:
+            self.total = update["total"]
+        if update.get("started") != None and (
+            self.started == None or update["started"] < self.started
+        ):
+            self.started = update["started"]
+        if update.get("updated") != None and (
+            self.updated == None or update["updated"] > self.updated
+        ):
+            self.updated = update["updated"]
+
+    def seconds(self) -> float:
+        if self.started == None or self.updated == None:
+            return 0.0
+        return self.updated - self.started
+
+    def files_per_second(self) -> float:
+        if self.seconds() <= 0:
+            return 0.0
+        return self.files / self.seconds()
+
+    def bytes_per_second(self) -> float:
+        if self.seconds() <= 0:
+            return 0.0
+        return self.bytes / self.seconds()
+
+    def as_dict(self) -> dict:
+        return {
+            "files": self.files,
+            "bytes": self.bytes,
+            "errors": self.errors,
+            "total": self.total,
+            "seconds": round(self.seconds(), 3),
+            "files_per_second": round(self.files_per_second(), 1),
+            "bytes_per_second": round(self.bytes_per_second(), 1),
+        }
+
+
+class MetricsClient:
+    # what workers count things with.  Counts pile up here and go to the reporter every FLUSH_SECONDS as one message,
+    # rather than a message (or a print) per file.  Safe to share between threads in the same process - every process
+    # needs its own, since they each send what's changed since their last flush
+    # a client with no queue counts nothing, so code that reports progress doesn't need to check for one
+    def __init__(self, status_queue=None):
+        self.status_queue = status_queue
+        self._pending = {}
+        self._notes = {}
+        self._started = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, files: int = 1, bytes: int = 0, errors: int = 0) -> None:
+        if self.status_queue == None:
+            return
+
+        with self._lock:
+            if stage not in self._pending:
+                self._pending[stage] = {"files": 0, "bytes": 0, "errors": 0}
+            pending = self._pending[stage]
+            pending["files"] += files
+            pending["bytes"] += bytes
+            pending["errors"] += errors
+            if stage not in self._started:
+                self._started[stage] = time.time()
+                pending["started"] = self._started[stage]
+
+            flush_due = time.monotonic() - self._last_flush >= FLUSH_SECONDS
+        if flush_due:
+            self.flush()
+
+    def set_total(self, stage: str, total: int) -> None:
+        if self.status_queue == None:
+            return
+
+        with self._lock:
+            if stage not in self._pending:
+                self._pending[stage] = {"files": 0, "bytes": 0, "errors": 0}
+            self._pending[stage]["total"] = total
+
+    def note(self, name: str, value) -> None:
+        # anything else worth keeping in the metrics file - eg. the exif batching summary
+        if self.status_queue == None:
+            return
+
+        with self._lock:
+            self._notes[name] = value
+
+    def flush(self) -> None:
+        if self.status_queue == None:
+            return
+
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if len(self._pending) == 0 and len(self._notes) == 0:
+                return
+            now = time.time()
+            for pending in self._pending.values():
+                # a total on its own isn't progress, so it doesn't count towards how long the stage has been going
+                if pending["files"] > 0 or pending["errors"] > 0:
+                    pending["updated"] = now
+            update = {"stages": self._pending, "notes": self._notes}
+            self._pending = {}
+            self._notes = {}
+
+        self.status_queue.put(update)
+
+
+class MetricsReport:
+    # the reporter's side - every client's updates added together, and drawn as one status line
+    stages: dict
+    notes: dict
+    started: float
+
+    def __init__(self):
+        self.stages = {}
+        self.notes = {}
+        self.started = time.time()
+
+    def merge(self, update: dict) -> None:
+        for stage, counts in update["stages"].items():
+            if stage not in self.stages:
+                self.stages[stage] = StageCounters()
+            self.stages[stage].merge(counts)
+        self.notes.update(update["notes"])
+
+    def total_for(self, stage: str) -> int:
+        counters = self.stages[stage]
+        if counters.total != None:
+            return counters.total
+        upstream = UPSTREAM_TOTALS.get(stage)
+        if upstream in self.stages:
+            return self.stages[upstream].files
+        return None
+
+    def status_line(self) -> str:
+        parts = []
+        errors = 0
+        for stage, counters in self.stages.items():
+            errors += counters.errors
+            total = self.total_for(stage)
+            if total != None:
+                part = f"{stage} {counters.files:,}/{total:,}"
+            else:
+                part = f"{stage} {counters.files:,}"
+
+            rates = []
+            if counters.files_per_second() > 0:
+                rates.append(f"{counters.files_per_second():,.0f}/s")
+            if counters.bytes > 0:
+                rates.append(f"{counters.bytes_per_second() / 1048576:,.1f} MB/s")
+            if (
+                total != None
+                and counters.files < total
+                and counters.files_per_second() > 0
+            ):
+                remaining = (total - counters.files) / counters.files_per_second()
+                rates.append(f"eta {format_seconds(remaining)}")
+            if len(rates) > 0:
+                part += f" ({', '.join(rates)})"
+            parts.append(part)
+
+        line = f"[{format_seconds(time.time() - self.started)}] " + " | ".join(parts)
+        if errors > 0:
+            line += f" | {errors} errors"
+        return line
+
+    def as_dict(self) -> dict:
+        finished = time.time()
+        return {
+            "started": datetime.datetime.fromtimestamp(self.started).isoformat(),
+            "finished": datetime.datetime.fromtimestamp(finished).isoformat(),
+            "seconds": round(finished - self.started, 3),
+            "stages": {
+                stage: counters.as_dict() for stage, counters in self.stages.items()
+            },
+            "notes": self.notes,
+        }
+
+    def write_json(self, metrics_path: str) -> None:
+        with open(metrics_path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+def format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
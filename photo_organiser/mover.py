@@ -0,0 +1,152 @@
+import logging
+import os
+import shutil
+from photo_organiser import hashing
+
+logger = logging.getLogger("mover")
+logger.setLevel(logging.WARN)
+
+# how much to read/write at a time when copying across devices
+COPY_BLOCK_SIZE = 1048576
+PARTIAL_SUFFIX = ".part"  # copies land under this name first, so a half-written file never sits at the real path
+
+# what move_file() ended up doing - comes back to the caller so it can be counted
+RENAMED = "renamed"
+COPIED = "copied"
+COPIED_VERIFIED = "verified"
+# copied, but the original couldn't be removed afterwards
+SOURCE_KEPT = "source kept"
+
+
+class MoverVerificationFailed(Exception):
+    # exception thrown when the bytes copied don't hash to what the file hashed to before
+    def __init__(self, source_fullpath, expected_hash, actual_hash):
+        super().__init__(
+            self,
+            f"{source_fullpath}: Copy hashed to {actual_hash} but expected {expected_hash}",
+        )
+
+
+def same_device(source_fullpath: str, destination_fullpath: str) -> bool:
+    # destination doesn't exist yet, so check the folder it's going into
+    return (
+        os.stat(source_fullpath).st_dev
+        == os.stat(os.path.dirname(destination_fullpath) or ".").st_dev
+    )
+
+
+def move_file(
+    source_fullpath: str,
+    destination_fullpath: str,
+    expected_hash: str = None,
+    verify: bool = True,
+    algorithm: str = hashing.DEFAULT_ALGORITHM,
+) -> tuple:
+    # returns (what it did, hash of the copy or None)
+    # needs to live at module level so it can be pickled across to a process pool
+    if same_device(source_fullpath, destination_fullpath):
+        # same filesystem is just a metadata change - no data gets read or written at all
+        os.replace(source_fullpath, destination_fullpath)
+        return RENAMED, None
+
+    partial_fullpath = destination_fullpath + PARTIAL_SUFFIX
+    try:
+        if verify:
+            copied_hash = copy_and_hash(source_fullpath, partial_fullpath, algorithm)
+            if expected_hash == None:
+                # nothing to check it against - still worth having the hash for the cache, but it's not verified
+                outcome = COPIED
+            elif copied_hash != expected_hash:
+                raise MoverVerificationFailed(
+                    source_fullpath, expected_hash, copied_hash
+                )
+            else:
+                outcome = COPIED_VERIFIED
+        else:
+            copy_zero(source_fullpath, partial_fullpath)
+            copied_hash = None
+            outcome = COPIED
+
+        shutil.copystat(source_fullpath, partial_fullpath)
+        os.replace(partial_fullpath, destination_fullpath)
+    except BaseException:
+        # leave the source alone and don't leave half a file behind
+        try:
+            os.remove(partial_fullpath)
+        except OSError:
+            pass
+        raise
+
+    # only once the copy is safely down does the original go.  The copy's already at the destination by then, so not
+    # being able to remove the original doesn't fail the move - it just gets left where it was
+    try:
+        os.remove(source_fullpath)
+    except OSError as e:
+        logger.warning(
+            f"{source_fullpath}: Copied to {destination_fullpath} but couldn't remove the original due to {str(e)}"
+        )
+        return SOURCE_KEPT, copied_hash
+    return outcome, copied_hash
+
+
+def copy_and_hash(
+    source_fullpath: str,
+    destination_fullpath: str,
+    algorithm: str = hashing.DEFAULT_ALGORITHM,
+) -> str:
+    # one pass over the source - every block gets hashed on its way to the destination, so there's no second read of
+    # either file.  The hash is of what was read from the source, the destination never gets read back
+    file_hash = hashing.new_hash(algorithm)
+    buffer = bytearray(COPY_BLOCK_SIZE)
+    view = memoryview(buffer)
+    with open(source_fullpath, "rb") as fsrc, open(destination_fullpath, "wb") as fdst:
+        hashing.advise_sequential(fsrc)
+        read_size = fsrc.readinto(buffer)
+        while read_size > 0:
+            file_hash.update(view[:read_size])
+            fdst.write(view[:read_size])
+            read_size = fsrc.readinto(buffer)
+
+        # it's about to be the only copy, so make sure it's actually on the disk
+        fdst.flush()
+        os.fsync(fdst.fileno())
+
+    return hashing.tagged(algorithm, file_hash.hexdigest())
+
+
+def copy_zero(source_fullpath: str, destination_fullpath: str) -> None:
+    # let the kernel move the bytes straight from one file to the other where it can - they never come up into python
+    with open(source_fullpath, "rb") as fsrc, open(destination_fullpath, "wb") as fdst:
+        file_size = os.fstat(fsrc.fileno()).st_size
+        copied = 0
+        try:
+            if hasattr(os, "copy_file_range"):
+                while copied < file_size:
+                    sent = os.copy_file_range(
+                        fsrc.fileno(), fdst.fileno(), file_size - copied
+                    )
+                    if sent == 0:
+                        break
+                    copied += sent
+            elif hasattr(os, "sendfile") and os.name == "posix":
+                while copied < file_size:
+                    sent = os.sendfile(
+                        fdst.fileno(), fsrc.fileno(), copied, file_size - copied
+                    )
+                    if sent == 0:
+                        break
+                    copied += sent
+        except OSError as e:
+            # some filesystem combinations (and macOS, which only sendfile()s to sockets) don't do either
+            logger.debug(
+                f"{source_fullpath}: Zero-copy failed due to {str(e)}, copying normally"
+            )
+
+        if copied < file_size:
+            # pick up wherever the fast path stopped, or do the lot if there wasn't one
+            fsrc.seek(copied)
+            fdst.seek(copied)
+            shutil.copyfileobj(fsrc, fdst, COPY_BLOCK_SIZE)
+
+        fdst.flush()
+        os.fsync(fdst.fileno())
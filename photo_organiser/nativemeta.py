@@ -0,0 +1,404 @@
+import logging
+import os
+import sys
+import struct
+import datetime
+from typing import Iterator, Tuple
+from photo_organiser import imagefile
+
+logger = logging.getLogger("nativemeta")
+logger.setLevel(logging.WARN)
+
+# the most a JPEG APP1 segment can hold - EXIF has to fit in one
+MAX_SEGMENT_SIZE = 65535
+
+# QuickTime counts seconds from 1904, unix from 1970
+QUICKTIME_EPOCH_OFFSET = 2082844800
+
+# TIFF tags we care about
+TAG_EXIF_IFD = 0x8769
+TAG_DATE_TIME_ORIGINAL = 0x9003
+TAG_CREATE_DATE = 0x9004
+EXIF_DATE_TAGS = {
+    TAG_DATE_TIME_ORIGINAL: "EXIF:DateTimeOriginal",
+    TAG_CREATE_DATE: "EXIF:CreateDate",
+}
+TIFF_ASCII = 2
+
+# ftyp major brands we're sure what exiftool would call - anything else goes to exiftool
+HEIC_BRANDS = {b"heic": "image/heic", b"heix": "image/heic"}
+QUICKTIME_BRANDS = {
+    b"qt  ": "video/quicktime",
+    b"isom": "video/mp4",
+    b"iso2": "video/mp4",
+    b"mp41": "video/mp4",
+    b"mp42": "video/mp4",
+    b"avc1": "video/mp4",
+}
+
+# boxes cameras hide their own EXIF in (Canon's CNTH/CMT, anyone's uuid) - exiftool would report those as EXIF: tags,
+# which beat QuickTime:CreateDate, so a file with any of them isn't ours to answer for
+VENDOR_BOXES = {b"uuid", b"CNTH", b"CMT1", b"CMT2", b"CMT3", b"CMT4", b"NCTG"}
+
+
+class NativeMetadataUnsupported(Exception):
+    # exception thrown when a file isn't one the native parser can be sure about - it goes to exiftool instead
+    def __init__(self, file_fullpath, why):
+        super().__init__(self, f"{file_fullpath}: {why}")
+
+
+def exiftool_timestamp(timestamp: float) -> str:
+    # local time with the offset on the end, the way exiftool writes File:FileModifyDate
+    local = datetime.datetime.fromtimestamp(timestamp).astimezone()
+    formatted = local.strftime("%Y:%m:%d %H:%M:%S%z")
+    return formatted[:-2] + ":" + formatted[-2:]
+
+
+def file_metadata(stat_result: os.stat_result) -> dict:
+    metadata = {
+        "File:FileSize": stat_result.st_size,
+        "File:FileModifyDate": exiftool_timestamp(stat_result.st_mtime),
+    }
+    # exiftool only has a creation date where the filesystem keeps one
+    if os.name == "nt":
+        metadata["File:FileCreateDate"] = exiftool_timestamp(stat_result.st_ctime)
+    elif sys.platform == "darwin":
+        metadata["File:FileCreateDate"] = exiftool_timestamp(stat_result.st_birthtime)
+    return metadata
+
+
+def read_tiff_dates(file_fullpath: str, data: bytes) -> dict:
+    # data starts at the TIFF header - returns whichever of EXIF_DATE_TAGS are in IFD0 or the EXIF IFD
+    if data[0:2] == b"II":
+        byte_order = "<"
+    elif data[0:2] == b"MM":
+        byte_order = ">"
+    else:
+        raise NativeMetadataUnsupported(file_fullpath, "no TIFF header in EXIF")
+
+    magic, ifd_offset = struct.unpack_from(byte_order + "HI", data, 2)
+    if magic != 42:
+        raise NativeMetadataUnsupported(file_fullpath, "no TIFF header in EXIF")
+
+    dates = {}
+    exif_ifd_offset = None
+    for tag, tag_type, count, value in _ifd_entries(
+        file_fullpath, data, byte_order, ifd_offset
+    ):
+        if tag == TAG_EXIF_IFD:
+            exif_ifd_offset = struct.unpack_from(byte_order + "I", value)[0]
+        elif tag in EXIF_DATE_TAGS:
+            dates[EXIF_DATE_TAGS[tag]] = _ascii_value(
+                file_fullpath, data, byte_order, tag_type, count, value
+            )
+
+    if exif_ifd_offset != None:
+        for tag, tag_type, count, value in _ifd_entries(
+            file_fullpath, data, byte_order, exif_ifd_offset
+        ):
+            if tag in EXIF_DATE_TAGS:
+                dates[EXIF_DATE_TAGS[tag]] = _ascii_value(
+                    file_fullpath, data, byte_order, tag_type, count, value
+                )
+
+    return dates
+
+
+def _ifd_entries(
+    file_fullpath: str, data: bytes, byte_order: str, ifd_offset: int
+) -> Iterator[Tuple[int, int, int, bytes]]:
+    # yields (tag, type, count, the 4 byte value/offset field) for every entry in the IFD
+    if ifd_offset + 2 > len(data):
+        raise NativeMetadataUnsupported(file_fullpath, "IFD past the end of EXIF")
+    entry_count = struct.unpack_from(byte_order + "H", data, ifd_offset)[0]
+    if ifd_offset + 2 + entry_count * 12 > len(data):
+        raise NativeMetadataUnsupported(file_fullpath, "IFD past the end of EXIF")
+
+    for position in range(ifd_offset + 2, ifd_offset + 2 + entry_count * 12, 12):
+        tag, tag_type, count = struct.unpack_from(byte_order + "HHI", data, position)
+        yield tag, tag_type, count, data[position + 8 : position + 12]
+
+
+def _ascii_value(
+    file_fullpath: str,
+    data: bytes,
+    byte_order: str,
+    tag_type: int,
+    count: int,
+    value: bytes,
+) -> str:
+    if tag_type != TIFF_ASCII:
+        raise NativeMetadataUnsupported(file_fullpath, "date tag isn't ASCII")
+
+    if count <= 4:
+        raw = value[:count]
+    else:
+        offset = struct.unpack_from(byte_order + "I", value)[0]
+        if offset + count > len(data):
+            raise NativeMetadataUnsupported(file_fullpath, "date past the end of EXIF")
+        raw = data[offset : offset + count]
+
+    # exiftool stops at the first null, same as here
+    try:
+        return raw.split(b"\0", 1)[0].decode("ascii")
+    except UnicodeDecodeError:
+        raise NativeMetadataUnsupported(file_fullpath, "date tag isn't ASCII")
+
+
+def read_jpeg(file_fullpath: str, f) -> Tuple[str, dict]:
+    # walk the segments up to the start of the image data looking for APP1 "Exif" - a few small reads at the front
+    if f.read(2) != b"\xff\xd8":
+        raise NativeMetadataUnsupported(file_fullpath, "not a JPEG")
+
+    while True:
+        header = f.read(4)
+        if len(header) < 4 or header[0] != 0xFF:
+            break
+        marker = header[1]
+        if marker == 0xDA or marker == 0xD9:
+            # start of scan/end of image - there's no EXIF after this
+            break
+        segment_length = struct.unpack(">H", header[2:4])[0]
+        if marker == 0xE1:
+            segment = f.read(min(segment_length - 2, MAX_SEGMENT_SIZE))
+            if segment[0:6] == b"Exif\0\0":
+                return "image/jpeg", read_tiff_dates(file_fullpath, segment[6:])
+        else:
+            f.seek(segment_length - 2, os.SEEK_CUR)
+
+    return "image/jpeg", {}
+
+
+def _boxes(f, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    # ISO base media boxes between start and end - yields (type, where its content starts, where it ends)
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        box_size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if box_size == 1:
+            box_size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif box_size == 0:
+            box_size = end - position
+        if box_size < header_size or position + box_size > end:
+            return
+        yield box_type, position + header_size, position + box_size
+        position += box_size
+
+
+def _find_box(f, start: int, end: int, wanted: bytes) -> Tuple[int, int]:
+    for box_type, content_start, box_end in _boxes(f, start, end):
+        if box_type == wanted:
+            return content_start, box_end
+    return None, None
+
+
+def _major_brand(file_fullpath: str, f, file_size: int) -> bytes:
+    for box_type, content_start, box_end in _boxes(f, 0, file_size):
+        if box_type != b"ftyp":
+            break
+        f.seek(content_start)
+        return f.read(4)
+    raise NativeMetadataUnsupported(file_fullpath, "no ftyp box")
+
+
+def read_quicktime(file_fullpath: str, f, file_size: int) -> Tuple[str, dict]:
+    # the movie header (mvhd) inside moov holds the creation date - moov is often at the end, so hop from box to box
+    # rather than reading through mdat
+    brand = _major_brand(file_fullpath, f, file_size)
+    if brand not in QUICKTIME_BRANDS:
+        raise NativeMetadataUnsupported(file_fullpath, f"unfamiliar brand {brand}")
+
+    moov_start = None
+    for box_type, content_start, box_end in _boxes(f, 0, file_size):
+        if box_type in VENDOR_BOXES:
+            raise NativeMetadataUnsupported(file_fullpath, "vendor metadata box")
+        if box_type == b"moov":
+            moov_start, moov_end = content_start, box_end
+    if moov_start == None:
+        raise NativeMetadataUnsupported(file_fullpath, "no moov box")
+
+    mvhd = None
+    for box_type, content_start, box_end in _boxes(f, moov_start, moov_end):
+        if box_type in VENDOR_BOXES:
+            raise NativeMetadataUnsupported(file_fullpath, "vendor metadata box")
+        if box_type == b"mvhd":
+            mvhd = content_start
+        elif box_type == b"udta":
+            for udta_type, udta_start, udta_end in _boxes(f, content_start, box_end):
+                if udta_type in VENDOR_BOXES:
+                    raise NativeMetadataUnsupported(
+                        file_fullpath, "vendor metadata box"
+                    )
+    if mvhd == None:
+        raise NativeMetadataUnsupported(file_fullpath, "no mvhd box")
+
+    f.seek(mvhd)
+    version = f.read(4)[0]
+    if version == 1:
+        created = struct.unpack(">Q", f.read(8))[0]
+    else:
+        created = struct.unpack(">I", f.read(4))[0]
+
+    # zero means nobody set it, and anything before 1970 is probably a camera that counted from the wrong epoch -
+    # exiftool has its own ideas about both, so let it have them
+    if created < QUICKTIME_EPOCH_OFFSET:
+        raise NativeMetadataUnsupported(file_fullpath, "no usable mvhd date")
+
+    created_date = datetime.datetime(1970, 1, 1) + datetime.timedelta(
+        seconds=created - QUICKTIME_EPOCH_OFFSET
+    )
+    return QUICKTIME_BRANDS[brand], {
+        "QuickTime:CreateDate": created_date.strftime("%Y:%m:%d %H:%M:%S")
+    }
+
+
+def read_heic(file_fullpath: str, f, file_size: int) -> Tuple[str, dict]:
+    # EXIF in a HEIC is an item of type "Exif" - iinf says which item id it is, iloc says where its bytes are
+    brand = _major_brand(file_fullpath, f, file_size)
+    if brand not in HEIC_BRANDS:
+        raise NativeMetadataUnsupported(file_fullpath, f"unfamiliar brand {brand}")
+
+    meta_start, meta_end = _find_box(f, 0, file_size, b"meta")
+    if meta_start == None:
+        raise NativeMetadataUnsupported(file_fullpath, "no meta box")
+    # meta is a full box - skip its version and flags
+    meta_start += 4
+
+    exif_item = None
+    iinf_start, iinf_end = _find_box(f, meta_start, meta_end, b"iinf")
+    if iinf_start != None:
+        f.seek(iinf_start)
+        version = f.read(4)[0]
+        entries_start = iinf_start + 4 + (2 if version == 0 else 4)
+        for box_type, content_start, box_end in _boxes(f, entries_start, iinf_end):
+            if box_type != b"infe":
+                continue
+            f.seek(content_start)
+            infe = f.read(min(box_end - content_start, 16))
+            if infe[0] == 2:
+                item_id = struct.unpack_from(">H", infe, 4)[0]
+                item_type = infe[8:12]
+            elif infe[0] == 3:
+                item_id = struct.unpack_from(">I", infe, 4)[0]
+                item_type = infe[10:14]
+            else:
+                continue
+            if item_type == b"Exif":
+                exif_item = item_id
+                break
+    if exif_item == None:
+        return HEIC_BRANDS[brand], {}
+
+    iloc_start, iloc_end = _find_box(f, meta_start, meta_end, b"iloc")
+    if iloc_start == None:
+        raise NativeMetadataUnsupported(file_fullpath, "no iloc box")
+    f.seek(iloc_start)
+    iloc = f.read(iloc_end - iloc_start)
+    exif_offset, exif_length = _iloc_extent(file_fullpath, iloc, exif_item)
+
+    # the item starts with how far in the TIFF header is (normally past "Exif\0\0")
+    f.seek(exif_offset)
+    exif = f.read(min(exif_length, MAX_SEGMENT_SIZE))
+    tiff_offset = 4 + struct.unpack_from(">I", exif)[0]
+    return HEIC_BRANDS[brand], read_tiff_dates(file_fullpath, exif[tiff_offset:])
+
+
+def _iloc_extent(file_fullpath: str, iloc: bytes, wanted_item: int) -> Tuple[int, int]:
+    # returns (file offset, length) of the item - only single extent items stored in the file itself
+    version = iloc[0]
+    offset_size = iloc[4] >> 4
+    length_size = iloc[4] & 0x0F
+    base_offset_size = iloc[5] >> 4
+    index_size = iloc[5] & 0x0F if version in (1, 2) else 0
+    position = 6
+    if version < 2:
+        item_count = struct.unpack_from(">H", iloc, position)[0]
+        position += 2
+    else:
+        item_count = struct.unpack_from(">I", iloc, position)[0]
+        position += 4
+
+    def read_sized(position: int, size: int) -> Tuple[int, int]:
+        if size == 0:
+            return 0, position
+        value = int.from_bytes(iloc[position : position + size], "big")
+        return value, position + size
+
+    for i in range(item_count):
+        if version < 2:
+            item_id = struct.unpack_from(">H", iloc, position)[0]
+            position += 2
+        else:
+            item_id = struct.unpack_from(">I", iloc, position)[0]
+            position += 4
+        construction_method = 0
+        if version in (1, 2):
+            construction_method = struct.unpack_from(">H", iloc, position)[0] & 0x0F
+            position += 2
+        position += 2  # data_reference_index
+        base_offset, position = read_sized(position, base_offset_size)
+        extent_count = struct.unpack_from(">H", iloc, position)[0]
+        position += 2
+
+        extents = []
+        for e in range(extent_count):
+            extent_index, position = read_sized(position, index_size)
+            extent_offset, position = read_sized(position, offset_size)
+            extent_length, position = read_sized(position, length_size)
+            extents.append((base_offset + extent_offset, extent_length))
+
+        if item_id == wanted_item:
+            if construction_method != 0 or len(extents) != 1:
+                raise NativeMetadataUnsupported(
+                    file_fullpath, "EXIF item isn't one plain extent"
+                )
+            return extents[0]
+
+    raise NativeMetadataUnsupported(file_fullpath, "EXIF item isn't in iloc")
+
+
+def read_metadata(file_fullpath: str) -> dict:
+    # the same keys exiftool would have given ImageFile, or NativeMetadataUnsupported if this file needs exiftool
+    # only answers when it found a date that select_date_metadata() will take - exiftool knows about a lot more date
+    # tags (IPTC, track dates, ...) than this does, so anything without one goes to exiftool to find them
+    extension = file_fullpath[file_fullpath.rfind(".") :].lower()
+    with open(file_fullpath, "rb") as f:
+        stat_result = os.fstat(f.fileno())
+        if extension in (".jpg", ".jpeg", ".jpe"):
+            mime_type, dates = read_jpeg(file_fullpath, f)
+        elif extension in (".mp4", ".mov"):
+            mime_type, dates = read_quicktime(file_fullpath, f, stat_result.st_size)
+        elif extension == ".heic":
+            mime_type, dates = read_heic(file_fullpath, f, stat_result.st_size)
+        else:
+            raise NativeMetadataUnsupported(file_fullpath, "not a format we parse")
+
+    if len(dates) == 0 or not all(imagefile.usable_date(d) for d in dates.values()):
+        raise NativeMetadataUnsupported(file_fullpath, "no usable date")
+
+    metadata = {"SourceFile": file_fullpath, "File:MIMEType": mime_type}
+    metadata.update(file_metadata(stat_result))
+    metadata.update(dates)
+    return metadata
+
+
+def split_native(files: list) -> Tuple[list, list]:
+    # returns (metadata for the files parsed here, the files that still need exiftool)
+    metadata = []
+    remaining = []
+    for file_fullpath in files:
+        try:
+            metadata.append(read_metadata(file_fullpath))
+        except NativeMetadataUnsupported as e:
+            logger.debug(str(e))
+            remaining.append(file_fullpath)
+        except (OSError, struct.error, IndexError, ValueError, OverflowError) as e:
+            # truncated or mangled - exiftool is better at making sense of those
+            logger.debug(f"{file_fullpath}: Native parse failed due to {str(e)}")
+            remaining.append(file_fullpath)
+    return metadata, remaining
@@ -0,0 +1,234 @@
+import logging
+import io
+import itertools
+from typing import Iterable, Iterator, Tuple
+from photo_organiser import hashing
+from photo_organiser import workpool
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    # HEIC only opens if pillow-heif is there too - without it they fail like any other file Pillow can't read
+    import pillow_heif
+
+    pillow_heif.register_heif_opener()
+except ImportError:
+    pillow_heif = None
+
+logger = logging.getLogger("perceptual")
+logger.setLevel(logging.WARN)
+
+if numpy != None:
+    POPCOUNT_TABLE = numpy.array([bin(i).count("1") for i in range(256)], numpy.uint8)
+
+# the thumbnail is HASH_SIZE + 1 wide and HASH_SIZE high, giving HASH_SIZE * HASH_SIZE bits - 64 fits in an int nicely
+HASH_SIZE = 8
+
+# how many pieces near_pairs() cuts a hash into.  Four 16 bit pieces means up to --near 3 only needs exact lookups,
+# and up to 7 needs each piece and the 16 values a bit away from it
+CHUNKS = 4
+
+# what find_duplicates.py --near looks at - the rest are movies
+IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".jpe", ".png", ".heic"]
+
+
+def available() -> bool:
+    return numpy != None and Image != None
+
+
+def is_image(file_fullpath: str) -> bool:
+    return any(file_fullpath.lower().endswith(ext) for ext in IMAGE_EXTENSIONS)
+
+
+def dhash(image) -> int:
+    # difference hash - shrink to a (HASH_SIZE + 1) x HASH_SIZE greyscale thumbnail and keep one bit per pixel for
+    # whether it's brighter than the one to its right.  Survives recompression, resizing and format changes, which is
+    # exactly what a byte-for-byte hash doesn't
+    # draft() lets the JPEG decoder scale down by up to 8x while it decodes, so a 12MP photo never gets decoded in full
+    image.draft("L", ((HASH_SIZE + 1) * 8, HASH_SIZE * 8))
+    # a copy that's been rotated for real should match the original with an orientation tag
+    image = ImageOps.exif_transpose(image)
+    thumbnail = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+
+    pixels = numpy.asarray(thumbnail, dtype=numpy.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int.from_bytes(numpy.packbits(bits).tobytes(), "big")
+
+
+# this needs to live at module level so it can be pickled across to a process pool
+def fingerprint_file(
+    file_fullpath: str, algorithm: str = hashing.DEFAULT_ALGORITHM
+) -> Tuple[str, int]:
+    # returns (file hash, dhash) from one read of the file - the file hash is what the dhash gets cached against
+    with open(file_fullpath, "rb") as f:
+        content = f.read()
+
+    with Image.open(io.BytesIO(content)) as image:
+        return hashing.hash_bytes(content, algorithm), dhash(image)
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def popcount(values):
+    # bits set in each of an array of uint64s - a byte at a time through a lookup table, which every numpy can do
+    return POPCOUNT_TABLE[values.view(numpy.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def flip_masks(bits: int, max_flips: int) -> list:
+    # every bits-wide mask with at most max_flips bits set - the chunk values within max_flips of a given one
+    masks = [0]
+    for flips in range(1, max_flips + 1):
+        for positions in itertools.combinations(range(bits), flips):
+            masks.append(sum(1 << position for position in positions))
+    return masks
+
+
+def near_pairs(values, max_distance: int) -> Tuple:
+    # multi-index hashing - returns (i, j) index arrays, i < j, for every pair of values within max_distance bits
+    # the hash is cut into CHUNKS pieces.  If two hashes are within max_distance, at least one piece can only differ by
+    # max_distance // CHUNKS bits (if they all differed by more the total would be over), so looking each piece up in
+    # a sorted index, along with the handful of values a bit or two away from it, finds every real pair without
+    # comparing everything with everything.  Only what the lookups turn up gets a full hamming distance
+    chunk_bits = (HASH_SIZE * HASH_SIZE) // CHUNKS
+    chunk_mask = numpy.uint64((1 << chunk_bits) - 1)
+    masks = flip_masks(chunk_bits, max_distance // CHUNKS)
+
+    found_i = []
+    found_j = []
+    for chunk in range(CHUNKS):
+        pieces = (values >> numpy.uint64(chunk * chunk_bits)) & chunk_mask
+        order = numpy.argsort(pieces, kind="stable")
+        sorted_pieces = pieces[order]
+
+        for mask in masks:
+            wanted = pieces ^ numpy.uint64(mask)
+            first = numpy.searchsorted(sorted_pieces, wanted, side="left")
+            last = numpy.searchsorted(sorted_pieces, wanted, side="right")
+            counts = last - first
+            total = int(counts.sum())
+            if total == 0:
+                continue
+
+            # one row per (value, matching value) - the matches sit in order[first:last] for each value
+            i = numpy.repeat(numpy.arange(len(values)), counts)
+            offsets = numpy.arange(total) - numpy.repeat(
+                numpy.cumsum(counts) - counts, counts
+            )
+            j = order[numpy.repeat(first, counts) + offsets]
+
+            keep = i < j
+            i = i[keep]
+            j = j[keep]
+            close = popcount(values[i] ^ values[j]) <= max_distance
+            found_i.append(i[close])
+            found_j.append(j[close])
+
+    if len(found_i) == 0:
+        return numpy.array([], dtype=numpy.int64), numpy.array([], dtype=numpy.int64)
+
+    # the same pair turns up once for every piece it's close on
+    pairs = numpy.unique(
+        numpy.stack([numpy.concatenate(found_i), numpy.concatenate(found_j)], axis=1),
+        axis=0,
+    )
+    return pairs[:, 0], pairs[:, 1]
+
+
+def near_duplicate_groups(fingerprints: dict, max_distance: int) -> list:
+    # fingerprints is {path: dhash} - returns a list of groups of files that are within max_distance of each other,
+    # directly or through other files in the group.  Each group is [(path, distance from the group's first file)],
+    # in the order the paths came in
+    by_hash = {}
+    for file_fullpath, value in fingerprints.items():
+        if value not in by_hash:
+            by_hash[value] = [file_fullpath]
+        else:
+            by_hash[value].append(file_fullpath)
+
+    # union-find over the distinct hashes
+    distinct = list(by_hash.keys())
+    parent = {value: value for value in distinct}
+
+    def find(value):
+        while parent[value] != value:
+            parent[value] = parent[parent[value]]
+            value = parent[value]
+        return value
+
+    pairs_i, pairs_j = near_pairs(
+        numpy.array(distinct, dtype=numpy.uint64), max_distance
+    )
+    for i, j in zip(pairs_i.tolist(), pairs_j.tolist()):
+        a = find(distinct[i])
+        b = find(distinct[j])
+        if a != b:
+            parent[b] = a
+
+    order = {file_fullpath: i for i, file_fullpath in enumerate(fingerprints)}
+    members = {}
+    for value, files in by_hash.items():
+        root = find(value)
+        if root not in members:
+            members[root] = []
+        members[root].extend(files)
+
+    groups = []
+    for files in members.values():
+        if len(files) < 2:
+            continue
+        files.sort(key=order.get)
+        first = fingerprints[files[0]]
+        groups.append(
+            [
+                (file_fullpath, hamming(first, fingerprints[file_fullpath]))
+                for file_fullpath in files
+            ]
+        )
+    groups.sort(key=lambda group: order[group[0][0]])
+    return groups
+
+
+class PerceptualEngine:
+    # decoding images is CPU work that mostly holds the GIL, so unlike HashEngine this defaults to processes
+    # reads still go through the device gating, so a slow disk doesn't get more than io_concurrency readers at once
+    pool: workpool.DevicePool
+    algorithm: str
+
+    def __init__(
+        self,
+        workers: int = None,
+        io_concurrency: int = workpool.DEFAULT_IO_CONCURRENCY,
+        use_processes: bool = True,
+        algorithm: str = hashing.DEFAULT_ALGORITHM,
+    ):
+        self.pool = workpool.DevicePool(workers, io_concurrency, use_processes)
+        self.algorithm = algorithm
+
+    def fingerprint_files(
+        self, files: Iterable[Tuple[str, int]]
+    ) -> Iterator[Tuple[str, Tuple[str, int]]]:
+        # files are (path, st_dev) - yields (path, (file hash, dhash)) as each one finishes
+        for file_fullpath, result, error in self.pool.imap_unordered(
+            fingerprint_file,
+            (
+                (file_fullpath, (("read", device),), (file_fullpath, self.algorithm))
+                for file_fullpath, device in files
+            ),
+        ):
+            if error != None:
+                print(f"Failed to fingerprint {file_fullpath} due to {str(error)}")
+                continue
+            yield file_fullpath, result
+
+    def close(self) -> None:
+        self.pool.close()
@@ -1,9 +1,16 @@
 import multiprocessing
 from multiprocessing import JoinableQueue
 import logging
-import os
-import datetime
+import sys
+import time
+import queue
 from photo_organiser import imagefile
+from photo_organiser import cache
+from photo_organiser import walker
+from photo_organiser import exifbatch
+from photo_organiser import imagebatch
+from photo_organiser import incremental
+from photo_organiser import metrics
 import exiftool
 import csv
 from typing import Tuple
@@ -13,41 +20,19 @@ logger.setLevel(logging.INFO)
 
 
 def run_fast_scandir(
-    dir, ext: list, output_queue: JoinableQueue
+    dir, ext: list, output_queue: JoinableQueue, workers: int = 1
 ) -> Tuple[list, list, list]:  # dir: str, ext: list
-    subfolders, files, ignored = [], [], []
-
-    for f in os.scandir(dir):
-        if f.is_dir():
-            subfolders.append(f.path)
-        if f.is_file():
-            if os.path.splitext(f.name)[1].lower() in ext:
-                files.append(f.path)
-            else:
-                logger.debug(f"{f} ignored due to filetype")
-                ignored.append(f.path)
-
-    batch = []
-    counter = 0
-    for f in files:
-        batch.append(f)
-        counter += 1
-        if counter == 400:
-            output_queue.put(batch)
-            batch = []
-            counter = 0
-
-    # for any extras left in the batch beyond the last 100
-    if len(batch) > 0:
+    # batches get pushed to output_queue as they're found - the returned lists are just for anyone who wants a summary
+    files = []
+
+    def push_batch(batch: list) -> None:
         output_queue.put(batch)
+        files.extend(batch)
 
-    for dir in list(subfolders):
-        sf, f, ign = run_fast_scandir(dir, ext, output_queue)
-        subfolders.extend(sf)
-        files.extend(f)
-        ignored.extend(ign)
+    tree_walker = walker.TreeWalker(ext, workers)
+    tree_walker.walk(dir, push_batch)
 
-    return subfolders, files, ignored
+    return tree_walker.subfolders, files, tree_walker.ignored
 
 
 #    # best tool ever https://regex101.com/
@@ -61,17 +46,38 @@ class ExifConsumer(multiprocessing.Process):
     input_queue: JoinableQueue
     output_queue: JoinableQueue
     destination_root: str
-    et: exiftool.ExifToolHelper
-
-    def __init__(self, input_queue, output_queue, destination_root):
+    cache_path: str
+    native: bool
+    status_queue: JoinableQueue
+
+    def __init__(
+        self,
+        input_queue,
+        output_queue,
+        destination_root,
+        cache_path=None,
+        native=False,
+        status_queue=None,
+    ):
         multiprocessing.Process.__init__(self)
         self.input_queue = input_queue
         self.output_queue = output_queue
         self.destination_root = destination_root
-        self.et = exiftool.ExifToolHelper()
+        self.cache_path = cache_path
+        self.native = native
+        self.status_queue = status_queue
 
     def run(self) -> None:
         proc_name = self.name
+        # has to be opened in here rather than __init__ - this is the child process
+        et = exiftool.ExifToolHelper()
+        file_cache = None
+        if self.cache_path != None:
+            file_cache = cache.FileCache(self.cache_path)
+
+        batcher = exifbatch.AdaptiveBatcher(native=self.native)
+        progress = metrics.MetricsClient(self.status_queue)
+
         files_media = 0
         files_skipped = 0
         files_total = 0
@@ -85,41 +91,50 @@ class ExifConsumer(multiprocessing.Process):
                 logger.debug(
                     f"{proc_name}: Finished exif analysis. Found {files_total} in total ({files_media} valid, {files_skipped} ignored). Process exiting successfully."
                 )
+                if file_cache != None:
+                    file_cache.close()
+                et.terminate()
+                progress.flush()
+                # batching stats go back to the parent just ahead of the poison pill
+                self.output_queue.put(batcher.final_stats())
                 self.output_queue.put(None)
                 self.input_queue.put(None)
                 break
 
-            error_encountered = False
-            try:
-                metadata = self.et.get_metadata(next_task)
-            except Exception as e:
-                error_encountered = True
-
-            # find out which file in the batch caused the error - need to run get_metadata file by file to do it
-            if error_encountered:
-                metadata = []
-                for task in next_task:
-                    try:
-                        metadata.append(self.et.get_metadata(task)[0])
-                    except Exception as e:
-                        print(
-                            f"Error on {task} - usually this is caused by bad characters in the filesystem path"
-                        )
+            batch_size = len(next_task)
+
+            # anything that hasn't changed since last run doesn't need to go near exiftool
+            if file_cache != None:
+                cached_metadata, next_task = file_cache.split_metadata(next_task)
+            else:
+                cached_metadata = []
+
+            # the batcher re-cuts the walker's batch to whatever size is working, and bisects around any bad files
+            metadata = batcher.extract(et, next_task)
 
-            for d in metadata:
+            if file_cache != None:
+                for d in metadata:
+                    file_cache.set_metadata(d["SourceFile"], d)
+                file_cache.commit()
+
+            progress.add(
+                "exif",
+                files=batch_size,
+                errors=batch_size - len(cached_metadata) - len(metadata),
+            )
+
+            images = []
+            for d in cached_metadata + metadata:
                 # now fan out - create images out of each directory search batch
                 files_total += 1
                 try:
-                    self.output_queue.put(
+                    images.append(
                         imagefile.ImageFile(
                             source_fullpath=d["SourceFile"],
                             destination_root=self.destination_root,
                             metadata=d,
                         )
                     )
-                    logging.debug(
-                        f"{d['SourceFile']}: Pushed new media object to queue"
-                    )
                     files_media += 1
                     if files_total % 100 == 0:
                         logging.debug(
@@ -132,31 +147,82 @@ class ExifConsumer(multiprocessing.Process):
                     )
                     files_skipped += 1
 
+            # the whole batch goes back in one go - packed into shared memory, with just its name on the queue
+            if len(images) > 0:
+                self.output_queue.put(imagebatch.SharedBatch(images))
+                logging.debug(
+                    f"{proc_name}: Pushed {len(images)} new media objects to queue"
+                )
+
 
 class SearchConsumer(multiprocessing.Process):
     input_queue: JoinableQueue
     output_queue: JoinableQueue
-
-    def __init__(self, input_queue, output_queue):
+    walkers: int
+    cache_path: str
+    incremental_mode: bool
+    status_queue: JoinableQueue
+
+    def __init__(
+        self,
+        input_queue,
+        output_queue,
+        walkers=walker.DEFAULT_WALKERS,
+        cache_path=None,
+        incremental_mode=False,
+        status_queue=None,
+    ):
         multiprocessing.Process.__init__(self)
         self.input_queue = input_queue
         self.output_queue = output_queue
+        self.walkers = walkers
+        self.cache_path = cache_path
+        self.incremental_mode = incremental_mode
+        self.status_queue = status_queue
 
     def run(self) -> None:
-        ext = [".mov", ".jpg", ".heic", ".mp4", ".png", ".jpeg", ".3gp", ".avi", ".jpe"]
         proc_name = self.name
+        ignored = []
+        progress = metrics.MetricsClient(self.status_queue)
+
+        def push_batch(batch: list) -> None:
+            self.output_queue.put(batch)
+            progress.add("walked", files=len(batch))
+
+        # has to be opened in here rather than __init__ - this is the child process
+        file_cache = None
+        state = None
+        if self.incremental_mode and self.cache_path != None:
+            file_cache = cache.FileCache(self.cache_path)
+            state = incremental.IncrementalState(file_cache)
+
         while True:
             next_task = self.input_queue.get()
             self.input_queue.task_done()
             if next_task is None:
                 # Poison pill means shutdown
+                progress.flush()
                 self.output_queue.put(None)
                 # pass on the poison pill
                 self.input_queue.put(None)
                 # self.input_queue.task_done()
                 break
 
-            sf, f, ignored = run_fast_scandir(next_task, ext, self.output_queue)
+            # the walker threads push straight onto the output queue, so exif can start on the first directory
+            # while the rest of the tree is still being walked
+            tree_walker = walker.TreeWalker(
+                walker.EXTENSIONS, self.walkers, state=state
+            )
+            tree_walker.walk(next_task, push_batch)
+            ignored.extend(tree_walker.ignored)
+            if state != None:
+                logger.debug(
+                    f"{proc_name}: Reused {state.reused} directory listings, rescanned {state.rescanned}, skipped {tree_walker.already_decided} files already decided"
+                )
+
+        if file_cache != None:
+            state.save(file_cache)
+            file_cache.close()
 
         ignored_file = open("ignored.log", "w", newline="", encoding="utf-8")
         ignored_writer = csv.writer(ignored_file, delimiter=",", quotechar='"')
@@ -168,36 +234,79 @@ class SearchConsumer(multiprocessing.Process):
 
 
 class StatusConsumer(multiprocessing.Process):
+    # the one place progress gets drawn from.  Every other process (and thread) counts with a metrics.MetricsClient,
+    # which sends its counts here a few times a second - this adds them up and redraws one status line at a fixed rate
+    # whatever's going on, and writes the lot to metrics_path as JSON at the end if asked to
     input_queue: JoinableQueue
-
-    def __init__(self, input_queue):
-        multiprocessing.Process.__init__(self)
+    metrics_path: str
+    refresh_seconds: float
+
+    def __init__(
+        self,
+        input_queue,
+        metrics_path=None,
+        refresh_seconds=metrics.DEFAULT_REFRESH_SECONDS,
+    ):
+        # daemon, so if whatever started it falls over before sending the poison pill, python can still exit rather than
+        # waiting on a status line forever
+        multiprocessing.Process.__init__(self, daemon=True)
         self.input_queue = input_queue
+        self.metrics_path = metrics_path
+        self.refresh_seconds = refresh_seconds
 
     def run(self) -> None:
-        proc_name = self.name
-        last_state = {}
+        report = metrics.MetricsReport()
+        interactive = sys.stdout.isatty()
+        if interactive:
+            refresh_seconds = self.refresh_seconds
+        else:
+            refresh_seconds = metrics.LOG_REFRESH_SECONDS
+        last_draw = time.monotonic()
+        last_length = 0
+
         while True:
-            next_task = self.input_queue.get()
-            self.input_queue.task_done()
+            try:
+                next_task = self.input_queue.get(timeout=self.refresh_seconds)
+                self.input_queue.task_done()
+            except queue.Empty:
+                next_task = False
+
             if next_task is None:
                 # Poison pill means shutdown
-                self.input_queue.put(None)
-                self.input_queue.task_done()
                 break
 
-            # assume next_task is a dict
-            # next_task['proc_name'] = "ProcessorConsumer4"
-            # next_task['queue_size'] = 500
-            # next_task['processed'] = 10
-            last_state[next_task["proc_name"]] = next_task
+            if next_task != False:
+                report.merge(next_task)
+
+            if (
+                time.monotonic() - last_draw >= refresh_seconds
+                and len(report.stages) > 0
+            ):
+                last_length = self.draw(report, interactive, last_length)
+                last_draw = time.monotonic()
 
-            # if seconds % 5 == 0 then show a status update
-            #
-            a = datetime.datetime.now()
-            if a.second % 5 == 0:
-                for t in last_state:
-                    print(f'{t["proc_name"]}')
-                pass
+        if len(report.stages) > 0:
+            self.draw(report, interactive, last_length)
+            if interactive:
+                print()
+
+        if self.metrics_path != None:
+            try:
+                report.write_json(self.metrics_path)
+            except OSError as e:
+                logger.error(
+                    f"{self.metrics_path}: Failed to write metrics due to {str(e)}"
+                )
 
         return
+
+    def draw(
+        self, report: metrics.MetricsReport, interactive: bool, last_length: int
+    ) -> int:
+        line = report.status_line()
+        if interactive:
+            # pad out to whatever was there before, so a shorter line doesn't leave the end of the last one behind
+            print(f"\r{line.ljust(last_length)}", end="", flush=True)
+        else:
+            print(line, flush=True)
+        return len(line)
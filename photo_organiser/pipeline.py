@@ -0,0 +1,176 @@
+import logging
+import queue
+import threading
+from typing import Iterator
+from photo_organiser import executor
+
+logger = logging.getLogger("pipeline")
+logger.setLevel(logging.WARN)
+
+# how many finished destinations import.py --pipeline waits for before deciding and executing them as one lot - big
+# enough that the hash engine and the move waves get something to chew on, small enough that moves start early
+DEFAULT_CHUNK_SIZE = 500
+
+
+def file_name(file_fullpath: str) -> str:
+    return file_fullpath[(file_fullpath.rfind("/") + 1) :]
+
+
+class CompletionTracker:
+    # works out which destinations can't get any more contenders, while exif is still going.  Every contender for
+    # root/YYYY/MM/name is called name, so once the walk's finished and every walked file called name has been back
+    # through exif, every destination ending in name has everything it's ever going to have
+    # files walked from inside the destination root get remembered too - a destination that's also one of the input
+    # files can't be moved into until that file has gone wherever it's going, so those wait until the end
+    walk_finished: bool
+
+    def __init__(self, destination_root: str, index_key=None):
+        self.destination_root = destination_root
+        self.index_key = index_key if index_key != None else (lambda path: path)
+        self.walk_finished = False
+        # name -> walked files with that name that haven't been through exif yet
+        self._remaining = {}
+        # name -> ids of destinations ending in it that haven't been handed out yet
+        self._destinations = {}
+        self._ready = []  # names whose destinations are ready to hand out
+        self._walked_in_destination = set()
+
+    def walked(self, files: list) -> None:
+        for file_fullpath in files:
+            name = file_name(file_fullpath)
+            self._remaining[name] = self._remaining.get(name, 0) + 1
+            if file_fullpath.startswith(self.destination_root + "/"):
+                self._walked_in_destination.add(self.index_key(file_fullpath))
+
+    def walk_done(self) -> None:
+        self.walk_finished = True
+        # anything that was already all the way through exif by the time the walk finished
+        for name in self._destinations:
+            if name not in self._remaining:
+                self._ready.append(name)
+
+    def add_destination(self, destination_fullpath: str, destination_id: int) -> None:
+        name = file_name(destination_fullpath)
+        if name not in self._destinations:
+            self._destinations[name] = [destination_id]
+        else:
+            self._destinations[name].append(destination_id)
+
+    def exifed(self, files: list) -> None:
+        # files are back from exif - whether they turned into candidates or not
+        for file_fullpath in files:
+            name = file_name(file_fullpath)
+            self._remaining[name] -= 1
+            if self._remaining[name] == 0:
+                del self._remaining[name]
+                if self.walk_finished and name in self._destinations:
+                    self._ready.append(name)
+
+    def ready_count(self) -> int:
+        return len(self._ready)
+
+    def take_ready(self, candidates) -> list:
+        # destination ids that are safe to decide and execute now
+        ready = []
+        for name in self._ready:
+            for destination_id in self._destinations.pop(name, []):
+                if self._waits_for_input(candidates, destination_id):
+                    # goes back in the pile for take_rest()
+                    self.add_destination(
+                        candidates.destination_paths[destination_id], destination_id
+                    )
+                else:
+                    ready.append(destination_id)
+        self._ready = []
+        return ready
+
+    def take_rest(self) -> list:
+        # everything that hasn't been handed out - for once exif is finished
+        rest = []
+        for destination_ids in self._destinations.values():
+            rest.extend(destination_ids)
+        self._destinations = {}
+        self._ready = []
+        return sorted(rest)
+
+    def _waits_for_input(self, candidates, destination_id: int) -> bool:
+        destination_fullpath = candidates.destination_paths[destination_id]
+        if self.index_key(destination_fullpath) not in self._walked_in_destination:
+            return False
+        # it's fine if the input file sitting there is one of this destination's own contenders
+        image_id = candidates.source_ids.get(destination_fullpath)
+        return image_id == None or candidates.destination_of[image_id] != destination_id
+
+
+def run_actions(
+    action_executor: executor.ActionExecutor,
+    losers: list,
+    winners: list,
+    dryrun: bool = False,
+) -> Iterator[tuple]:
+    # every delete, then every move, as ("deleted", source, error) and ("moved", source, destination, copied hash, error)
+    # a dry run says they all worked without touching anything
+    if dryrun == False:
+        deletes = action_executor.delete_files(losers)
+    else:
+        deletes = ((source_fullpath, None) for source_fullpath in losers)
+    for source_fullpath, error in deletes:
+        yield "deleted", source_fullpath, error
+
+    if dryrun == False:
+        moves = action_executor.move_files(winners)
+    else:
+        moves = ((this_move[0], this_move[1], None, None) for this_move in winners)
+    for source_fullpath, destination_fullpath, copied_hash, error in moves:
+        yield "moved", source_fullpath, destination_fullpath, copied_hash, error
+
+
+class ActionThread(threading.Thread):
+    # runs each lot of deletes and moves import.py --pipeline hands it, in the order they're handed over, while the
+    # main thread gets on with exif and deciding.  Nothing here touches the state machine or the cache - what happened
+    # goes back on results for the main thread to record, with a ("done", tag) once each lot has finished
+    def __init__(self, action_executor: executor.ActionExecutor, dryrun: bool = False):
+        threading.Thread.__init__(self, name="actions", daemon=True)
+        self.action_executor = action_executor
+        self.dryrun = dryrun
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+
+    def submit(self, losers: list, winners: list, tag=None) -> None:
+        self.jobs.put((losers, winners, tag))
+
+    def finish(self) -> None:
+        # poison pill - whatever's been submitted still gets done first
+        self.jobs.put(None)
+
+    def run(self) -> None:
+        while True:
+            job = self.jobs.get()
+            if job == None:
+                break
+
+            losers, winners, tag = job
+            try:
+                for result in run_actions(
+                    self.action_executor, losers, winners, self.dryrun
+                ):
+                    self.results.put(result)
+            except Exception as e:
+                # the pool itself falling over rather than a single file - report it and carry on with the next lot
+                logger.error(
+                    f"Failed to run a lot of deletes and moves due to {str(e)}"
+                )
+            self.results.put(("done", tag))
+
+    def completed(self, wait: bool = False) -> Iterator[tuple]:
+        # whatever's come back so far - or with wait, everything up to the poison pill
+        while True:
+            try:
+                if wait and self.is_alive():
+                    yield self.results.get(timeout=0.1)
+                else:
+                    yield self.results.get_nowait()
+            except queue.Empty:
+                if wait and self.is_alive():
+                    continue
+                return
@@ -1,187 +1,572 @@
 import logging
 import os
-import exiftool
+from typing import Iterable, Iterator, Tuple
 from photo_organiser import imagefile
+from photo_organiser import cache
+from photo_organiser import exifpool
+from photo_organiser import incremental
+from photo_organiser import candidatestore
+from photo_organiser import vectordecide
+from photo_organiser import hashengine
+from photo_organiser import hashing
+from photo_organiser import metrics
 
 logger = logging.getLogger("statemachine")
 logger.setLevel(logging.WARN)
 
 
 class PhotoMachine:
-    # this holds a dict of the ImageObjects
-    ImageObjects_by_source = {}
-
-    # this holds a dict of references to the image - allows me to search for source images that want to create this destination image
-    # the reference here is the destination_fullpath, and this contains an array. looks like this:
-    # ImageObjects_by_destination["c:/dest/foo.jpg"][0] = "c:/source/folder1/foo.jpg"
-    # ImageObjects_by_destination["c:/dest/foo.jpg"][1] = "c:/source/folder2/foo.jpg"
-    ImageObjects_by_destination = {}
+    # every image, and every destination with the ids of the images that want it and a pointer to whichever one won
+    candidates: candidatestore.CandidateStore
 
     # holds a list of destination paths that already exist and therefore need to be exif'd
-    existing_images = []
+    existing_images: list
+
+    # every file already sitting in a YYYY/MM folder under the destination root - built once up front so add_image()
+    # is a set lookup instead of an isfile() round trip per image, which hurts on a NAS
+    existing_destinations: set
+    case_insensitive: bool = False
+
+    # also look for byte-identical winners across different destinations (same photo, different name)
+    content_dedupe: bool = False
+
+    # "loop" goes destination by destination through is_better(), "vector" settles them all at once with numpy
+    decide_engine: str = "loop"
+
+    # shared with the import pipeline - there's no point starting a second lot of exiftools for process_exif()
+    exif_pool: exifpool.ExifToolPool
+    file_cache: cache.FileCache = None
+
+    # progress goes to the status process through this - a client with no queue just drops it
+    progress: metrics.MetricsClient
+
+    # what tie-break and dedupe hashes are made with - cached hashes made any other way don't count
+    hash_algorithm: str = hashing.DEFAULT_ALGORITHM
+
+    def __init__(
+        self,
+        destination_root,
+        cache_path=None,
+        content_dedupe=False,
+        incremental_mode=False,
+        decide_engine="loop",
+        exif_pool=None,
+        progress=None,
+        hash_algorithm=hashing.DEFAULT_ALGORITHM,
+    ):
+        self.destination_root = destination_root
+        self.content_dedupe = content_dedupe
+        self.decide_engine = decide_engine
+        if decide_engine == "vector" and not vectordecide.available():
+            logger.warning(
+                f"numpy isn't installed - deciding one destination at a time"
+            )
+            self.decide_engine = "loop"
+        if exif_pool == None:
+            exif_pool = exifpool.ExifToolPool(1)
+        self.exif_pool = exif_pool
+        if progress == None:
+            progress = metrics.MetricsClient()
+        self.progress = progress
+        self._totals = {}
+        self.hash_algorithm = hash_algorithm
+        if cache_path != None:
+            self.file_cache = cache.FileCache(cache_path)
+
+        self.candidates = candidatestore.CandidateStore(destination_root)
+        self.existing_images = []
+
+        state = None
+        if incremental_mode and self.file_cache != None:
+            state = incremental.IncrementalState(self.file_cache)
+        self.index_destination(state)
+
+    def index_destination(self, state: incremental.IncrementalState = None) -> None:
+        self.case_insensitive = self._is_case_insensitive()
+        self.existing_destinations = set()
+
+        # generate_destination() only ever makes root/YYYY/MM/file, so that's the only bit of the tree worth scanning
+        for year in os.scandir(self.destination_root):
+            if not (year.is_dir() and len(year.name) == 4):
+                continue
+            for month in os.scandir(year.path):
+                if not (month.is_dir() and len(month.name) == 2):
+                    continue
+                month_folder = (
+                    self.destination_root + "/" + year.name + "/" + month.name + "/"
+                )
+                for name in self._month_files(month.path, state):
+                    self.existing_destinations.add(self._index_key(month_folder + name))
 
-    et: exiftool.ExifToolHelper
+        logger.debug(
+            f"Indexed {len(self.existing_destinations)} existing files under {self.destination_root}"
+        )
 
-    def __init__(self, destination_root):
-        self.destination_root = destination_root
-        self.et = exiftool.ExifToolHelper()
+        if state != None:
+            state.save(self.file_cache)
+
+    def _month_files(
+        self, month_path: str, state: incremental.IncrementalState = None
+    ) -> list:
+        # a month folder that hasn't changed since the last run doesn't need listing again
+        mtime_ns = None
+        if state != None:
+            mtime_ns, subdirs, files = state.lookup(month_path)
+            if files != None:
+                return files
+
+        files = []
+        subdirs = []
+        for f in os.scandir(month_path):
+            if f.is_file():
+                files.append(f.name)
+            elif f.is_dir():
+                subdirs.append(f.name)
+
+        if state != None:
+            state.record(month_path, mtime_ns, subdirs, files)
+        return files
+
+    def _is_case_insensitive(self) -> bool:
+        # isfile() on Windows and (by default) macOS doesn't care about case, so the index can't either
+        if os.name == "nt":
+            return True
+        swapped = self.destination_root.swapcase()
+        if swapped == self.destination_root or not os.path.exists(swapped):
+            return False
+        return os.path.samefile(swapped, self.destination_root)
+
+    def _index_key(self, file_fullpath: str) -> str:
+        if self.case_insensitive:
+            return file_fullpath.casefold()
+        return file_fullpath
+
+    def destination_exists(self, file_fullpath: str) -> bool:
+        return self._index_key(file_fullpath) in self.existing_destinations
+
+    def record_delete(self, file_fullpath: str) -> None:
+        # keep the index honest as the execute phase changes the destination tree
+        self.existing_destinations.discard(self._index_key(file_fullpath))
+
+    def record_move(self, source_fullpath: str, destination_fullpath: str) -> None:
+        self.existing_destinations.discard(self._index_key(source_fullpath))
+        self.existing_destinations.add(self._index_key(destination_fullpath))
 
     def add_image(self, the_image: imagefile.ImageFile) -> None:
-        # store the image
-        self.ImageObjects_by_source[the_image.source_fullpath] = the_image
+        destination_id, new_destination = self.candidates.add(the_image)
 
         # check if this is the first source image that has wanted to write to this destination
-        if (
-            the_image.destination_fullpath
-            not in self.ImageObjects_by_destination.keys()
-        ):
-            # a List to hold a reference back to the source file - can be used for lookups against ImageObjects_by_source
-            self.ImageObjects_by_destination[the_image.destination_fullpath] = []
+        # there's some special logic here - there might be a file that already exists at that destination
+        if new_destination and self.destination_exists(the_image.destination_fullpath):
+            # there's a file there
+            self.existing_images.append(the_image.destination_fullpath)
+
+        # no else needed - don't care if there's not a file there
+
+    def add_images(self, images: list) -> None:
+        # a whole batch at once, in order - what the --exif process consumers send back.  Same as add_image() on each
+        # one, but the store takes them in one go
+        for destination_id in self.candidates.add_batch(images):
+            destination_fullpath = self.candidates.destination_paths[destination_id]
+            if self.destination_exists(destination_fullpath):
+                self.existing_images.append(destination_fullpath)
+
+    def process_exif(self, destination_ids: list = None) -> None:
+        # files already in the destination start out as stat-only candidates at the path they're sitting at.  The first
+        # thing is_better() looks at is file size, so an existing file bigger than everything it's up against wins
+        # without exiftool ever opening it - only the rest need their tag date, and they get it in batches
+        # destination_ids limits it to the files sitting at just those destinations
+        existing_images = self.existing_images
+        if destination_ids != None:
+            existing_images = [
+                self.candidates.destination_paths[destination_id]
+                for destination_id in destination_ids
+                if self.destination_exists(
+                    self.candidates.destination_paths[destination_id]
+                )
+            ]
+
+        needs_metadata = {}
+        for existing_image in existing_images:
+            if existing_image in self.candidates.source_ids:
+                # it's in the input as well, so it's already been exif'd
+                continue
 
-            # there's some special logic here - there might be a file that already exists at that destination
-            if os.path.isfile(the_image.destination_fullpath):
-                # there's a file there
-                self.existing_images.append(the_image.destination_fullpath)
+            try:
+                the_image = imagefile.ImageFile.from_stat(
+                    existing_image, self.destination_root, os.stat(existing_image)
+                )
+            except OSError as e:
+                logger.warning(f"{existing_image}: Failed to stat due to {str(e)}")
+                continue
+
+            largest_contender = max(
+                self.candidates.sizes[image_id]
+                for image_id in self.candidates.contenders[
+                    self.candidates.destination_ids[existing_image]
+                ]
+            )
+            self.add_image(the_image)
 
-            # no else needed - don't care if there's not a file there
+            if the_image.file_size <= largest_contender:
+                needs_metadata[existing_image] = the_image
 
-        self.ImageObjects_by_destination[the_image.destination_fullpath].append(
-            the_image.source_fullpath
+        logger.debug(
+            f"{len(existing_images) - len(needs_metadata)} of {len(existing_images)} existing files settled on size alone"
         )
 
-    def process_exif(self) -> None:
-        this_batch = []
-        batches = 0
-
-        # loop through all of the existing images
-        for f in self.existing_images:
-            # batch them into groups of 400
-            this_batch.append(f)
-
-            if len(this_batch) == 400:
-                # do the batch of 400
-                self.process_exif_batch(this_batch)
-                batches += 1
-                files_complete = batches * 400
-                # \x1b[1K
-                print(
-                    f"Processing exif for {len(self.existing_images)} existing files ({round(files_complete / len(self.existing_images) * 100,1)}% complete)",
-                    end="\r",
-                )
-
-                # its done, so reset to an empty List
-                this_batch = []
+        self.load_metadata(list(needs_metadata.values()), stage="existing")
+
+    def exif_batches(
+        self, batches: Iterable[list], stage: str = "exif"
+    ) -> Iterator[Tuple[list, list]]:
+        # yields (files, metadata) for each batch of paths, in order - whatever the cache already has comes straight
+        # back, and the rest goes across the exiftool pool.  The cache only ever gets touched from this thread
+        def split_cached(batches):
+            for files in batches:
+                if self.file_cache != None:
+                    cached_metadata, uncached = self.file_cache.split_metadata(files)
+                else:
+                    cached_metadata, uncached = [], files
+                yield (files, cached_metadata), uncached
 
-        # if there is more than 0 but less than 100 in the queue (last batch)
-        if len(this_batch) > 0:
-            self.process_exif_batch(this_batch)
-            print(
-                f"Processed exif for {len(self.existing_images)} existing files (100% complete)          ",
-                end="\r",
+        for (files, cached_metadata), metadata in self.exif_pool.imap(
+            split_cached(batches)
+        ):
+            if self.file_cache != None:
+                for d in metadata:
+                    self.file_cache.set_metadata(d["SourceFile"], d)
+                self.file_cache.commit()
+
+            self.progress.add(
+                stage,
+                files=len(files),
+                errors=len(files) - len(cached_metadata) - len(metadata),
             )
+            yield files, cached_metadata + metadata
+
+    def add_total(self, stage: str, files: int) -> None:
+        # totals only ever grow - import.py --pipeline decides (and hashes, and exifs existing files) a few
+        # destinations at a time, and each lot adds to what the status line is counting towards
+        self._totals[stage] = self._totals.get(stage, 0) + files
+        self.progress.set_total(stage, self._totals[stage])
+
+    def add_files(self, batches: Iterable[list], after_batch=None) -> Tuple[int, int]:
+        # walker batches in, candidates out - returns (valid media, skipped)
+        # after_batch gets each batch's paths once everything in it has been added, valid or not
+        files_media = 0
+        files_skipped = 0
+        for files, metadata in self.exif_batches(batches):
+            for d in metadata:
+                try:
+                    self.add_image(
+                        imagefile.ImageFile(
+                            source_fullpath=d["SourceFile"],
+                            destination_root=self.destination_root,
+                            metadata=d,
+                        )
+                    )
+                    files_media += 1
+                except imagefile.ImageNotValidError as e:
+                    logging.debug(f"{d['SourceFile']}: Invalid media object.  Skipped")
+                    files_skipped += 1
+
+            if after_batch != None:
+                after_batch(files)
+
+        return files_media, files_skipped
+
+    def load_metadata(self, images: list, stage: str = "exif") -> None:
+        # fetch exif for stat-only candidates, spread across the exiftool pool
+        needs_metadata = {}
+        for the_image in images:
+            if the_image.needs_metadata:
+                needs_metadata[the_image.source_fullpath] = the_image
+
+        this_run = list(needs_metadata.keys())
+        if len(this_run) == 0:
+            return
+        self.add_total(stage, len(this_run))
+        batch_size = self.exif_pool.batch_size
+        batches = (
+            this_run[position : position + batch_size]
+            for position in range(0, len(this_run), batch_size)
+        )
 
-    def process_exif_batch(self, this_batch: list) -> None:
-        metadata = self.et.get_metadata(this_batch)
-
-        for d in metadata:
-            self.add_image(
-                imagefile.ImageFile(
-                    source_fullpath=d["SourceFile"],
-                    destination_root=self.destination_root,
-                    metadata=d,
+        for this_batch, metadata in self.exif_batches(batches, stage):
+            for d in metadata:
+                the_image = needs_metadata.pop(
+                    cache.normalise_path(d["SourceFile"]), None
                 )
-            )
+                if the_image != None:
+                    the_image.load_metadata(d)
+                    self.candidates.refresh(
+                        self.candidates.id_of(the_image.source_fullpath)
+                    )
+
+            # exiftool couldn't read these - they fall back to their modified date, same as a file with no tags
+            for existing_image in this_batch:
+                if existing_image in needs_metadata:
+                    needs_metadata.pop(existing_image).load_metadata(None)
+                    self.candidates.refresh(self.candidates.id_of(existing_image))
 
     # return True if new is better than existing
     # or False if they're the same or existing is better
-    def is_better(
-        self, new: imagefile.ImageFile, existing: imagefile.ImageFile
-    ) -> bool:
+    # new and existing are candidate ids - everything compared here comes straight out of the store's arrays
+    def is_better(self, new: int, existing: int) -> bool:
+        candidates = self.candidates
+
         # check size
-        if new.file_size > existing.file_size:
+        if candidates.sizes[new] > candidates.sizes[existing]:
             return True, "file size is larger"
 
         # check mod date - if new is older, go with it (maybe it got edited or stat updated or something)
-        if new.tag_date < existing.tag_date:
+        if candidates.dates[new] < candidates.dates[existing]:
             return True, "tag date is older"
 
         # check hash - if its the same file, then the existing isn't better
-        if new.get_hash() == existing.get_hash():
-            if new.destination_root in new.source_fullpath:
+        # a smaller file can't be the same file, so don't bother reading either of them
+        same_size = candidates.sizes[new] == candidates.sizes[existing]
+        if same_size and candidates.get_hash(
+            new, self.file_cache, self.hash_algorithm
+        ) == candidates.get_hash(existing, self.file_cache, self.hash_algorithm):
+            if candidates.in_destination[new]:
                 return True, "hash matches, keep in situ destination file"
             else:
                 return False, "hash matches"
 
         # file size is the same, contents are different, but existing has older modified stamp
         # if one of the comparison files is in the output path already, then take it - to reduce IO (assuming they're on different volumes)
-        if new.destination_root in new.source_fullpath:
+        if candidates.in_destination[new]:
             return True, "default, keep in situ destination file"
         else:
             return False, "default"
 
-    def decide(self) -> None:
-        files_complete = 0
+    def hashes_needed(self, destination_ids: list = None) -> list:
+        # who wins a contest never depends on the hash - only the reason given does - so every contest can be played
+        # out on sizes, dates and in_destination alone to find the ids that are going to tie and need hashing
+        if self.decide_engine == "vector":
+            return vectordecide.hashes_needed(self, destination_ids)
+
+        candidates = self.candidates
+        needed = set()
+        for contenders in self._contenders(destination_ids):
+            best_option = contenders[0]
+            for image_id in contenders[1:]:
+                if (
+                    candidates.sizes[image_id] > candidates.sizes[best_option]
+                    or candidates.dates[image_id] < candidates.dates[best_option]
+                ):
+                    best_option = image_id
+                    continue
+
+                if candidates.sizes[image_id] == candidates.sizes[best_option]:
+                    needed.add(image_id)
+                    needed.add(best_option)
+                if candidates.in_destination[image_id]:
+                    best_option = image_id
+
+        return list(needed)
+
+    def prefetch_hashes(
+        self, image_ids: list, hash_engine: hashengine.HashEngine
+    ) -> None:
+        # hash everything in one go across the pool, rather than one file at a time in the middle of decide()
+        # anything the cache already knows doesn't need reading at all
+        candidates = self.candidates
+        files = []
+        for image_id in image_ids:
+            if candidates.hashes[image_id] != None:
+                continue
+            source_fullpath = candidates.images[image_id].source_fullpath
+            if self.file_cache != None:
+                file_hash = self.file_cache.get_hash(
+                    source_fullpath, algorithm=self.hash_algorithm
+                )
+                if file_hash != None:
+                    candidates.images[image_id].file_hash = file_hash
+                    candidates.hashes[image_id] = file_hash
+                    continue
+            files.append((source_fullpath, hashengine.device_of(source_fullpath)))
+
+        # anything that fails here just gets another go (and raises as it always did) when decide() gets to it
+        if len(files) > 0:
+            self.add_total("hashed", len(files))
+        hashed = 0
+        for source_fullpath, file_hash in hash_engine.hash_files(files):
+            image_id = candidates.id_of(source_fullpath)
+            candidates.images[image_id].file_hash = file_hash
+            candidates.hashes[image_id] = file_hash
+            if self.file_cache != None:
+                self.file_cache.set_hash(source_fullpath, file_hash)
+            hashed += 1
+            self.progress.add("hashed", bytes=candidates.sizes[image_id])
+
+        if hashed < len(files):
+            self.progress.add("hashed", files=0, errors=len(files) - hashed)
+        logger.debug(f"Prefetched {len(files)} hashes for {len(image_ids)} files")
+
+    def _contenders(self, destination_ids: list = None) -> Iterable[list]:
+        if destination_ids == None:
+            return self.candidates.contenders
+        return (
+            self.candidates.contenders[destination_id]
+            for destination_id in destination_ids
+        )
+
+    def decide(
+        self, hash_engine: hashengine.HashEngine = None, destination_ids: list = None
+    ) -> None:
+        # with a hash engine, every hash decide() is going to need gets worked out up front in parallel, so the
+        # decisions themselves only ever touch memory
+        # destination_ids decides just those destinations - import.py --pipeline does them as they fill up.  Content
+        # dedupe needs every winner at once, so it only happens when everything's decided together
+        if hash_engine != None:
+            self.prefetch_hashes(self.hashes_needed(destination_ids), hash_engine)
+
+        if destination_ids == None:
+            self.add_total("decided", len(self.candidates))
+        else:
+            self.add_total(
+                "decided",
+                sum(
+                    len(contenders) for contenders in self._contenders(destination_ids)
+                ),
+            )
+        if self.decide_engine == "vector":
+            vectordecide.decide(self, destination_ids)
+        else:
+            self.decide_loop(destination_ids)
+
+        if self.content_dedupe and destination_ids == None:
+            self.dedupe_content(hash_engine)
+
+        if self.file_cache != None:
+            self.file_cache.commit()
+
+    def decide_loop(self, destination_ids: list = None) -> None:
+        candidates = self.candidates
+        destinations_complete = 0
+        decided = 0
         # loop through the competitors for best destination_image
-        for destination_image in self.ImageObjects_by_destination:
-            files_complete += 1
+        for contenders in self._contenders(destination_ids):
+            destinations_complete += 1
+            decided += len(contenders)
 
             # need to work out which one is the best option
             # this just resets the holder per destination_image
             best_option = None
 
             # for each contender
-            for source_image in self.ImageObjects_by_destination[destination_image]:
+            for image_id in contenders:
                 # if there hasn't been another contender yet - something is better than nothing
                 if best_option == None:
-                    best_option = source_image
+                    best_option = image_id
                     logging.debug(
-                        f"there is no best_option, so {best_option} is the winner"
-                    )
-                    self.ImageObjects_by_source[best_option].set_winner(
-                        True, "uncontested"
+                        f"there is no best_option, so {candidates.images[best_option].source_fullpath} is the winner"
                     )
+                    candidates.set_winner(best_option, "uncontested")
 
                 else:
                     # there's something to compare against.  Pulled the logic out inot a separate method for ease of understanding and testing
-                    is_better, reason = self.is_better(
-                        self.ImageObjects_by_source[source_image],
-                        self.ImageObjects_by_source[best_option],
-                    )
+                    is_better, reason = self.is_better(image_id, best_option)
                     if is_better:
                         # this source is better than the previous best option
                         # first tell the old winner that it isn't any more
-                        self.ImageObjects_by_source[best_option].set_winner(
-                            False, reason
-                        )
+                        candidates.set_loser(best_option, reason)
 
                         logger.debug(
-                            f"best_option {best_option} is not better than contender {source_image} - replacing"
+                            f"best_option {candidates.images[best_option].source_fullpath} is not better than contender {candidates.images[image_id].source_fullpath} - replacing"
                         )
 
                         # now set best_option to the new winner
-                        best_option = source_image
+                        best_option = image_id
 
                         # last tell the new winner that its the winner
-                        self.ImageObjects_by_source[best_option].set_winner(
-                            True, reason
-                        )
+                        candidates.set_winner(best_option, reason)
 
                     else:
                         # this source is less good than the previous best option
                         # set the old best_option to no longer be the best option - ie. change it to delete isntead of winner
                         logger.debug(
-                            f"best_option {best_option} is better than contender {source_image}"
+                            f"best_option {candidates.images[best_option].source_fullpath} is better than contender {candidates.images[image_id].source_fullpath}"
                         )
 
-                        self.ImageObjects_by_source[source_image].set_winner(
-                            False, reason
-                        )
-            if files_complete % 200 == 0:
-                print(
-                    f"\rProcessing {len(self.ImageObjects_by_source)} decisions ({round(files_complete / len(self.ImageObjects_by_source) *100,1)}% complete)",
-                    end="\r",
+                        candidates.set_loser(image_id, reason)
+            if destinations_complete % 200 == 0:
+                self.progress.add("decided", files=decided)
+                decided = 0
+
+        self.progress.add("decided", files=decided)
+
+    def dedupe_content(self, hash_engine: hashengine.HashEngine = None) -> None:
+        # decide() only compares files fighting over the same destination, so the same photo under two different names
+        # ends up twice.  Group the winners by size first - only sizes that collide are worth hashing
+        candidates = self.candidates
+        winners_by_size = {}
+        for image_id in candidates.winners:
+            if image_id == candidatestore.NO_WINNER:
+                continue
+            file_size = candidates.sizes[image_id]
+            if file_size not in winners_by_size:
+                winners_by_size[file_size] = [image_id]
+            else:
+                winners_by_size[file_size].append(image_id)
+
+        if hash_engine != None:
+            self.prefetch_hashes(
+                [
+                    image_id
+                    for same_size in winners_by_size.values()
+                    if len(same_size) > 1
+                    for image_id in same_size
+                ],
+                hash_engine,
+            )
+
+        duplicates_removed = 0
+        for file_size in winners_by_size:
+            if len(winners_by_size[file_size]) < 2:
+                continue
+
+            winners_by_hash = {}
+            for image_id in winners_by_size[file_size]:
+                file_hash = candidates.get_hash(
+                    image_id, self.file_cache, self.hash_algorithm
                 )
+                if file_hash not in winners_by_hash:
+                    winners_by_hash[file_hash] = [image_id]
+                else:
+                    winners_by_hash[file_hash].append(image_id)
+
+            for file_hash in winners_by_hash:
+                # the contest below can get as far as tag dates, so anything still stat-only needs its exif now
+                if len(winners_by_hash[file_hash]) > 1:
+                    self.load_metadata(
+                        [candidates.images[i] for i in winners_by_hash[file_hash]]
+                    )
+
+                # same bytes, so run them through the same rules as a normal contest to pick which copy stays
+                best_option = None
+                for image_id in winners_by_hash[file_hash]:
+                    if best_option == None:
+                        best_option = image_id
+                        continue
+
+                    is_better, reason = self.is_better(image_id, best_option)
+                    if is_better:
+                        candidates.set_loser(
+                            best_option,
+                            f"content duplicate of {candidates.images[image_id].destination_fullpath} ({reason})",
+                        )
+                        best_option = image_id
+                    else:
+                        candidates.set_loser(
+                            image_id,
+                            f"content duplicate of {candidates.images[best_option].destination_fullpath} ({reason})",
+                        )
+                    duplicates_removed += 1
 
-        print(
-            f"\rProcessed {len(self.ImageObjects_by_source)} decisions (100% complete)         ",
+        logger.debug(
+            f"Content dedupe removed {duplicates_removed} duplicates across destinations"
         )
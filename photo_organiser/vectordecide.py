@@ -0,0 +1,146 @@
+import logging
+import itertools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = logging.getLogger("vectordecide")
+logger.setLevel(logging.WARN)
+
+# what is_better() says, keyed on how the comparison was settled - the hash only ever changes the wording
+REASON_SIZE = "file size is larger"
+REASON_DATE = "tag date is older"
+REASON_HASH = {
+    True: "hash matches, keep in situ destination file",
+    False: "hash matches",
+}
+REASON_DEFAULT = {
+    True: "default, keep in situ destination file",
+    False: "default",
+}
+
+
+def available() -> bool:
+    return numpy != None
+
+
+def _first_contenders(candidates, destination_ids: list = None) -> tuple:
+    # ids are handed out in the order images were added, so a stable sort by destination puts each destination's
+    # contenders together in the same order the loop would see them
+    if destination_ids == None:
+        destination_of = numpy.frombuffer(candidates.destination_of, dtype=numpy.int64)
+        order = numpy.argsort(destination_of, kind="stable")
+        counts = numpy.bincount(
+            destination_of, minlength=len(candidates.destination_paths)
+        )
+    else:
+        # just some of them - their contender lists are already in that order, so they only need joining up
+        contenders = [candidates.contenders[d] for d in destination_ids]
+        counts = numpy.array([len(c) for c in contenders], dtype=numpy.int64)
+        order = numpy.fromiter(
+            itertools.chain.from_iterable(contenders),
+            dtype=numpy.int64,
+            count=int(counts.sum()),
+        )
+    starts = numpy.concatenate(([0], numpy.cumsum(counts)[:-1]))
+
+    # round 0 - something is better than nothing
+    best = order[starts]
+    return order, counts, starts, best
+
+
+def _rounds(candidates, order, counts, starts, best):
+    # yields (new, existing, size_wins, date_wins, tied, new_wins) for each round, and moves best on to whoever won
+    # is_better() comes down to: bigger wins, else older wins, else whichever is already in the destination wins.
+    # The hash only decides the reason it gives, so who wins never depends on it - and files of different sizes can't
+    # have the same hash, so only the same size counts as tied
+    sizes = numpy.frombuffer(candidates.sizes, dtype=numpy.int64)
+    dates = numpy.frombuffer(candidates.dates, dtype=numpy.int64)
+    in_destination = numpy.frombuffer(candidates.in_destination, dtype=numpy.int8) != 0
+
+    for contest_round in range(1, int(counts.max())):
+        contested = numpy.nonzero(counts > contest_round)[0]
+        new = order[starts[contested] + contest_round]
+        existing = best[contested]
+
+        size_wins = sizes[new] > sizes[existing]
+        date_wins = ~size_wins & (dates[new] < dates[existing])
+        undecided = ~size_wins & ~date_wins
+        tied = undecided & (sizes[new] == sizes[existing])
+        new_wins = size_wins | date_wins | (undecided & in_destination[new])
+
+        yield new, existing, size_wins, date_wins, tied, new_wins
+
+        best[contested] = numpy.where(new_wins, new, existing)
+        logger.debug(
+            f"Round {contest_round}: {len(contested)} contests, {int(tied.sum())} needed a hash"
+        )
+
+
+def hashes_needed(machine, destination_ids: list = None) -> list:
+    # every id decide() will hash - both sides of every contest that's the same size and isn't settled by date
+    candidates = machine.candidates
+    if len(candidates) == 0 or destination_ids == []:
+        return []
+
+    needed = [numpy.zeros(0, dtype=numpy.int64)]
+    order, counts, starts, best = _first_contenders(candidates, destination_ids)
+    for new, existing, size_wins, date_wins, tied, new_wins in _rounds(
+        candidates, order, counts, starts, best
+    ):
+        needed.append(new[tied])
+        needed.append(existing[tied])
+
+    return numpy.unique(numpy.concatenate(needed)).tolist()
+
+
+def decide(machine, destination_ids: list = None) -> None:
+    # same answers as PhotoMachine.decide()'s loop, a round at a time instead of a destination at a time
+    # the loop compares each contender against whoever is winning so far.  Round r does that for contender r of every
+    # destination at once - there's only ever one comparison per destination per round, so nothing collides, and
+    # the number of rounds is the size of the biggest contest (normally 2 or 3) rather than the number of files
+    # destination_ids limits it to just those destinations - everything else is left as it is
+    candidates = machine.candidates
+    if len(candidates) == 0 or destination_ids == []:
+        return
+
+    in_destination = numpy.frombuffer(candidates.in_destination, dtype=numpy.int8) != 0
+    order, counts, starts, best = _first_contenders(candidates, destination_ids)
+    for image_id in best.tolist():
+        candidates.images[image_id].set_winner(True, "uncontested")
+    machine.progress.add("decided", files=len(best))
+
+    for new, existing, size_wins, date_wins, tied, new_wins in _rounds(
+        candidates, order, counts, starts, best
+    ):
+        for n, e, by_size, by_date, same_size, won, keep_in_situ in zip(
+            new.tolist(),
+            existing.tolist(),
+            size_wins.tolist(),
+            date_wins.tolist(),
+            tied.tolist(),
+            new_wins.tolist(),
+            in_destination[new].tolist(),
+        ):
+            if by_size:
+                reason = REASON_SIZE
+            elif by_date:
+                reason = REASON_DATE
+            elif same_size and candidates.get_hash(
+                n, machine.file_cache, machine.hash_algorithm
+            ) == candidates.get_hash(e, machine.file_cache, machine.hash_algorithm):
+                reason = REASON_HASH[keep_in_situ]
+            else:
+                reason = REASON_DEFAULT[keep_in_situ]
+
+            if won:
+                candidates.images[e].set_winner(False, reason)
+                candidates.images[n].set_winner(True, reason)
+            else:
+                candidates.images[n].set_winner(False, reason)
+
+        machine.progress.add("decided", files=len(new))
+
+    candidates.set_winners(best.tolist(), destination_ids)
@@ -0,0 +1,167 @@
+import logging
+import os
+import queue
+import threading
+from typing import Callable
+
+logger = logging.getLogger("walker")
+logger.setLevel(logging.WARN)
+
+# the file types we care about - everything else ends up in the ignored list
+EXTENSIONS = [".mov", ".jpg", ".heic", ".mp4", ".png", ".jpeg", ".3gp", ".avi", ".jpe"]
+
+DEFAULT_WALKERS = 4
+DEFAULT_BATCH_SIZE = 400
+
+
+class TreeWalker:
+    # walks a tree with several threads pulling directories off a shared queue, so a slow NAS or USB drive in one
+    # part of the tree doesn't hold up the rest.  No recursion, so it doesn't care how deep the tree goes
+    # scandir drops the GIL while it waits on the filesystem, which is all the walk really does - threads are plenty
+    ext: list
+    workers: int
+    batch_size: int
+    subfolders: list
+    ignored: list
+    errors: list
+    already_decided: int
+
+    def __init__(
+        self,
+        ext: list = EXTENSIONS,
+        workers: int = DEFAULT_WALKERS,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        state=None,
+    ):
+        self.ext = ext
+        self.workers = workers
+        self.batch_size = batch_size
+        self.subfolders = []
+        self.ignored = []
+        self.errors = []
+        self.already_decided = 0
+
+        # an incremental.IncrementalState - if there is one, directories that haven't changed since the last run
+        # don't get listed again, and files that were already decided on don't get sent on
+        self.state = state
+
+        self._directories = queue.Queue()
+        self._seen_links = set()
+        self._root_real = None
+        self._lock = threading.Lock()
+
+    def walk(self, root: str, on_batch: Callable[[list], None]) -> None:
+        # on_batch gets called from the walker threads with lists of at most batch_size files, as soon as they're found
+        self._root_real = os.path.join(os.path.realpath(root), "")
+        self._directories.put(root)
+
+        threads = [
+            threading.Thread(target=self._worker, args=(on_batch,), daemon=True)
+            for i in range(self.workers)
+        ]
+        for t in threads:
+            t.start()
+
+        # every directory gets a task_done() once it has been scanned, so this returns once the whole tree is done
+        self._directories.join()
+
+        # poison pills
+        for t in threads:
+            self._directories.put(None)
+        for t in threads:
+            t.join()
+
+    def _worker(self, on_batch: Callable[[list], None]) -> None:
+        batch = []
+        while True:
+            try:
+                next_dir = self._directories.get_nowait()
+            except queue.Empty:
+                # nothing else to do right now, so don't sit on what we've got - send it on before waiting
+                if len(batch) > 0:
+                    on_batch(batch)
+                    batch = []
+                next_dir = self._directories.get()
+
+            if next_dir is None:
+                # poison pill means shutdown
+                if len(batch) > 0:
+                    on_batch(batch)
+                break
+
+            try:
+                batch = self._scan(next_dir, batch, on_batch)
+            finally:
+                self._directories.task_done()
+
+    def _scan(self, this_dir: str, batch: list, on_batch) -> list:
+        mtime_ns = None
+        if self.state != None:
+            mtime_ns, subdirs, files = self.state.lookup(this_dir)
+            if subdirs != None:
+                # same as last time - no need to list it
+                for name in subdirs:
+                    self.subfolders.append(os.path.join(this_dir, name))
+                    self._directories.put(os.path.join(this_dir, name))
+                for name in files:
+                    batch = self._add_file(
+                        os.path.join(this_dir, name), name, batch, on_batch
+                    )
+                return batch
+
+        try:
+            entries = list(os.scandir(this_dir))
+        except OSError as e:
+            logger.warning(f"{this_dir}: Failed to scan due to {str(e)}")
+            self.errors.append(this_dir)
+            return batch
+
+        subdirs = []
+        files = []
+        for f in entries:
+            try:
+                if f.is_dir():
+                    if f.is_symlink() and not self._first_visit(f.path):
+                        # points somewhere we're already walking (or a loop) - don't do it twice
+                        continue
+                    subdirs.append(f.name)
+                    self.subfolders.append(f.path)
+                    self._directories.put(f.path)
+                elif f.is_file():
+                    files.append(f.name)
+                    batch = self._add_file(f.path, f.name, batch, on_batch)
+            except OSError as e:
+                logger.warning(f"{f.path}: Failed to stat due to {str(e)}")
+                self.errors.append(f.path)
+
+        if self.state != None:
+            self.state.record(this_dir, mtime_ns, subdirs, files)
+
+        return batch
+
+    def _add_file(self, file_fullpath: str, name: str, batch: list, on_batch) -> list:
+        if os.path.splitext(name)[1].lower() not in self.ext:
+            logger.debug(f"{file_fullpath} ignored due to filetype")
+            self.ignored.append(file_fullpath)
+            return batch
+
+        if self.state != None and not self.state.is_new(file_fullpath):
+            self.already_decided += 1
+            return batch
+
+        batch.append(file_fullpath)
+        if len(batch) == self.batch_size:
+            on_batch(batch)
+            batch = []
+        return batch
+
+    def _first_visit(self, link_path: str) -> bool:
+        real_path = os.path.join(os.path.realpath(link_path), "")
+        if real_path.startswith(self._root_real):
+            return False
+
+        with self._lock:
+            if real_path in self._seen_links:
+                return False
+            self._seen_links.add(real_path)
+            return True
@@ -0,0 +1,170 @@
+import logging
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+logger = logging.getLogger("watcher")
+logger.setLevel(logging.WARN)
+
+# how long the input has to go quiet before a pass starts - a phone sync drops files in over a few seconds, and it's
+# better to pick them all up in one pass than start a pass per file
+DEFAULT_SETTLE_SECONDS = 5
+DEFAULT_POLL_SECONDS = 10
+
+# from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len - then len bytes of name
+
+
+class InotifyWatcher:
+    # asks the kernel to tell us when something lands anywhere under root, rather than walking the tree to find out
+    # inotify only watches one directory per watch, so every directory gets one - and new ones get added as they appear
+    root: str
+    watches: dict
+
+    def __init__(self, root: str):
+        self.root = root
+        self.watches = {}
+
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        try:
+            for dir_fullpath, subdirs, files in os.walk(root):
+                self._add_watch(dir_fullpath)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _add_watch(self, dir_fullpath: str) -> None:
+        wd = self._libc.inotify_add_watch(
+            self._fd, os.fsencode(dir_fullpath), WATCH_MASK
+        )
+        if wd < 0:
+            # ENOSPC here means fs.inotify.max_user_watches is too low for this tree
+            raise OSError(
+                ctypes.get_errno(), f"{dir_fullpath}: inotify_add_watch failed"
+            )
+        self.watches[wd] = dir_fullpath
+
+    def _read_events(self) -> int:
+        # returns how many events were waiting, and starts watching any new directories they mention
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return 0
+
+        events = 0
+        position = 0
+        while position + EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, name_length = EVENT_HEADER.unpack_from(data, position)
+            position += EVENT_HEADER.size
+            name = data[position : position + name_length].rstrip(b"\0")
+            position += name_length
+            events += 1
+
+            if mask & IN_Q_OVERFLOW:
+                logger.warning(
+                    f"inotify queue overflowed - the next pass will catch up"
+                )
+            elif mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            elif mask & IN_ISDIR and wd in self.watches:
+                new_dir = os.path.join(self.watches[wd], os.fsdecode(name))
+                try:
+                    self._add_watch(new_dir)
+                except OSError as e:
+                    logger.warning(f"{new_dir}: Failed to watch due to {str(e)}")
+
+        return events
+
+    def wait_for_changes(self, settle_seconds: float = DEFAULT_SETTLE_SECONDS) -> None:
+        # blocks until something lands, then until nothing else has landed for settle_seconds
+        while True:
+            select.select([self._fd], [], [])
+            if self._read_events() > 0:
+                break
+
+        while True:
+            readable, w, x = select.select([self._fd], [], [], settle_seconds)
+            if len(readable) == 0:
+                return
+            self._read_events()
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher:
+    # for anywhere inotify isn't - checks every directory's mtime every poll_seconds
+    # a new file changes the mtime of the directory it lands in, so directories are all that need looking at
+    root: str
+    poll_seconds: float
+    snapshot: dict
+
+    def __init__(self, root: str, poll_seconds: float = DEFAULT_POLL_SECONDS):
+        self.root = root
+        self.poll_seconds = poll_seconds
+        self.snapshot = self._snapshot()
+
+    def _snapshot(self) -> dict:
+        snapshot = {}
+        directories = [self.root]
+        while len(directories) > 0:
+            this_dir = directories.pop()
+            try:
+                snapshot[this_dir] = os.stat(this_dir).st_mtime_ns
+                for f in os.scandir(this_dir):
+                    if f.is_dir(follow_symlinks=False):
+                        directories.append(f.path)
+            except OSError:
+                continue
+        return snapshot
+
+    def wait_for_changes(self, settle_seconds: float = DEFAULT_SETTLE_SECONDS) -> None:
+        while True:
+            time.sleep(self.poll_seconds)
+            latest = self._snapshot()
+            if latest != self.snapshot:
+                self.snapshot = latest
+                break
+
+        while True:
+            time.sleep(settle_seconds)
+            latest = self._snapshot()
+            if latest == self.snapshot:
+                return
+            self.snapshot = latest
+
+    def close(self) -> None:
+        pass
+
+
+def make_watcher(root: str):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            # AttributeError is a libc without inotify in it
+            logger.warning(
+                f"{root}: Can't use inotify due to {str(e)}, falling back to polling"
+            )
+
+    return PollingWatcher(root)
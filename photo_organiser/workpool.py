@@ -0,0 +1,123 @@
+import logging
+import os
+import collections
+from concurrent import futures
+from typing import Iterable, Iterator, Tuple
+
+logger = logging.getLogger("workpool")
+logger.setLevel(logging.WARN)
+
+DEFAULT_IO_CONCURRENCY = 2
+
+
+def default_workers() -> int:
+    return os.cpu_count() or 4
+
+
+class DevicePool:
+    # runs jobs on a thread or process pool, but never lets more than io_concurrency jobs touch the same device at once
+    # the gating all happens in the calling thread before anything is submitted, so worker threads/processes never sit
+    # blocked waiting on a busy disk while another disk has work queued up
+    workers: int
+    io_concurrency: dict
+    use_processes: bool
+
+    def __init__(
+        self,
+        workers: int = None,
+        io_concurrency=DEFAULT_IO_CONCURRENCY,
+        use_processes: bool = False,
+    ):
+        if workers == None:
+            workers = default_workers()
+        self.workers = workers
+
+        # either one limit for every device, or a dict of limits keyed on the device role - eg. {"src": 2, "dst": 1}
+        if isinstance(io_concurrency, dict):
+            self.io_concurrency = io_concurrency
+        else:
+            self.io_concurrency = {None: io_concurrency}
+
+        self.use_processes = use_processes
+        if use_processes:
+            self.executor = futures.ProcessPoolExecutor(max_workers=workers)
+        else:
+            self.executor = futures.ThreadPoolExecutor(max_workers=workers)
+
+    def limit_for(self, device) -> int:
+        # devices are (role, st_dev) tuples
+        role = device[0] if isinstance(device, tuple) else None
+        if role in self.io_concurrency:
+            return self.io_concurrency[role]
+        return self.io_concurrency.get(None, DEFAULT_IO_CONCURRENCY)
+
+    def imap_unordered(self, func, jobs: Iterable[Tuple]) -> Iterator[Tuple]:
+        # jobs are (tag, devices, args) - tag comes back out with the result, devices is a tuple of every device the job touches
+        # yields (tag, result, error) in whatever order they finish
+        jobs = iter(jobs)
+        exhausted = False
+
+        # only read this far ahead of what's running, so a huge job list doesn't all end up in memory
+        lookahead = max(self.workers * 64, 1024)
+        max_in_flight = self.workers * 2
+
+        queues = collections.OrderedDict()
+        buffered = 0
+        device_in_flight = collections.Counter()
+        in_flight = {}
+
+        while True:
+            while not exhausted and buffered < lookahead:
+                try:
+                    tag, devices, args = next(jobs)
+                except StopIteration:
+                    exhausted = True
+                    break
+                devices = tuple(devices)
+                if devices not in queues:
+                    queues[devices] = collections.deque()
+                queues[devices].append((tag, args))
+                buffered += 1
+
+            # hand out work device by device, rotating so one busy disk doesn't get first dibs every time
+            for devices in list(queues.keys()):
+                queue = queues[devices]
+                submitted = False
+                while (
+                    len(queue) > 0
+                    and len(in_flight) < max_in_flight
+                    and all(device_in_flight[d] < self.limit_for(d) for d in devices)
+                ):
+                    tag, args = queue.popleft()
+                    buffered -= 1
+                    future = self.executor.submit(func, *args)
+                    in_flight[future] = (tag, devices)
+                    for d in devices:
+                        device_in_flight[d] += 1
+                    submitted = True
+
+                if len(queue) == 0:
+                    del queues[devices]
+                elif submitted:
+                    queues.move_to_end(devices)
+
+            if len(in_flight) == 0:
+                if exhausted and buffered == 0:
+                    break
+                continue
+
+            done, not_done = futures.wait(
+                in_flight.keys(), return_when=futures.FIRST_COMPLETED
+            )
+            for future in done:
+                tag, devices = in_flight.pop(future)
+                for d in devices:
+                    device_in_flight[d] -= 1
+
+                try:
+                    yield tag, future.result(), None
+                except Exception as e:
+                    yield tag, None, e
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
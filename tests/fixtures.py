@@ -0,0 +1,102 @@
+# builds just enough of a JPEG/HEIC/MP4/MOV header for nativemeta to read a date out of - shared by the tests and the
+# benchmarks' synthetic libraries
+import datetime
+import struct
+
+# stand-in for the image/movie data, so the headers aren't the whole file
+MDAT_SIZE = 262144
+
+
+def box(box_type: bytes, content: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(content), box_type) + content
+
+
+def make_jpeg(date: str, byte_order: str = "<") -> bytes:
+    jfif = b"JFIF\0\x01\x01\0\0\x01\0\x01\0\0"
+    exif = b"Exif\0\0" + tiff_with_dates(date, date, byte_order)
+    return (
+        b"\xff\xd8"
+        + b"\xff\xe0"
+        + struct.pack(">H", len(jfif) + 2)
+        + jfif
+        + b"\xff\xe1"
+        + struct.pack(">H", len(exif) + 2)
+        + exif
+        + b"\xff\xda\0\x08\x01\x01\0\0\x3f\0"
+        + bytes(MDAT_SIZE)
+        + b"\xff\xd9"
+    )
+
+
+def make_quicktime(brand: bytes, date: str, mvhd_version: int = 0) -> bytes:
+    # moov after mdat, the way most cameras write it.  A version 1 mvhd has 8 byte dates, which is what gets a movie
+    # past 2040
+    created = (
+        int(
+            (
+                datetime.datetime.strptime(date, "%Y:%m:%d %H:%M:%S")
+                - datetime.datetime(1904, 1, 1)
+            ).total_seconds()
+        )
+        if date != None
+        else 0
+    )
+    if mvhd_version == 1:
+        mvhd = struct.pack(">B3xQQIQ", 1, created, created, 600, 6000) + bytes(80)
+    else:
+        mvhd = struct.pack(">B3xIIII", 0, created, created, 600, 6000) + bytes(80)
+    return (
+        box(b"ftyp", brand + struct.pack(">I", 0) + brand)
+        + box(b"mdat", bytes(MDAT_SIZE))
+        + box(b"moov", box(b"mvhd", mvhd))
+    )
+
+
+def make_heic(date: str, iloc_version: int = 0) -> bytes:
+    exif = struct.pack(">I", 6) + b"Exif\0\0" + tiff_with_dates(date, date)
+    ftyp = box(b"ftyp", b"heic" + struct.pack(">I", 0) + b"mif1heic")
+    hdlr = box(b"hdlr", bytes(8) + b"pict" + bytes(13))
+    infe_image = box(b"infe", struct.pack(">BxxxHH4s", 2, 1, 0, b"hvc1") + b"\0")
+    infe_exif = box(b"infe", struct.pack(">BxxxHH4s", 2, 2, 0, b"Exif") + b"\0")
+    iinf = box(b"iinf", struct.pack(">BxxxH", 0, 2) + infe_image + infe_exif)
+
+    def iloc(exif_offset: int) -> bytes:
+        # 4 byte offsets and lengths, no base offset or index.  Version 1 adds a construction method to each item, and
+        # version 2 makes the item count and ids 4 bytes as well
+        id_format = ">H" if iloc_version < 2 else ">I"
+        content = struct.pack(">BxxxBB", iloc_version, 0x44, 0x00)
+        content += struct.pack(id_format, 2)
+        for item_id, offset, length in [(1, 0, 0), (2, exif_offset, len(exif))]:
+            content += struct.pack(id_format, item_id)
+            if iloc_version in (1, 2):
+                content += struct.pack(">H", 0)
+            content += struct.pack(">HHII", 0, 1, offset, length)
+        return box(b"iloc", content)
+
+    # the iloc box is the same size whatever goes in it, so work out where mdat lands with a dummy first
+    meta_size = len(box(b"meta", bytes(4) + hdlr + iinf + iloc(0)))
+    exif_offset = len(ftyp) + meta_size + 8
+    meta = box(b"meta", bytes(4) + hdlr + iinf + iloc(exif_offset))
+    return ftyp + meta + box(b"mdat", exif + bytes(MDAT_SIZE))
+
+
+def tiff_with_dates(
+    date_original: str, create_date: str, byte_order: str = "<"
+) -> bytes:
+    # IFD0 with just a pointer to the EXIF IFD, which has the two dates.  Little endian like most cameras write, or
+    # byte_order ">" for big endian
+    ifd0_offset = 8
+    exif_ifd_offset = ifd0_offset + 2 + 12 + 4
+    dates_offset = exif_ifd_offset + 2 + 2 * 12 + 4
+    tiff = (b"II" if byte_order == "<" else b"MM") + struct.pack(
+        byte_order + "HI", 42, ifd0_offset
+    )
+    tiff += struct.pack(byte_order + "H", 1)
+    tiff += struct.pack(byte_order + "HHII", 0x8769, 4, 1, exif_ifd_offset)
+    tiff += struct.pack(byte_order + "I", 0)
+    tiff += struct.pack(byte_order + "H", 2)
+    tiff += struct.pack(byte_order + "HHII", 0x9003, 2, 20, dates_offset)
+    tiff += struct.pack(byte_order + "HHII", 0x9004, 2, 20, dates_offset + 20)
+    tiff += struct.pack(byte_order + "I", 0)
+    tiff += date_original.encode() + b"\0" + create_date.encode() + b"\0"
+    return tiff
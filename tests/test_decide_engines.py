@@ -0,0 +1,89 @@
+# PhotoMachine.decide_loop() and vectordecide.decide() have to come up with the same winner and the same reason for
+# every file - --decide only changes how fast it gets there.  Hashes come out of a dict rather than off a disk
+import random
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from photo_organiser import imagefile
+from photo_organiser import statemachine
+from photo_organiser import vectordecide
+
+
+class PresetHashImageFile(imagefile.ImageFile):
+    # notes down every file that gets hashed, so the engines can be checked against hashes_needed() too
+    preset_hashes = {}
+    hashed = set()
+
+    def get_hash(self, cache=None, algorithm=None) -> str:
+        PresetHashImageFile.hashed.add(self.source_fullpath)
+        self.file_hash = PresetHashImageFile.preset_hashes[self.source_fullpath]
+        return self.file_hash
+
+
+def make_machine(
+    destination_root: str, engine: str, count: int, seed: int
+) -> statemachine.PhotoMachine:
+    # about four files per name, a tenth of them already in the destination.  Sizes, dates and hashes are picked from
+    # small sets so plenty of contests get all the way down to the hash
+    rng = random.Random(seed)
+    # nothing here runs exiftool, so the machine doesn't need a real pool
+    machine = statemachine.PhotoMachine(
+        destination_root, decide_engine=engine, exif_pool=object()
+    )
+    names = max(1, count // 4)
+    for i in range(count):
+        name = f"IMG_{rng.randrange(names):06d}.JPG"
+        if rng.random() < 0.1:
+            source_fullpath = f"{destination_root}/2019/05/{name}"
+        else:
+            source_fullpath = f"e:/photos/camera {i % 20}/batch {i}/{name}"
+        metadata = {
+            "SourceFile": source_fullpath,
+            "File:MIMEType": "image/jpeg",
+            "File:FileSize": rng.choice([1000000, 1000000, 2000000]),
+            "File:FileModifyDate": "2019:05:30 10:11:12+10:00",
+            "EXIF:DateTimeOriginal": f"2019:05:{rng.randint(1, 3):02d} 09:08:07",
+        }
+        PresetHashImageFile.preset_hashes[source_fullpath] = f"hash{rng.randrange(3)}"
+        machine.candidates.add(
+            PresetHashImageFile(source_fullpath, destination_root, metadata)
+        )
+    return machine
+
+
+def decisions(machine: statemachine.PhotoMachine) -> tuple:
+    candidates = machine.candidates
+    return (
+        [(the_image.winner, the_image.reason) for the_image in candidates.images],
+        list(candidates.winners),
+    )
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_engines_agree(tmp_path, seed):
+    machine = make_machine(tmp_path.as_posix(), "loop", 2000, seed)
+    machine.decide_loop()
+    loop_decisions = decisions(machine)
+
+    # same store again - every file gets a fresh decision, so nothing carries over from the loop
+    for the_image in machine.candidates.images:
+        the_image.set_winner(False, None)
+    vectordecide.decide(machine)
+
+    assert decisions(machine) == loop_decisions
+
+
+@pytest.mark.parametrize("engine", ["loop", "vector"])
+def test_hashes_needed_is_what_decide_hashes(tmp_path, engine):
+    # import.py prefetches hashes_needed() - anything else decide() hashes would be read one file at a time
+    machine = make_machine(tmp_path.as_posix(), engine, 2000, 4)
+    needed = set(
+        machine.candidates.images[image_id].source_fullpath
+        for image_id in machine.hashes_needed()
+    )
+    PresetHashImageFile.hashed = set()
+    machine.decide()
+
+    assert len(needed) > 0
+    assert needed == PresetHashImageFile.hashed
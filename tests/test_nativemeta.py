@@ -0,0 +1,116 @@
+# nativemeta only gets to answer for a file if it's sure - anything mangled or unfamiliar has to end up with exiftool,
+# never with a wrong date or an exception out of split_native()
+import struct
+import pytest
+from photo_organiser import nativemeta
+from tests.fixtures import (
+    MDAT_SIZE,
+    box,
+    make_heic,
+    make_jpeg,
+    make_quicktime,
+    tiff_with_dates,
+)
+
+DATE = "2019:05:30 10:11:12"
+
+
+def write(tmp_path, name: str, content: bytes) -> str:
+    file_fullpath = (tmp_path / name).as_posix()
+    with open(file_fullpath, "wb") as f:
+        f.write(content)
+    return file_fullpath
+
+
+@pytest.mark.parametrize("byte_order", ["<", ">"])
+def test_tiff_dates(byte_order):
+    dates = nativemeta.read_tiff_dates(
+        "test.jpg", tiff_with_dates(DATE, "2019:05:31 01:02:03", byte_order)
+    )
+    assert dates == {
+        "EXIF:DateTimeOriginal": DATE,
+        "EXIF:CreateDate": "2019:05:31 01:02:03",
+    }
+
+
+@pytest.mark.parametrize("byte_order", ["<", ">"])
+def test_jpeg(tmp_path, byte_order):
+    file_fullpath = write(tmp_path, "IMG_0001.JPG", make_jpeg(DATE, byte_order))
+    metadata = nativemeta.read_metadata(file_fullpath)
+    assert metadata["File:MIMEType"] == "image/jpeg"
+    assert metadata["EXIF:DateTimeOriginal"] == DATE
+
+
+@pytest.mark.parametrize("iloc_version", [0, 1, 2])
+def test_heic(tmp_path, iloc_version):
+    file_fullpath = write(tmp_path, "IMG_0001.HEIC", make_heic(DATE, iloc_version))
+    metadata = nativemeta.read_metadata(file_fullpath)
+    assert metadata["File:MIMEType"] == "image/heic"
+    assert metadata["EXIF:DateTimeOriginal"] == DATE
+
+
+@pytest.mark.parametrize(
+    "mvhd_version, date",
+    [(0, DATE), (1, DATE), (1, "2045:01:02 03:04:05")],
+)
+def test_quicktime(tmp_path, mvhd_version, date):
+    file_fullpath = write(
+        tmp_path, "MVI_0001.MP4", make_quicktime(b"isom", date, mvhd_version)
+    )
+    metadata = nativemeta.read_metadata(file_fullpath)
+    assert metadata["File:MIMEType"] == "video/mp4"
+    assert metadata["QuickTime:CreateDate"] == date
+
+
+def test_quicktime_large_box(tmp_path):
+    # an mdat over 4GB says so with a size of 1 and the real size in the 8 bytes after the type
+    content = make_quicktime(b"isom", DATE)
+    ftyp_size = struct.unpack_from(">I", content)[0]
+    mdat = content[ftyp_size : ftyp_size + 8 + MDAT_SIZE]
+    large_mdat = struct.pack(">I4sQ", 1, b"mdat", 16 + MDAT_SIZE) + mdat[8:]
+    content = content[:ftyp_size] + large_mdat + content[ftyp_size + len(mdat) :]
+
+    file_fullpath = write(tmp_path, "MVI_0001.MOV", content)
+    assert nativemeta.read_metadata(file_fullpath)["QuickTime:CreateDate"] == DATE
+
+
+def test_tiff_pointing_past_the_end():
+    tiff = tiff_with_dates(DATE, DATE)
+    with pytest.raises(nativemeta.NativeMetadataUnsupported):
+        nativemeta.read_tiff_dates("test.jpg", tiff[:-10])
+    with pytest.raises(nativemeta.NativeMetadataUnsupported):
+        nativemeta.read_tiff_dates("test.jpg", tiff[:20])
+
+
+@pytest.mark.parametrize(
+    "name, content, dates_end",
+    [
+        # everything up to the end of the EXIF segment is needed - after that it's just image data
+        ("IMG_0001.JPG", make_jpeg(DATE), len(make_jpeg(DATE)) - MDAT_SIZE - 12),
+        ("IMG_0001.HEIC", make_heic(DATE), len(make_heic(DATE)) - MDAT_SIZE),
+        # moov is at the end, so any cut at all loses it
+        ("MVI_0001.MP4", make_quicktime(b"isom", DATE), None),
+    ],
+)
+def test_truncated_files_go_to_exiftool(tmp_path, name, content, dates_end):
+    if dates_end == None:
+        dates_end = len(content)
+    cuts = list(range(0, min(dates_end, 400))) + list(
+        range(400, dates_end, max(1, dates_end // 50))
+    )
+    for cut in cuts:
+        file_fullpath = write(tmp_path, name, content[:cut])
+        metadata, remaining = nativemeta.split_native([file_fullpath])
+        assert metadata == [] and remaining == [file_fullpath], f"cut at {cut}"
+
+
+def test_quicktime_without_a_date_goes_to_exiftool(tmp_path):
+    file_fullpath = write(tmp_path, "MVI_0001.MOV", make_quicktime(b"qt  ", None))
+    assert nativemeta.split_native([file_fullpath]) == ([], [file_fullpath])
+
+
+def test_vendor_box_goes_to_exiftool(tmp_path):
+    # a camera's own EXIF would beat the mvhd date in exiftool, so a file with one isn't ours to answer for
+    content = make_quicktime(b"isom", DATE) + box(b"uuid", bytes(16))
+    file_fullpath = write(tmp_path, "MVI_0001.MP4", content)
+    assert nativemeta.split_native([file_fullpath]) == ([], [file_fullpath])